@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining a headless batch envisionment of many models, without any rendering.
+"""
+
+# STD
+import argparse
+import json
+import os
+import sys
+import time
+
+# PROJECT
+from export import FORMATS
+from generator import TOPOLOGIES, build_state_graph
+from graph import init_extra_points_state_graph, init_minimum_viable_state_graph
+
+# CONST
+ENGINES = ("object", "packed", "vectorized")
+
+
+def build_from_spec(spec, engine="packed"):
+    """
+    Build the StateGraph of a model described by a short spec: "minimal" or "extra" for the hand-written models,
+    "<topology>:<containers>[:<taps>]" (like "chain:3" or "parallel:4:2") for generated ones.
+    """
+    if spec in ("minimal", "extra"):
+        state_graph = init_minimum_viable_state_graph() if spec == "minimal" else init_extra_points_state_graph()
+        state_graph.engine = engine
+        return state_graph
+
+    parts = spec.split(":")
+    assert parts[0] in TOPOLOGIES and len(parts) in (2, 3), "Invalid model spec {}".format(spec)
+    num_taps = int(parts[2]) if len(parts) == 3 else 1
+
+    return build_state_graph(num_taps, int(parts[1]), topology=parts[0], engine=engine)
+
+
+def envision_spec(spec, engine="packed", export_directory=None, format="npz"):
+    """
+    Envision a single model into a GraphStore and optionally export it. Returns a summary of the envisionment.
+    """
+    start = time.perf_counter()
+    state_graph = build_from_spec(spec, engine=engine)
+    store = state_graph.graph_store()
+    summary = {
+        "model": spec, "engine": engine, "num_states": store.num_states, "num_transitions": store.num_transitions,
+        "terminal_states": len(store.terminal_states()), "seconds": time.perf_counter() - start
+    }
+
+    if export_directory is not None:
+        path = os.path.join(export_directory, "{}.{}".format(spec.replace(":", "_"), format))
+        state_graph.export(path, format=format)
+        summary["export"] = path
+
+    return summary
+
+
+def _envision_spec(arguments):
+    return envision_spec(*arguments)
+
+
+def run_batch(specs, engine="packed", export_directory=None, format="npz", workers=None):
+    """
+    Envision all models, one per process if a number of workers is given. Yields the summaries in order of the specs.
+    """
+    arguments = [(spec, engine, export_directory, format) for spec in specs]
+
+    if workers is None:
+        yield from map(_envision_spec, arguments)
+        return
+
+    # Import here so multiprocessing is only loaded when distributing models
+    import multiprocessing
+
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap(_envision_spec, arguments)
+
+
+def _init_argparser():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "models", nargs="+",
+        help="Models to envision: minimal, extra or <topology>:<containers>[:<taps>] like chain:3."
+    )
+    argparser.add_argument(
+        "--engine", "-e", choices=ENGINES, default="packed",
+        help="Envisioning engine."
+    )
+    argparser.add_argument(
+        "--workers", "-w", type=int,
+        help="Number of processes envisioning models in parallel."
+    )
+    argparser.add_argument(
+        "--export", help="Directory the envisioned state graphs are exported to."
+    )
+    argparser.add_argument(
+        "--format", "-f", choices=FORMATS, default="npz",
+        help="Export format."
+    )
+    return argparser
+
+
+if __name__ == "__main__":
+    argparser = _init_argparser()
+    args = argparser.parse_args()
+
+    if args.export is not None:
+        os.makedirs(args.export, exist_ok=True)
+
+    for summary in run_batch(args.models, args.engine, args.export, args.format, args.workers):
+        print(json.dumps(summary))
+        sys.stdout.flush()
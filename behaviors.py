@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining the enumeration of behaviors, i.e. paths through an envisioned state graph.
+"""
+
+# STD
+import array
+import collections
+
+# PROJECT
+from encoding import SLOT_BITS, VALUE_BITS, VALUE_MASK
+from quantities import GLOBAL_INDICES
+
+# CONST
+CYCLE_POLICIES = (
+    "forbid",  # Every state occurs at most once on a path
+    "report",  # Paths running into a state already on the path are reported as cyclic behaviors and not extended
+    "repeat"   # Every state occurs at most max_visits times on a path
+)
+UNREACHABLE = -1
+
+# A behavior ends because it reached a target or terminal state, ran into a state already on the path ("cycle") or
+# exceeded the maximum length ("truncated")
+Behavior = collections.namedtuple("Behavior", ["states", "shared", "end"])
+
+
+def quantity_filter(encoding, magnitudes=None, derivatives=None):
+    """
+    Create a state filter for iter_behaviors() only accepting states in which the given quantities (like
+    "container.volume") have one of the given magnitudes / derivatives, e.g. magnitudes={"container.volume": ("+", )}.
+    """
+    constraints = []  # Bit offset of the value within a packed code and allowed global indices
+
+    for values, offset in ((magnitudes or {}, 0), (derivatives or {}, VALUE_BITS)):
+        for slot_name, allowed in values.items():
+            slot = encoding.slot(*slot_name.split("."))
+            constraints.append((slot * SLOT_BITS + offset, {GLOBAL_INDICES[value] for value in allowed}))
+
+    def state_filter(code):
+        return all((code >> shift) & VALUE_MASK in allowed for shift, allowed in constraints)
+
+    return state_filter
+
+
+def iter_behaviors(store, source=0, targets=None, max_length=None, cycles="report", max_visits=2, state_filter=None,
+                   include_truncated=False):
+    """
+    Enumerate behaviors in a GraphStore lazily by a depth-first search from the source state. Only the current path is
+    kept in memory (plus a few bytes per state), so behaviors can be streamed into a report one by one.
+
+    Behaviors end in one of the target states (given as state ids) or, without targets, in a terminal state. With the
+    "report" cycle policy, paths running back into themselves are reported as well, otherwise states that can not
+    reach an end within the remaining length are pruned before being visited. States rejected by the state filter (a
+    callable on packed codes, see quantity_filter()) are never visited. With include_truncated, paths exceeding
+    max_length are reported as well.
+
+    Yields Behavior tuples of the state ids along the path, the number of leading states shared with the previous
+    behavior (so a report only has to print the new suffix) and the reason the behavior ended.
+    """
+    assert cycles in CYCLE_POLICIES, "Unknown cycle policy"
+    assert cycles != "repeat" or max_visits > 0, "States have to be visited at least once"
+    num_states = store.num_states
+
+    allowed = bytearray(b"\1") * num_states
+    if state_filter is not None:
+        allowed = bytearray(1 if state_filter(code) else 0 for code in store.codes)
+
+    end_reasons = _end_reasons(store, targets)
+    distances = _distances_to_ends(store, end_reasons, allowed) if cycles != "report" else None
+
+    if not allowed[source] or (distances is not None and distances[source] == UNREACHABLE):
+        return
+
+    visits = bytearray(num_states)
+    path, iterators = [source], [iter(store.successors(source))]
+    visits[source] = 1
+    previous_path = ()
+    max_visits = 1 if cycles != "repeat" else max_visits
+
+    def behavior(states, end):
+        nonlocal previous_path
+        shared = 0
+        while shared < min(len(states), len(previous_path)) and states[shared] == previous_path[shared]:
+            shared += 1
+
+        previous_path = states
+        return Behavior(states=states, shared=shared, end=end)
+
+    if end_reasons[source] is not None:
+        yield behavior((source, ), end_reasons[source])
+        return
+
+    while len(iterators) > 0:
+        successor = next(iterators[-1], None)
+
+        if successor is None:
+            visits[path.pop()] -= 1
+            iterators.pop()
+            continue
+
+        if not allowed[successor]:
+            continue
+
+        length = len(path)  # Number of transitions after moving to the successor
+        if visits[successor] >= max_visits:
+            if cycles == "report":
+                yield behavior(tuple(path) + (successor, ), "cycle")
+            continue
+
+        if end_reasons[successor] is not None:
+            yield behavior(tuple(path) + (successor, ), end_reasons[successor])
+            continue
+
+        if distances is not None:
+            if distances[successor] == UNREACHABLE:
+                continue
+            remaining = distances[successor]
+        else:
+            remaining = 1  # At least one more transition is needed to end
+
+        if max_length is not None and length + remaining > max_length:
+            if include_truncated:
+                yield behavior(tuple(path) + (successor, ), "truncated")
+            continue
+
+        path.append(successor)
+        iterators.append(iter(store.successors(successor)))
+        visits[successor] += 1
+
+
+def _end_reasons(store, targets):
+    end_reasons = [None] * store.num_states
+
+    if targets is not None:
+        for state_id in targets:
+            end_reasons[state_id] = "target"
+    else:
+        for state_id in store.terminal_states():
+            end_reasons[state_id] = "terminal"
+
+    return end_reasons
+
+
+def _distances_to_ends(store, end_reasons, allowed):
+    """
+    Return the number of transitions from every state to the closest end along allowed states (UNREACHABLE if there is
+    none) by a breadth-first search on the reversed graph.
+    """
+    offsets, sources = store.reverse()
+    distances = array.array("i", [UNREACHABLE]) * store.num_states
+    queue = collections.deque()
+
+    for state_id, end in enumerate(end_reasons):
+        if end is not None and allowed[state_id]:
+            distances[state_id] = 0
+            queue.append(state_id)
+
+    while len(queue) > 0:
+        state_id = queue.popleft()
+
+        for source in sources[offsets[state_id]:offsets[state_id + 1]]:
+            if allowed[source] and distances[source] == UNREACHABLE:
+                distances[source] = distances[state_id] + 1
+                queue.append(source)
+
+    return distances
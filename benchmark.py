@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining a benchmark suite measuring how envisioning scales with the size of a model.
+"""
+
+# STD
+import argparse
+import collections
+import json
+import time
+import tracemalloc
+
+# PROJECT
+from generator import TOPOLOGIES, build_state_graph
+
+# CONST
+ENGINES = ("object", "packed", "vectorized")
+PIPELINE_STEPS = ("build", "compile", "envision", "materialize")
+
+BenchmarkResult = collections.namedtuple(
+    "BenchmarkResult",
+    ["engine", "num_taps", "num_containers", "topology", "num_states", "num_transitions", "step_times",
+     "states_per_second", "peak_memory"]
+)
+
+
+def _init_argparser():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "--sizes", "-s", type=int, nargs="+", default=[1, 2, 3, 4],
+        help="Numbers of containers of the benchmarked models."
+    )
+    argparser.add_argument(
+        "--taps", "-t", type=int, default=1,
+        help="Number of taps of the benchmarked models."
+    )
+    argparser.add_argument(
+        "--topology", choices=TOPOLOGIES, default="chain",
+        help="How the containers of the benchmarked models are connected."
+    )
+    argparser.add_argument(
+        "--engines", "-e", choices=ENGINES, nargs="+", default=["packed"],
+        help="Envisioning engines to benchmark."
+    )
+    argparser.add_argument(
+        "--object-limit", type=int, default=3,
+        help="Largest number of containers the (slow) object engine is benchmarked with."
+    )
+    argparser.add_argument(
+        "--no-memory", action="store_true",
+        help="Skip measuring the peak memory, which requires a second, slower run."
+    )
+    argparser.add_argument(
+        "--json", help="Path of a file the results are written to as JSON."
+    )
+    return argparser
+
+
+def run_benchmark(num_containers, num_taps=1, topology="chain", engine="packed", measure_memory=True):
+    """
+    Envision a synthetic model and measure the time of every pipeline step:
+        * build: Constructing entities, relationships and the state graph
+        * compile: Encoding and compiling the model into a rule program (packed engines only)
+        * envision: Finding all states and transitions
+        * materialize: Creating State objects from packed states (packed engines only)
+
+    The peak memory is measured in a separate run because tracing allocations slows down the pipeline considerably.
+    """
+    step_times, (num_states, num_transitions) = _run_pipeline(num_containers, num_taps, topology, engine)
+    peak_memory = None
+
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            _run_pipeline(num_containers, num_taps, topology, engine)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    total_time = sum(step_times.values())
+    return BenchmarkResult(
+        engine=engine, num_taps=num_taps, num_containers=num_containers, topology=topology, num_states=num_states,
+        num_transitions=num_transitions, step_times=step_times,
+        states_per_second=num_states / total_time if total_time > 0 else float("inf"), peak_memory=peak_memory
+    )
+
+
+def _run_pipeline(num_containers, num_taps, topology, engine):
+    step_times = collections.OrderedDict()
+
+    start = time.perf_counter()
+    state_graph = build_state_graph(num_taps, num_containers, topology, engine=engine)
+    step_times["build"] = time.perf_counter() - start
+
+    if engine == "object":
+        start = time.perf_counter()
+        states, transitions = state_graph.envision()
+        step_times["envision"] = time.perf_counter() - start
+
+    else:
+        start = time.perf_counter()
+        envisioner = state_graph.create_envisioner()
+        step_times["compile"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        codes, code_transitions = envisioner.envision(state_graph.initial_code)
+        step_times["envision"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        states, transitions = state_graph.materialize(codes, code_transitions)
+        step_times["materialize"] = time.perf_counter() - start
+
+    return step_times, (len(states), sum(len(ends) for ends in transitions.values()))
+
+
+def print_results(results):
+    print(
+        "{:<10} | {:>5} | {:>10} | {:>11} | {:>12} | {:>10} | {}".format(
+            "engine", "size", "states", "transitions", "states/sec", "peak MiB",
+            " | ".join("{:>11}".format(step + " s") for step in PIPELINE_STEPS)
+        )
+    )
+    print("-" * (83 + 14 * len(PIPELINE_STEPS)))
+
+    for result in results:
+        print(
+            "{:<10} | {:>5} | {:>10} | {:>11} | {:>12.1f} | {:>10} | {}".format(
+                result.engine, result.num_containers, result.num_states, result.num_transitions,
+                result.states_per_second,
+                "-" if result.peak_memory is None else "{:.2f}".format(result.peak_memory / 2 ** 20),
+                " | ".join(
+                    "{:>11}".format(
+                        "-" if step not in result.step_times else "{:.4f}".format(result.step_times[step])
+                    )
+                    for step in PIPELINE_STEPS
+                )
+            )
+        )
+
+
+if __name__ == "__main__":
+    argparser = _init_argparser()
+    args = argparser.parse_args()
+
+    results = []
+    for engine in args.engines:
+        for size in args.sizes:
+            if engine == "object" and size > args.object_limit:
+                continue
+
+            results.append(run_benchmark(size, args.taps, args.topology, engine, measure_memory=not args.no_memory))
+
+    print_results(results)
+
+    if args.json is not None:
+        with open(args.json, "w") as json_file:
+            json.dump([result._asdict() for result in results], json_file, indent=4)
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining envisionments bounded by resource budgets and exploring states in a chosen order.
+"""
+
+# STD
+import collections
+import heapq
+import itertools
+import os
+import sys
+import time
+
+# PROJECT
+from encoding import SLOT_BITS, VALUE_BITS, VALUE_MASK
+from quantities import GLOBAL_INDICES
+
+# CONST
+ORDERS = ("bfs", "dfs", "best")  # Breadth-first, depth-first and best-first by a priority of states
+MEMORY_CHECK_INTERVAL = 256  # Number of expansions between two checks of the memory usage
+
+# Result of a bounded envisionment: Packed codes of all discovered states in order of discovery, the transitions of
+# all expanded states, the codes of discovered states that were not expanded and the limit of the budget that stopped
+# the envisionment (None if the state graph is complete)
+PartialEnvisionment = collections.namedtuple(
+    "PartialEnvisionment", ["states", "transitions", "frontier", "exhausted"]
+)
+
+
+def memory_usage():
+    """
+    Return the resident memory of this process in bytes or None if it can not be determined on this platform. Falls
+    back to the peak resident memory where the current one is not available.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Given in kilobytes except for macOS
+
+
+class Budget:
+    """
+    Class bounding the cost of an envisionment by the number of discovered states, the depth (number of transitions
+    from the initial state) of expanded states, the wall time in seconds and the resident memory of the process in
+    bytes. Every limit is optional. Budgets are checked before every expansion, so a state is always expanded as a
+    whole and the number of states can exceed max_states by the successors of the last expanded state.
+    """
+    def __init__(self, max_states=None, max_depth=None, seconds=None, max_memory=None):
+        self.max_states = max_states
+        self.max_depth = max_depth
+        self.seconds = seconds
+        self.max_memory = max_memory
+        self._deadline = None
+
+    def start(self):
+        """
+        Start the clock of the budget, called at the beginning of an envisionment.
+        """
+        assert self.max_memory is None or memory_usage() is not None, "Memory usage can not be measured here"
+        self._deadline = time.monotonic() + self.seconds if self.seconds is not None else None
+
+    def exceeded(self, num_states, num_expanded):
+        """
+        Return the name of the exceeded limit or None if the envisionment can continue.
+        """
+        if self.max_states is not None and num_states >= self.max_states:
+            return "max_states"
+
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            return "seconds"
+
+        if self.max_memory is not None and num_expanded % MEMORY_CHECK_INTERVAL == 0 and \
+                memory_usage() >= self.max_memory:
+            return "max_memory"
+
+        return None
+
+
+def quantity_priority(encoding, magnitudes=None, derivatives=None):
+    """
+    Create a priority for best-first envisionments from scores of the values of quantities, e.g.
+    magnitudes={"container.volume": {"max": 0, "+": 1, "0": 2}}. The priority of a state is the sum of the scores of its
+    values (missing values score 0), states with the lowest priority are expanded first.
+    """
+    scores = []  # Bit offset of the value within a packed code and score of every global index
+
+    for values, offset in ((magnitudes or {}, 0), (derivatives or {}, VALUE_BITS)):
+        for slot_name, value_scores in values.items():
+            slot = encoding.slot(*slot_name.split("."))
+            slot_scores = [0] * (VALUE_MASK + 1)
+            for value, score in value_scores.items():
+                slot_scores[GLOBAL_INDICES[value]] = score
+            scores.append((slot * SLOT_BITS + offset, slot_scores))
+
+    def priority(code):
+        return sum(slot_scores[(code >> shift) & VALUE_MASK] for shift, slot_scores in scores)
+
+    return priority
+
+
+class BudgetedEnvisioner:
+    """
+    Class performing the search of another envisioner (using its successors()) in breadth-first, depth-first or
+    best-first order until the state graph is complete or the budget is exhausted. Best-first search expands the state
+    with the lowest priority (a callable on packed codes, see quantity_priority()) first.
+
+    States beyond max_depth and states left in the open list when the budget is exhausted are returned as frontier.
+    With max_depth, depths are shortest distances from the initial state: If a depth-first or best-first search finds a
+    shorter path to a state, the improvement is passed on to its successors, so the same states are cut in every order.
+    """
+    def __init__(self, envisioner, budget=None, order="bfs", priority=None):
+        assert order in ORDERS, "Unknown exploration order, use one of {}".format(", ".join(ORDERS))
+        assert order != "best" or priority is not None, "Best-first search requires a priority"
+        self.envisioner = envisioner
+        self.program = envisioner.program
+        self.encoding = envisioner.encoding
+        self.budget = budget if budget is not None else Budget()
+        self.order = order
+        self.priority = priority
+
+    def envision(self, initial_code):
+        """
+        Search the state graph from the initial state. Returns a PartialEnvisionment.
+        """
+        if hasattr(self.envisioner, "canonicalize"):  # Start from the representative under symmetry reduction
+            initial_code = self.envisioner.canonicalize(initial_code)[0]
+
+        budget, max_depth = self.budget, self.budget.max_depth
+        states, depths = [initial_code], {initial_code: 0}
+        transitions = collections.defaultdict(list)
+        expanded = set()
+        push, pop, open_list = self._open_list()
+        push(initial_code, 0)
+        exhausted = None
+        budget.start()
+
+        while len(open_list) != 0:
+            exhausted = budget.exceeded(len(states), len(expanded))
+            if exhausted is not None:
+                break
+
+            current_code, depth = pop()
+            if depth > depths[current_code]:
+                continue  # A shorter path to this state was found after it was added to the open list
+
+            relaxed = current_code in expanded
+            if relaxed:
+                # Pass a shorter depth on to the successors without expanding the state again
+                successors = transitions.get(current_code, ())
+            elif max_depth is not None and depth >= max_depth:
+                continue
+            else:
+                successors = self.envisioner.successors(current_code)
+                expanded.add(current_code)
+
+                for new_code in successors:
+                    if new_code != current_code:
+                        transitions[current_code].append(new_code)
+
+            for new_code in successors:
+                if new_code not in depths:
+                    depths[new_code] = depth + 1
+                    states.append(new_code)
+                    push(new_code, depth + 1)
+                elif max_depth is not None and depth + 1 < depths[new_code]:
+                    depths[new_code] = depth + 1
+                    push(new_code, depth + 1)
+
+            if not relaxed:
+                self.envisioner.on_expanded(len(open_list), len(states))
+
+        frontier = [code for code in states if code not in expanded]
+        if len(frontier) == 0:
+            exhausted = None  # Only outdated entries were left in the open list
+        elif exhausted is None:
+            exhausted = "max_depth"
+
+        return PartialEnvisionment(states=states, transitions=transitions, frontier=frontier, exhausted=exhausted)
+
+    def _open_list(self):
+        """
+        Return functions adding and removing (code, depth) entries of states to expand and the underlying container.
+        """
+        if self.order == "bfs":
+            open_list = collections.deque()
+            return lambda code, depth: open_list.append((code, depth)), open_list.popleft, open_list
+
+        if self.order == "dfs":
+            open_list = []
+            return lambda code, depth: open_list.append((code, depth)), open_list.pop, open_list
+
+        # Ties are broken by insertion order, so states are never compared
+        open_list, counter, priority = [], itertools.count(), self.priority
+
+        def push(code, depth):
+            heapq.heappush(open_list, (priority(code), next(counter), code, depth))
+
+        def pop():
+            return heapq.heappop(open_list)[2:]
+
+        return push, pop, open_list
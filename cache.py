@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining a cache for the successors of states.
+"""
+
+# STD
+import collections
+
+# CONST
+DEFAULT_CACHE_SIZE = 2 ** 16  # Maximum number of states whose successors are cached
+
+CacheStatistics = collections.namedtuple("CacheStatistics", ["hits", "misses", "evictions", "size", "max_size"])
+
+
+class SuccessorCache:
+    """
+    Bounded cache mapping (model fingerprint, packed state) to the successors of that state. Because the successors of a
+    state only depend on the state itself and the rules of the model, one cache can be shared by all state graphs, even
+    ones using different models. If the cache is full, the least recently used entry is evicted.
+    """
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        assert max_size > 0, "Cache size has to be positive"
+        self.max_size = max_size
+        self.hits, self.misses, self.evictions = 0, 0, 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, fingerprint, code):
+        """
+        Return the cached successors of a state or None if they are unknown.
+        """
+        key = (fingerprint, code)
+        successors = self._entries.get(key)
+
+        if successors is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return successors
+
+    def put(self, fingerprint, code, successors):
+        """
+        Cache the successors of a state.
+        """
+        key = (fingerprint, code)
+        self._entries[key] = tuple(successors)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, max_size):
+        """
+        Change the maximum size of the cache, evicting entries if necessary.
+        """
+        assert max_size > 0, "Cache size has to be positive"
+        self.max_size = max_size
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    @property
+    def statistics(self):
+        return CacheStatistics(
+            hits=self.hits, misses=self.misses, evictions=self.evictions, size=len(self._entries),
+            max_size=self.max_size
+        )
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+_shared_cache = None
+
+
+def shared_cache(max_size=None):
+    """
+    Return the successor cache shared by the whole process. Creates it on first use; if a size is given, the cache is
+    resized accordingly.
+    """
+    global _shared_cache
+
+    if _shared_cache is None:
+        _shared_cache = SuccessorCache(max_size or DEFAULT_CACHE_SIZE)
+    elif max_size is not None:
+        _shared_cache.resize(max_size)
+
+    return _shared_cache
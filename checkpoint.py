@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining checkpoints of running envisionments, which can be resumed after a crash or preemption.
+"""
+
+# STD
+import collections
+import os
+import struct
+import time
+
+# PROJECT
+from persistence import pack_graph, unpack_graph, write_atomically
+
+# CONST
+FILE_MAGIC = b"PPCK"
+FORMAT_VERSION = 1
+
+# Magic, format version, bytes per state code, program fingerprint, number of discovered states, number of expanded
+# states and number of transitions
+HEADER = struct.Struct("<4sHH40sQQQ")
+
+# Discovered states (in order of discovery, starting with the initial state), the number of them that were already
+# expanded and the transitions of the expanded states
+Checkpoint = collections.namedtuple("Checkpoint", ["fingerprint", "states", "num_expanded", "transitions"])
+
+
+def write_checkpoint(path, program, states, num_expanded, transitions):
+    """
+    Write the progress of a breadth-first search to a file. Since states are expanded in order of discovery, the
+    frontier consists of all states after the first num_expanded ones, so the file only contains the codes of all
+    discovered states and the transitions of the expanded states (see persistence.pack_graph()). The file is replaced
+    atomically, so a crash while writing leaves the previous checkpoint intact.
+    """
+    code_size = program.encoding.code_size
+    chunks, num_transitions = pack_graph(states, transitions, code_size, num_rows=num_expanded)
+    header = HEADER.pack(
+        FILE_MAGIC, FORMAT_VERSION, code_size, program.fingerprint.encode("ascii"), len(states), num_expanded,
+        num_transitions
+    )
+    write_atomically(path, [header] + chunks, sync=True)
+
+
+def read_checkpoint(path):
+    """
+    Read a checkpoint written by write_checkpoint(). Raises a ValueError if the file is not a valid checkpoint.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+
+    try:
+        magic, version, code_size, fingerprint, num_states, num_expanded, num_transitions = HEADER.unpack_from(data, 0)
+    except struct.error:
+        raise ValueError("Truncated checkpoint")
+
+    if magic != FILE_MAGIC or version != FORMAT_VERSION:
+        raise ValueError("Unknown checkpoint format")
+
+    states, transitions = unpack_graph(data, HEADER.size, code_size, num_states, num_expanded, num_transitions)
+
+    return Checkpoint(
+        fingerprint=fingerprint.decode("ascii"), states=states, num_expanded=num_expanded, transitions=transitions
+    )
+
+
+class Checkpointer:
+    """
+    Class writing checkpoints of a running envisionment to a file, after every given number of expanded states and / or
+    number of seconds. By default, the checkpoint is removed once the envisionment is complete.
+    """
+    def __init__(self, path, every=None, seconds=60.0, keep=False):
+        assert every is not None or seconds is not None, "Checkpoints need an interval"
+        self.path = path
+        self.every = every
+        self.seconds = seconds
+        self.keep = keep
+        self.num_written = 0
+        self._last_expanded, self._last_time = 0, time.monotonic()
+
+    def due(self, num_expanded):
+        """
+        Check whether a checkpoint should be written after the given number of expanded states.
+        """
+        if self.every is not None and num_expanded - self._last_expanded >= self.every:
+            return True
+
+        return self.seconds is not None and time.monotonic() - self._last_time >= self.seconds
+
+    def write(self, program, states, num_expanded, transitions):
+        write_checkpoint(self.path, program, states, num_expanded, transitions)
+        self.num_written += 1
+        self._last_expanded, self._last_time = num_expanded, time.monotonic()
+
+    def finish(self):
+        if not self.keep and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ResumableEnvisioner:
+    """
+    Class performing the breadth-first search of another envisioner (using its successors()), writing checkpoints in
+    between the expansion of states and resuming from them. A resumed envisionment discovers the same states and
+    transitions in the same order as an uninterrupted one.
+    """
+    def __init__(self, envisioner, checkpointer=None):
+        self.envisioner = envisioner
+        self.program = envisioner.program
+        self.encoding = envisioner.encoding
+        self.checkpointer = checkpointer
+
+    def envision(self, initial_code, resume_from=None):
+        """
+        Perform a breadth-first search from the initial state, optionally continuing from a checkpoint file. Returns
+        all discovered states in the order of discovery and the transitions between them.
+        """
+        if hasattr(self.envisioner, "canonicalize"):  # Start from the representative under symmetry reduction
+            initial_code = self.envisioner.canonicalize(initial_code)[0]
+
+        if resume_from is not None:
+            checkpoint = read_checkpoint(resume_from)
+
+            if checkpoint.fingerprint != self.program.fingerprint or checkpoint.states[0] != initial_code:
+                raise ValueError("Checkpoint belongs to a different model or initial state")
+
+            states, num_expanded = checkpoint.states, checkpoint.num_expanded
+            transitions = checkpoint.transitions
+        else:
+            states, num_expanded = [initial_code], 0
+            transitions = collections.defaultdict(list)
+
+        visited = set(states)
+        checkpointer = self.checkpointer
+
+        while num_expanded < len(states):
+            current_code = states[num_expanded]
+
+            for new_code in self.envisioner.successors(current_code):
+                if new_code != current_code:
+                    transitions[current_code].append(new_code)
+
+                if new_code not in visited:
+                    visited.add(new_code)
+                    states.append(new_code)
+
+            num_expanded += 1
+            self.envisioner.on_expanded(len(states) - num_expanded, len(states))
+
+            if checkpointer is not None and checkpointer.due(num_expanded):
+                checkpointer.write(self.program, states, num_expanded, transitions)
+
+        if checkpointer is not None:
+            checkpointer.finish()
+
+        return states, transitions
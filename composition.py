@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining the compositional envisionment of models consisting of independent subsystems.
+"""
+
+# STD
+import collections
+import itertools
+
+# PROJECT
+from encoding import SLOT_BITS, SLOT_MASK
+from engine import PackedEnvisioner
+from program import compile_rules
+
+# CONST
+Component = collections.namedtuple("Component", ["slots", "program"])
+
+
+def find_components(encoding, inter_state, intra_state):
+    """
+    Group the slots of an encoding into independent components: Two quantities belong to the same component if they
+    are (indirectly) connected by any relationship. Quantities without any relationships form a component on their own.
+    Returns sorted lists of slots, ordered by their first slot.
+    """
+    parents = list(range(encoding.size))
+
+    def find(slot):
+        while parents[slot] != slot:
+            parents[slot] = parents[parents[slot]]
+            slot = parents[slot]
+        return slot
+
+    for relationship in itertools.chain(inter_state, intra_state):
+        source, target = _relationship_slots(encoding, relationship)
+        parents[find(source)] = find(target)
+
+    components = collections.defaultdict(list)
+    for slot in range(encoding.size):
+        components[find(slot)].append(slot)
+
+    return sorted(components.values())
+
+
+def decompose(encoding, inter_state, intra_state):
+    """
+    Split a model into independent components, each with a RuleProgram only containing its own quantities and
+    relationships.
+    """
+    component_slots = find_components(encoding, inter_state, intra_state)
+    slot_components = {slot: index for index, slots in enumerate(component_slots) for slot in slots}
+
+    # Relationships of every component, keeping their order
+    relationships = [([], []) for _ in component_slots]
+    for position, relationship_list in enumerate((inter_state, intra_state)):
+        for relationship in relationship_list:
+            source, _ = _relationship_slots(encoding, relationship)
+            relationships[slot_components[source]][position].append(relationship)
+
+    return [
+        Component(slots=slots, program=compile_rules(encoding.restrict(slots), *relationships[index]))
+        for index, slots in enumerate(component_slots)
+    ]
+
+
+def _relationship_slots(encoding, relationship):
+    return (
+        encoding.slot(relationship.source_entity_name, relationship.source_quantity_name),
+        encoding.slot(relationship.target_entity_name, relationship.target_quantity_name)
+    )
+
+
+class ComposedEnvisioner(PackedEnvisioner):
+    """
+    PackedEnvisioner that expands the independent components of a model separately. The successors of a state are the
+    combinations of the successors of its components (including branches in which a component does not change). Only
+    the successors of component states are memoized, so every component state is expanded once, no matter in how many
+    global states it occurs. Envisionments and queries still visit the global states.
+    """
+    def __init__(self, program, inter_state, intra_state, cache=None):
+        super().__init__(program, cache=cache)
+        self.components = decompose(program.encoding, inter_state, intra_state)
+        self._envisioners = [PackedEnvisioner(component.program, cache=cache) for component in self.components]
+        self._component_successors = [{} for _ in self.components]  # Successors already moved to their global slots
+
+    def project(self, code, index):
+        """
+        Return the code of a component of a global state.
+        """
+        component_code = 0
+
+        for local_slot, slot in enumerate(self.components[index].slots):
+            component_code |= ((code >> (slot * SLOT_BITS)) & SLOT_MASK) << (local_slot * SLOT_BITS)
+
+        return component_code
+
+    def inject(self, component_code, index):
+        """
+        Move the code of a component to the slots of the component within a global state.
+        """
+        code = 0
+
+        for local_slot, slot in enumerate(self.components[index].slots):
+            code |= ((component_code >> (local_slot * SLOT_BITS)) & SLOT_MASK) << (slot * SLOT_BITS)
+
+        return code
+
+    def component_successors(self, code, index):
+        """
+        Return the successors of the given component of a global state, moved to their global slots.
+        """
+        component_code = self.project(code, index)
+        successors = self._component_successors[index].get(component_code)
+
+        if successors is None:
+            successors = [
+                self.inject(successor, index) for successor in self._envisioners[index].successors(component_code)
+            ]
+            self._component_successors[index][component_code] = successors
+
+        return successors
+
+    def successors(self, code):
+        """
+        Return the packed codes of all combinations of the successors of every component.
+        """
+        fixed_code, options = 0, []
+
+        for index in range(len(self.components)):
+            successors = self.component_successors(code, index)
+
+            if len(successors) == 0:
+                return []  # One of the components can not continue
+            elif len(successors) == 1:
+                fixed_code |= successors[0]
+            else:
+                options.append(successors)
+
+        successors = []
+        for combination in itertools.product(*options):
+            new_code = fixed_code
+            for component_code in combination:
+                new_code |= component_code
+            successors.append(new_code)
+
+        return successors
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining a compact encoding of states as packed integers.
+"""
+
+# PROJECT
+from quantities import Quantity, GLOBAL_QUANTITY_SPACE, QUANTITY_SPACES
+
+# CONST
+VALUE_BITS = 3  # Enough bits to store any index of the global quantity space
+VALUE_MASK = (1 << VALUE_BITS) - 1
+SLOT_BITS = 2 * VALUE_BITS  # Magnitude in the lower, derivative in the upper bits of a slot
+SLOT_MASK = (1 << SLOT_BITS) - 1
+
+
+def uid_from_code(code, size):
+    """
+    Return the uid of a State (global indices of magnitude and derivative for every quantity) from its packed code.
+    """
+    digits = []
+
+    for _ in range(size):
+        digits.append(str(code & VALUE_MASK))
+        digits.append(str((code >> VALUE_BITS) & VALUE_MASK))
+        code >>= SLOT_BITS
+
+    return "".join(digits)
+
+
+class StateEncoding:
+    """
+    Class mapping the quantities of a state onto a single packed integer. Every quantity occupies one slot holding the
+    global indices of its magnitude and derivative, so a state can be stored, hashed and compared as a plain int.
+    Proper State objects are only created when calling materialize().
+    """
+    def __init__(self, state):
+        self.entity_names = list(state.entity_names)
+        self.entity_types = [type(entity) for entity in state.entities]
+        self.quantity_names = [list(entity.quantity_names) for entity in state.entities]
+
+        self.slots = []  # Full names of quantities like "container.volume"
+        self.models = []  # Model of every quantity like "volume"
+        for entity_name, entity in zip(self.entity_names, state.entities):
+            for quantity_name, quantity in zip(entity.quantity_names, entity.quantities):
+                self.slots.append("{}.{}".format(entity_name, quantity_name))
+                self.models.append(quantity.model)
+
+        self.slot_indices = {slot: index for index, slot in enumerate(self.slots)}
+        self.size = len(self.slots)
+        self.quantity_spaces = [QUANTITY_SPACES[model] for model in self.models]
+
+    def restrict(self, slots):
+        """
+        Return an encoding of only the given slots, e.g. to envision a part of the model on its own. Slots keep their
+        relative order, entities without any of the slots are dropped.
+        """
+        slots = sorted(slots)
+        encoding = StateEncoding.__new__(StateEncoding)
+        encoding.entity_names, encoding.entity_types, encoding.quantity_names = [], [], []
+        slot_names = {self.slots[slot] for slot in slots}
+
+        for entity_name, entity_type, quantity_names in zip(self.entity_names, self.entity_types, self.quantity_names):
+            kept_names = [name for name in quantity_names if "{}.{}".format(entity_name, name) in slot_names]
+
+            if len(kept_names) > 0:
+                encoding.entity_names.append(entity_name)
+                encoding.entity_types.append(entity_type)
+                encoding.quantity_names.append(kept_names)
+
+        encoding.slots = [self.slots[slot] for slot in slots]
+        encoding.models = [self.models[slot] for slot in slots]
+        encoding.slot_indices = {slot: index for index, slot in enumerate(encoding.slots)}
+        encoding.size = len(encoding.slots)
+        encoding.quantity_spaces = [self.quantity_spaces[slot] for slot in slots]
+        return encoding
+
+    @property
+    def code_size(self):
+        """
+        Number of bytes needed to store a packed code of this encoding in binary files.
+        """
+        return max(1, -(-SLOT_BITS * self.size // 8))
+
+    def slot(self, entity_name, quantity_name):
+        """
+        Return the index of the slot storing the given quantity.
+        """
+        return self.slot_indices["{}.{}".format(entity_name, quantity_name)]
+
+    @staticmethod
+    def encode(state):
+        """
+        Pack a State object into an integer. States maintain their packed code themselves.
+        """
+        return state.code
+
+    @staticmethod
+    def encode_values(magnitudes, derivatives):
+        """
+        Pack lists of global magnitude and derivative indices into an integer.
+        """
+        code = 0
+
+        for slot in range(len(magnitudes) - 1, -1, -1):
+            code = (code << SLOT_BITS) | (derivatives[slot] << VALUE_BITS) | magnitudes[slot]
+
+        return code
+
+    def decode(self, code):
+        """
+        Unpack an integer into lists of global magnitude and derivative indices.
+        """
+        magnitudes, derivatives = [0] * self.size, [0] * self.size
+
+        for slot in range(self.size):
+            magnitudes[slot] = code & VALUE_MASK
+            derivatives[slot] = (code >> VALUE_BITS) & VALUE_MASK
+            code >>= SLOT_BITS
+
+        return magnitudes, derivatives
+
+    def from_uid(self, uid):
+        """
+        Pack the uid of a State into an integer.
+        """
+        assert len(uid) == 2 * self.size, "uid does not belong to this encoding"
+        indices = [int(index) for index in uid]
+        return self.encode_values(indices[0::2], indices[1::2])
+
+    def uid(self, code):
+        """
+        Return the same uid the materialized State would have.
+        """
+        return uid_from_code(code, self.size)
+
+    def values(self, code):
+        """
+        Return the readable magnitude and derivative for every slot.
+        """
+        magnitudes, derivatives = self.decode(code)
+        return [
+            (GLOBAL_QUANTITY_SPACE[magnitude], GLOBAL_QUANTITY_SPACE[derivative])
+            for magnitude, derivative in zip(magnitudes, derivatives)
+        ]
+
+    def readable_id(self, code):
+        """
+        Return the same readable id the materialized State would have.
+        """
+        values = iter(self.values(code))
+        return "| ".join(
+            "; ".join("{:<3} {:<3}".format(*next(values)) for _ in quantity_names)
+            for quantity_names in self.quantity_names
+        ).strip()
+
+    def materialize(self, code):
+        """
+        Create a proper State object from its packed representation.
+        """
+        # Import here to avoid circular imports
+        from states import State
+
+        values = iter(zip(self.models, self.values(code)))
+        entities = {}
+
+        for entity_name, entity_type, quantity_names in zip(self.entity_names, self.entity_types, self.quantity_names):
+            quantities = {}
+
+            for quantity_name in quantity_names:
+                model, (magnitude, derivative) = next(values)
+                quantities[quantity_name] = Quantity(model, magnitude=magnitude, derivative=derivative)
+
+            entities[entity_name] = entity_type(**quantities)
+
+        state = State(**entities)
+        state._code = code  # Spare the state from computing its code again
+        return state
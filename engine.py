@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining an envisioning engine that works on packed integer states.
+"""
+
+# STD
+import collections
+import itertools
+
+# PROJECT
+from program import ADDITION, AMBIGUOUS, DERIVATIVE_STEPS, INFLUENCE_ACTIVE, OP_INFLUENCE
+
+# CONST
+STATE_EVENT = "state"  # Event emitted for a newly discovered state
+TRANSITION_EVENT = "transition"  # Event emitted for a new transition
+
+
+class PackedEnvisioner:
+    """
+    Class performing the envisionment on states encoded by a StateEncoding. The expansion of a state follows the same
+    four steps as StateGraph._envision, but executes a compiled RuleProgram on lists of global value indices instead of
+    applying relationships to State objects.
+
+    The successors of states can optionally be memoized in a SuccessorCache, which can be shared between envisioners
+    of the same or different models.
+    """
+    def __init__(self, program, cache=None):
+        self.program = program
+        self.encoding = program.encoding
+        self.cache = cache
+
+    def envision(self, initial_code):
+        """
+        Perform a breadth-first search from the initial state. Returns all discovered states in the order of discovery
+        and the transitions between them.
+        """
+        states = []
+        transitions = collections.defaultdict(list)
+
+        for event in self.iter_envision(initial_code):
+            if event[0] == STATE_EVENT:
+                states.append(event[1])
+            else:
+                transitions[event[1]].append(event[2])
+
+        return states, transitions
+
+    def iter_envision(self, initial_code):
+        """
+        Perform a breadth-first search from the initial state, yielding (STATE_EVENT, code) for every discovered state
+        and (TRANSITION_EVENT, start code, end code) for every transition. Only the codes of visited states are kept.
+        """
+        return self.iter_envision_many((initial_code, ))
+
+    def iter_envision_many(self, initial_codes):
+        """
+        Perform a single breadth-first search from several initial states, which share all visited states: Every state
+        is only expanded once, no matter from how many initial states it can be reached. Yields the same events as
+        iter_envision(), starting with a STATE_EVENT for every distinct initial state.
+        """
+        visited, state_stack = set(), collections.deque()
+
+        for initial_code in initial_codes:
+            if initial_code not in visited:
+                visited.add(initial_code)
+                state_stack.append(initial_code)
+                yield STATE_EVENT, initial_code
+
+        while len(state_stack) != 0:
+            current_code = state_stack.popleft()
+
+            for new_code in self.successors(current_code):
+                if new_code != current_code:
+                    yield TRANSITION_EVENT, current_code, new_code
+
+                if new_code not in visited:
+                    visited.add(new_code)
+                    state_stack.append(new_code)
+                    yield STATE_EVENT, new_code
+
+            self.on_expanded(len(state_stack), len(visited))
+
+    def successors(self, code):
+        """
+        Return the packed codes of all valid branches of a state. The list includes the state itself if one of the
+        branches does not change anything.
+        """
+        if self.cache is None:
+            return self._successors(code)
+
+        successors = self.cache.get(self.program.fingerprint, code)
+        if successors is None:
+            successors = self._successors(code)
+            self.cache.put(self.program.fingerprint, code, successors)
+
+        return successors
+
+    def _successors(self, code):
+        magnitudes, derivatives = self.encoding.decode(code)
+
+        # Step 1: Apply consequences
+        self._apply_consequences(magnitudes, derivatives)
+
+        # Step 2: Aggregate incoming influences and proportionalities
+        aggregations = self._apply_rules(magnitudes, derivatives)
+
+        # Step 3: Perform derivative calculus, branch if necessary
+        derivative_options = self._branch(derivatives, aggregations)
+
+        # Step 4: Apply value correspondences to every branch, discard discontinuous ones
+        branch_magnitudes = self._apply_vcs(magnitudes)
+        if branch_magnitudes is None:
+            return []
+
+        return [
+            self.encoding.encode_values(branch_magnitudes, branch_derivatives)
+            for branch_derivatives in itertools.product(*derivative_options)
+        ]
+
+    def _apply_consequences(self, magnitudes, derivatives):
+        for index, (slot, trigger, steps) in enumerate(self.program.consequences):
+            if derivatives[slot] == trigger and steps[magnitudes[slot]] != magnitudes[slot]:
+                magnitudes[slot] = steps[magnitudes[slot]]
+                self._on_fired("consequences", index)
+
+    def _apply_rules(self, magnitudes, derivatives):
+        deltas = [0] * len(derivatives)
+        aggregations = {}
+
+        for index, (opcode, source, target, direction) in enumerate(self.program.rules):
+            if opcode == OP_INFLUENCE:
+                if not INFLUENCE_ACTIVE[magnitudes[source]]:
+                    continue
+            else:
+                if deltas[source] == 0:
+                    continue
+                direction = direction if deltas[source] > 0 else -direction
+
+            derivative = derivatives[target]
+            new_derivative = DERIVATIVE_STEPS[direction][derivative]
+
+            if new_derivative != derivative:
+                deltas[target] += direction
+                aggregations.setdefault(target, []).append(new_derivative)
+                self._on_fired("rules", index)
+
+        return aggregations
+
+    def _branch(self, derivatives, aggregations):
+        derivative_options = [(derivative, ) for derivative in derivatives]
+
+        for slot, aggregation in aggregations.items():
+            derivative_options[slot] = self._derivative_calculus(derivatives[slot], aggregation)
+
+        return derivative_options
+
+    @staticmethod
+    def _derivative_calculus(derivative, aggregation):
+        current_value = aggregation[0]
+
+        for value in aggregation[1:]:
+            new_value = ADDITION[current_value][value]
+
+            if new_value == AMBIGUOUS:
+                return tuple(sorted({derivative, current_value, value}))
+
+            current_value = new_value
+
+        return current_value,
+
+    def _apply_vcs(self, magnitudes):
+        magnitudes = list(magnitudes)
+
+        value_correspondences = self.program.value_correspondences
+        for index, (source, target, source_magnitude, target_magnitude) in enumerate(value_correspondences):
+            if magnitudes[source] == source_magnitude and magnitudes[target] != target_magnitude:
+                self._on_fired("value_correspondences", index)
+
+                if abs(magnitudes[target] - target_magnitude) > 1:
+                    self._on_discontinuity(index, magnitudes)
+                    return None  # Discontinuity
+
+                magnitudes[target] = target_magnitude
+
+        return magnitudes
+
+    def on_expanded(self, frontier_size, num_states):
+        """
+        Hook called after a state has been expanded, can be overridden to observe the search. Searches driving this
+        envisioner from outside (like checkpoint.ResumableEnvisioner) call it as well.
+        """
+        pass
+
+    def _on_fired(self, part, index):
+        """
+        Hook called when an entry of the program (given by the name of its part, like "rules", and its index) changes a
+        value while expanding a state.
+        """
+        pass
+
+    def _on_discontinuity(self, index, magnitudes):
+        """
+        Hook called when the value correspondence with the given index rejects a state due to a discontinuity, given the
+        magnitudes of the state when the discontinuity was detected.
+        """
+        pass
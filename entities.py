@@ -4,7 +4,6 @@ Module defining entities for the causal graph.
 """
 
 # STD
-import copy
 import itertools
 
 
@@ -36,9 +35,12 @@ class Entity:
         )
 
     def __copy__(self):
-        return type(self)(
-            **dict(zip(self.quantity_names, [copy.copy(quantity) for quantity in self.quantities]))
+        # Skip the checks of subclasses, the quantities of a copy are valid already
+        entity = type(self).__new__(type(self))
+        Entity.__init__(
+            entity, **dict(zip(self.quantity_names, [quantity.__copy__() for quantity in self.quantities]))
         )
+        return entity
 
 
 class Container(Entity):
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining exporters streaming envisioned state graphs into machine-readable formats.
+"""
+
+# STD
+import abc
+import argparse
+import array
+import html
+import json
+import os
+import sys
+
+# PROJECT
+from engine import STATE_EVENT, TRANSITION_EVENT
+from quantities import GLOBAL_QUANTITY_SPACE
+
+# CONST
+SCHEMA_VERSION = 1
+FORMATS = ("npz", "ndjson", "graphml")
+FILE_EXTENSIONS = {".npz": "npz", ".ndjson": "ndjson", ".jsonl": "ndjson", ".graphml": "graphml"}
+VALUE_TEXTS = [html.escape(value) for value in GLOBAL_QUANTITY_SPACE]  # Values escaped for XML
+
+
+def describe_schema(encoding):
+    """
+    Return the schema shared by all export formats: The labels of the global quantity space, which values are given as
+    indices of, and the name, model and quantity space of every quantity in the order they are exported in.
+    """
+    quantities = []
+
+    for slot, model, quantity_space in zip(encoding.slots, encoding.models, encoding.quantity_spaces):
+        entity_name, quantity_name = slot.split(".")
+        quantities.append({
+            "name": slot, "entity": entity_name, "quantity": quantity_name, "model": model,
+            "quantity_space": list(quantity_space)
+        })
+
+    return {"version": SCHEMA_VERSION, "values": list(GLOBAL_QUANTITY_SPACE), "quantities": quantities}
+
+
+class Exporter(metaclass=abc.ABCMeta):
+    """
+    Class streaming states and transitions given as packed codes into a file. States receive ids in the order they are
+    first encountered (either by themselves or as part of a transition) and are written right away, so only the ids of
+    the states are kept in memory. Values are decoded from the packed codes directly.
+    """
+    def __init__(self, file, encoding, mode="w"):
+        self.encoding = encoding
+        self.schema = describe_schema(encoding)
+        self.num_states, self.num_transitions = 0, 0
+        self._ids = {}
+        self._owns_file = isinstance(file, (str, bytes, os.PathLike))
+        self.file = open(file, mode) if self._owns_file else file
+
+    def state(self, code):
+        """
+        Write a state unless it was written before, return its id.
+        """
+        state_id = self._ids.get(code)
+
+        if state_id is None:
+            state_id = self._ids[code] = self.num_states
+            self.num_states += 1
+            self._write_state(state_id, *self.encoding.decode(code))
+
+        return state_id
+
+    def transition(self, start_code, end_code):
+        self._write_transition(self.state(start_code), self.state(end_code))
+        self.num_transitions += 1
+
+    def consume(self, events):
+        """
+        Write all state and transition events like the ones of PackedEnvisioner.iter_envision.
+        """
+        for event in events:
+            if event[0] == STATE_EVENT:
+                self.state(event[1])
+            else:
+                self.transition(event[1], event[2])
+
+    def close(self):
+        self._finish()
+
+        if self._owns_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @abc.abstractmethod
+    def _write_state(self, state_id, magnitudes, derivatives):
+        pass
+
+    @abc.abstractmethod
+    def _write_transition(self, start_id, end_id):
+        pass
+
+    def _finish(self):
+        pass
+
+
+class NDJSONExporter(Exporter):
+    """
+    Exporter writing one JSON object per line: The schema first, followed by states (with the labels of their
+    magnitudes and derivatives in schema order) and transitions (between state ids) in the order they are found.
+    """
+    def __init__(self, file, encoding):
+        super().__init__(file, encoding)
+        self._write({"type": "schema", **self.schema})
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, separators=(",", ":")))
+        self.file.write("\n")
+
+    def _write_state(self, state_id, magnitudes, derivatives):
+        self._write({
+            "type": "state", "id": state_id,
+            "magnitudes": [GLOBAL_QUANTITY_SPACE[magnitude] for magnitude in magnitudes],
+            "derivatives": [GLOBAL_QUANTITY_SPACE[derivative] for derivative in derivatives]
+        })
+
+    def _write_transition(self, start_id, end_id):
+        self._write({"type": "transition", "source": start_id, "target": end_id})
+
+
+class GraphMLExporter(Exporter):
+    """
+    Exporter writing a GraphML document with a node attribute for the magnitude and derivative of every quantity
+    (named like "container.volume.magnitude") and the schema version as graph attribute.
+    """
+    def __init__(self, file, encoding):
+        super().__init__(file, encoding)
+        self.file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+            '  <key id="schema" for="graph" attr.name="schema_version" attr.type="int"/>\n'
+        )
+
+        for slot, quantity in enumerate(self.schema["quantities"]):
+            for prefix, kind in (("m", "magnitude"), ("d", "derivative")):
+                self.file.write('  <key id="{}{}" for="node" attr.name="{}" attr.type="string"/>\n'.format(
+                    prefix, slot, html.escape("{}.{}".format(quantity["name"], kind))
+                ))
+
+        self.file.write(
+            '  <graph id="states" edgedefault="directed">\n'
+            '    <data key="schema">{}</data>\n'.format(SCHEMA_VERSION)
+        )
+
+    def _write_state(self, state_id, magnitudes, derivatives):
+        data = "".join(
+            '<data key="m{slot}">{}</data><data key="d{slot}">{}</data>'.format(
+                VALUE_TEXTS[magnitude], VALUE_TEXTS[derivative], slot=slot
+            )
+            for slot, (magnitude, derivative) in enumerate(zip(magnitudes, derivatives))
+        )
+        self.file.write('    <node id="n{}">{}</node>\n'.format(state_id, data))
+
+    def _write_transition(self, start_id, end_id):
+        self.file.write('    <edge source="n{}" target="n{}"/>\n'.format(start_id, end_id))
+
+    def _finish(self):
+        self.file.write("  </graph>\n</graphml>\n")
+
+
+class NPZExporter(Exporter):
+    """
+    Exporter writing columnar numpy arrays into a (compressed) .npz archive: magnitudes and derivatives hold the global
+    value indices of every state and quantity (states x quantities, int8), sources and targets the state ids of every
+    transition (uint32). The schema is stored as JSON string next to the names of the quantities and values. Rows are
+    collected in compact arrays while streaming and only converted when closing the exporter.
+    """
+    def __init__(self, file, encoding, compressed=True):
+        super().__init__(file, encoding, mode="wb")
+        self.compressed = compressed
+        self._magnitudes, self._derivatives = array.array("b"), array.array("b")
+        self._sources, self._targets = array.array("I"), array.array("I")
+
+    def _write_state(self, state_id, magnitudes, derivatives):
+        self._magnitudes.extend(magnitudes)
+        self._derivatives.extend(derivatives)
+
+    def _write_transition(self, start_id, end_id):
+        self._sources.append(start_id)
+        self._targets.append(end_id)
+
+    def _finish(self):
+        # Import here so numpy is only required when actually exporting to npz
+        import numpy as np
+
+        shape = (self.num_states, self.encoding.size)
+        save = np.savez_compressed if self.compressed else np.savez
+        save(
+            self.file,
+            magnitudes=np.frombuffer(self._magnitudes, dtype=np.int8).reshape(shape),
+            derivatives=np.frombuffer(self._derivatives, dtype=np.int8).reshape(shape),
+            sources=np.frombuffer(self._sources, dtype=np.uint32),
+            targets=np.frombuffer(self._targets, dtype=np.uint32),
+            quantities=np.array(self.encoding.slots),
+            values=np.array(GLOBAL_QUANTITY_SPACE),
+            schema=np.array(json.dumps(self.schema))
+        )
+
+
+EXPORTERS = {"npz": NPZExporter, "ndjson": NDJSONExporter, "graphml": GraphMLExporter}
+
+
+def create_exporter(file, encoding, format=None):
+    """
+    Create the exporter for a file, determining the format from the file extension unless it is given.
+    """
+    if format is None:
+        format = FILE_EXTENSIONS.get(os.path.splitext(str(file))[1].lower())
+    assert format in FORMATS, "Unknown export format, use one of {}".format(", ".join(FORMATS))
+
+    return EXPORTERS[format](file, encoding)
+
+
+def export_envisionment(envisioner, initial_code, file, format=None):
+    """
+    Envision a state graph straight into a file. Envisioners that can stream their results are consumed event by
+    event, so the state graph is never held in memory as a whole. Returns the numbers of states and transitions.
+    """
+    with create_exporter(file, envisioner.encoding, format) as exporter:
+        if hasattr(envisioner, "iter_envision"):
+            exporter.consume(envisioner.iter_envision(initial_code))
+        else:
+            codes, transitions = envisioner.envision(initial_code)
+            exporter.consume(_result_events(codes, transitions))
+
+    return exporter.num_states, exporter.num_transitions
+
+
+def export_store(store, file, format=None):
+    """
+    Export a GraphStore, keeping its state ids. Returns the numbers of states and transitions.
+    """
+    with create_exporter(file, store.encoding, format) as exporter:
+        exporter.consume(_result_events(store.codes, {}))
+        for start, end in store.edges():
+            exporter.transition(store.codes[start], store.codes[end])
+
+    return exporter.num_states, exporter.num_transitions
+
+
+def _result_events(codes, transitions):
+    for code in codes:
+        yield STATE_EVENT, code
+
+    for start, ends in transitions.items():
+        for end in ends:
+            yield TRANSITION_EVENT, start, end
+
+
+def _init_argparser():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "output", help="Path of the exported file, use - (together with --format) for standard output."
+    )
+    argparser.add_argument(
+        "--format", "-f", choices=FORMATS,
+        help="Export format, determined by the file extension by default."
+    )
+    argparser.add_argument(
+        '--graph', "-g", choices=["minimal", "extra", "generated"], default="minimal",
+        help="Type of state graph that is going to be exported."
+    )
+    argparser.add_argument(
+        "--containers", "-c", type=int, default=2,
+        help="Number of containers of a generated model."
+    )
+    argparser.add_argument(
+        "--taps", "-t", type=int, default=1,
+        help="Number of taps of a generated model."
+    )
+    argparser.add_argument(
+        "--topology", default="chain",
+        help="How the containers of a generated model are connected."
+    )
+    return argparser
+
+
+if __name__ == "__main__":
+    from generator import build_state_graph
+    from graph import init_extra_points_state_graph, init_minimum_viable_state_graph
+    argparser = _init_argparser()
+    args = argparser.parse_args()
+
+    if args.graph == "minimal":
+        state_graph = init_minimum_viable_state_graph()
+    elif args.graph == "extra":
+        state_graph = init_extra_points_state_graph()
+    else:
+        state_graph = build_state_graph(args.taps, args.containers, topology=args.topology)
+
+    output = args.output
+    if output == "-":
+        output = sys.stdout.buffer if args.format == "npz" else sys.stdout
+    num_states, num_transitions = state_graph.export(output, format=args.format)
+    print("Exported {} state(s) and {} transitions.".format(num_states, num_transitions), file=sys.stderr)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining a generator for synthetic models of arbitrary size.
+"""
+
+# PROJECT
+from quantities import Quantity
+from entities import Tap, Container, Drain
+from states import StateGraph, State
+from relationships import (
+    PositiveConsequence,
+    NegativeConsequence,
+    PositiveInfluence,
+    NegativeInfluence,
+    PositiveProportion,
+    VCmax,
+    VCzero
+)
+
+# CONST
+TOPOLOGIES = ("chain", "tree", "parallel")
+CONTAINER_QUANTITIES = ("volume", "height", "pressure")
+
+
+def build_model(num_taps=1, num_containers=1, topology="chain", branching=2, container_quantities=CONTAINER_QUANTITIES,
+                outflow_influence=True, proportionalities=True, value_correspondences=True, tap_derivative="+"):
+    """
+    Build the entities and relationships of a tap / container / drain network. Every container has its own drain.
+    Containers are connected according to the topology:
+        * chain: All taps feed the first container, the drain of container i feeds container i + 1.
+        * tree: All taps feed the first container, the drain of container i feeds containers
+          i * branching + 1 ... i * branching + branching.
+        * parallel: Container i is fed by tap i % num_taps, containers are not connected to each other.
+
+    Returns the initial state as well as the inter- and intra-state relationships.
+    """
+    assert topology in TOPOLOGIES, "Unknown topology"
+    assert num_taps > 0 and num_containers > 0, "At least one tap and one container are required"
+    assert container_quantities[0] == "volume", "Containers need a volume"
+
+    entities = {}
+    inter_state, intra_state = [], []
+
+    for tap_index in range(num_taps):
+        entities["tap{}".format(tap_index)] = Tap(inflow=Quantity("inflow", derivative=tap_derivative))
+        intra_state.extend(_consequences("tap{}.inflow".format(tap_index)))
+
+    for container_index in range(num_containers):
+        container_name, drain_name = "container{}".format(container_index), "drain{}".format(container_index)
+        entities[container_name] = Container(**{name: Quantity(name) for name in container_quantities})
+        entities[drain_name] = Drain(outflow=Quantity("outflow"))
+
+        # Incoming and outgoing water
+        for source in _feeds(container_index, num_taps, topology, branching):
+            inter_state.append(PositiveInfluence(source=source, target="{}.volume".format(container_name)))
+        if outflow_influence:
+            inter_state.append(
+                NegativeInfluence(source="{}.outflow".format(drain_name), target="{}.volume".format(container_name))
+            )
+
+        # Volume -> height -> pressure -> outflow
+        chain = ["{}.{}".format(container_name, name) for name in container_quantities]
+        chain.append("{}.outflow".format(drain_name))
+        for source, target in zip(chain, chain[1:]):
+            if proportionalities:
+                inter_state.append(PositiveProportion(source=source, target=target))
+            if value_correspondences:
+                intra_state.extend([VCmax(source=source, target=target), VCzero(source=source, target=target)])
+
+        for quantity in chain:
+            intra_state.extend(_consequences(quantity))
+
+    return State(**entities), inter_state, intra_state
+
+
+def build_state_graph(num_taps=1, num_containers=1, topology="chain", verbosity=0, **kwargs):
+    """
+    Build a StateGraph for a synthetic model, see build_model(). Arguments that build_model() does not know are passed
+    on to the StateGraph.
+    """
+    model_arguments = {
+        key: kwargs.pop(key) for key in list(kwargs)
+        if key in ("branching", "container_quantities", "outflow_influence", "proportionalities",
+                   "value_correspondences", "tap_derivative")
+    }
+    initial_state, inter_state, intra_state = build_model(num_taps, num_containers, topology, **model_arguments)
+
+    return StateGraph(
+        initial_state=initial_state, inter_state=inter_state, intra_state=intra_state, verbosity=verbosity, **kwargs
+    )
+
+
+def _feeds(container_index, num_taps, topology, branching):
+    if topology == "parallel":
+        return ["tap{}.inflow".format(container_index % num_taps)]
+
+    if container_index == 0:
+        return ["tap{}.inflow".format(tap_index) for tap_index in range(num_taps)]
+
+    parent_index = container_index - 1 if topology == "chain" else (container_index - 1) // branching
+    return ["drain{}.outflow".format(parent_index)]
+
+
+def _consequences(quantity):
+    return [PositiveConsequence(target=quantity), NegativeConsequence(target=quantity)]
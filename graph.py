@@ -18,7 +18,7 @@ from relationships import (
 )
 
 
-def init_minimum_viable_state_graph(verbosity=0):
+def init_minimum_viable_state_graph(verbosity=0, persistent_cache=None):
     # Construct tap
     inflow = Quantity("inflow", derivative="+")
     tap = Tap(inflow=inflow)
@@ -53,12 +53,13 @@ def init_minimum_viable_state_graph(verbosity=0):
 
     # Create state graph
     state_graph = StateGraph(
-        initial_state=init_state, inter_state=inter_state, intra_state=intra_state, verbosity=verbosity
+        initial_state=init_state, inter_state=inter_state, intra_state=intra_state, verbosity=verbosity,
+        persistent_cache=persistent_cache
     )
     return state_graph
 
 
-def init_extra_points_state_graph(verbosity=0):
+def init_extra_points_state_graph(verbosity=0, persistent_cache=None):
     # Construct tap
     inflow = Quantity("inflow", derivative="+")
     tap = Tap(inflow=inflow)
@@ -105,6 +106,7 @@ def init_extra_points_state_graph(verbosity=0):
 
     # Create state graph
     state_graph = StateGraph(
-        initial_state=init_state, inter_state=inter_state, intra_state=intra_state, verbosity=verbosity
+        initial_state=init_state, inter_state=inter_state, intra_state=intra_state, verbosity=verbosity,
+        persistent_cache=persistent_cache
     )
     return state_graph
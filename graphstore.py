@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining a compact store for state graphs and analytics running directly on it.
+"""
+
+# STD
+import array
+import collections
+
+# PROJECT
+from engine import STATE_EVENT
+
+# CONST
+INDEX_TYPE = "I"  # Unsigned 32 bit state ids
+
+
+class GraphStore:
+    """
+    Class storing a state graph without any State objects: States are identified by integer ids in order of discovery
+    and transitions are kept in compressed sparse row (CSR) format, i.e. the successors of state i are
+    targets[offsets[i]:offsets[i + 1]]. The reverse adjacency is only built when an analysis needs it.
+    """
+    def __init__(self, encoding, codes, offsets, targets):
+        self.encoding = encoding
+        self.codes = codes  # Packed code of every state
+        self.offsets = offsets
+        self.targets = targets
+        self._ids = None
+        self._reverse = None
+
+    @classmethod
+    def from_envisioner(cls, envisioner, initial_code):
+        """
+        Envision a state graph directly into a GraphStore. Envisioners that can stream their results (see
+        PackedEnvisioner.iter_envision) are consumed event by event and batch engines hand over their index arrays, so
+        no intermediate dictionaries are built.
+        """
+        if hasattr(envisioner, "envision_arrays"):  # Batch engines, see vectorized.BatchEnvisioner
+            codes, offsets, targets = envisioner.envision_arrays(initial_code)
+            return cls(
+                envisioner.encoding, codes, array.array(INDEX_TYPE, offsets.astype("uint32").tobytes()),
+                array.array(INDEX_TYPE, targets.astype("uint32").tobytes())
+            )
+
+        if not hasattr(envisioner, "iter_envision"):
+            return cls.from_result(envisioner.encoding, *envisioner.envision(initial_code))
+
+        return cls.from_events(envisioner.encoding, envisioner.iter_envision(initial_code))
+
+    @classmethod
+    def from_envisioner_many(cls, envisioner, initial_codes):
+        """
+        Envision the states reachable from several initial states into a single GraphStore, see
+        PackedEnvisioner.iter_envision_many. The distinct initial states receive the first ids.
+        """
+        assert hasattr(envisioner, "iter_envision_many"), "Envisioner can not start from several initial states"
+        return cls.from_events(envisioner.encoding, envisioner.iter_envision_many(initial_codes))
+
+    @classmethod
+    def from_events(cls, encoding, events):
+        """
+        Create a GraphStore from a stream of state and transition events like the ones of
+        PackedEnvisioner.iter_envision.
+        """
+        codes, ids = [], {}
+        starts, targets = array.array(INDEX_TYPE), array.array(INDEX_TYPE)
+
+        def state_id(code):
+            if code not in ids:
+                ids[code] = len(codes)
+                codes.append(code)
+            return ids[code]
+
+        for event in events:
+            if event[0] == STATE_EVENT:
+                state_id(event[1])
+            else:
+                starts.append(state_id(event[1]))
+                targets.append(state_id(event[2]))
+
+        store = cls(encoding, codes, *cls._compress(len(codes), starts, targets))
+        store._ids = ids
+        return store
+
+    @classmethod
+    def from_result(cls, encoding, codes, transitions):
+        """
+        Create a GraphStore from the states and transitions returned by PackedEnvisioner.envision().
+        """
+        ids = {code: index for index, code in enumerate(codes)}
+        offsets, targets = array.array(INDEX_TYPE, [0]), array.array(INDEX_TYPE)
+
+        for code in codes:
+            targets.extend(ids[end] for end in transitions.get(code, ()))
+            offsets.append(len(targets))
+
+        store = cls(encoding, list(codes), offsets, targets)
+        store._ids = ids
+        return store
+
+    @staticmethod
+    def _compress(num_states, starts, targets):
+        """
+        Turn a list of transitions into CSR arrays, keeping the order of transitions of every state.
+        """
+        counts = array.array(INDEX_TYPE, bytes(num_states * array.array(INDEX_TYPE).itemsize))
+        for start in starts:
+            counts[start] += 1
+
+        offsets = array.array(INDEX_TYPE, [0])
+        for count in counts:
+            offsets.append(offsets[-1] + count)
+
+        if all(starts[index] <= starts[index + 1] for index in range(len(starts) - 1)):
+            return offsets, targets  # Transitions are already grouped by state, e.g. after a breadth-first search
+
+        positions = array.array(INDEX_TYPE, offsets[:-1])
+        sorted_targets = array.array(INDEX_TYPE, bytes(len(targets) * targets.itemsize))
+        for start, target in zip(starts, targets):
+            sorted_targets[positions[start]] = target
+            positions[start] += 1
+
+        return offsets, sorted_targets
+
+    @property
+    def num_states(self):
+        return len(self.codes)
+
+    @property
+    def num_transitions(self):
+        return len(self.targets)
+
+    def __len__(self):
+        return self.num_states
+
+    def id_of(self, code):
+        """
+        Return the id of the state with the given packed code.
+        """
+        if self._ids is None:
+            self._ids = {code: index for index, code in enumerate(self.codes)}
+        return self._ids[code]
+
+    def uid(self, state_id):
+        return self.encoding.uid(self.codes[state_id])
+
+    def materialize(self, state_id):
+        """
+        Create a State object for a single state.
+        """
+        return self.encoding.materialize(self.codes[state_id])
+
+    def successors(self, state_id):
+        return self.targets[self.offsets[state_id]:self.offsets[state_id + 1]]
+
+    def predecessors(self, state_id):
+        offsets, targets = self.reverse()
+        return targets[offsets[state_id]:offsets[state_id + 1]]
+
+    def reverse(self):
+        """
+        Return the CSR arrays of the reversed graph, built on first use.
+        """
+        if self._reverse is None:
+            starts = array.array(INDEX_TYPE)
+            for state_id in range(self.num_states):
+                starts.extend([state_id] * (self.offsets[state_id + 1] - self.offsets[state_id]))
+
+            self._reverse = self._compress(self.num_states, self.targets, starts)
+
+        return self._reverse
+
+    def edges(self):
+        """
+        Iterate over all transitions as pairs of state ids.
+        """
+        for state_id in range(self.num_states):
+            for target in self.successors(state_id):
+                yield state_id, target
+
+    def terminal_states(self):
+        """
+        Return the ids of all states without any successors.
+        """
+        return [state_id for state_id in range(self.num_states) if self.offsets[state_id] == self.offsets[state_id + 1]]
+
+    def strongly_connected_components(self):
+        """
+        Find all strongly connected components with (an iterative version of) Tarjan's algorithm. Returns a list of
+        components as lists of state ids, in reverse topological order: No component has a transition into a component
+        following it.
+        """
+        num_states, offsets, targets = self.num_states, self.offsets, self.targets
+        indices, low_links = [-1] * num_states, [0] * num_states
+        on_stack = bytearray(num_states)
+        stack, components = [], []
+        counter = 0
+
+        for root in range(num_states):
+            if indices[root] != -1:
+                continue
+
+            call_stack = [(root, offsets[root])]
+            indices[root] = low_links[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+
+            while len(call_stack) > 0:
+                state_id, position = call_stack[-1]
+
+                if position < offsets[state_id + 1]:
+                    call_stack[-1] = (state_id, position + 1)
+                    target = targets[position]
+
+                    if indices[target] == -1:
+                        indices[target] = low_links[target] = counter
+                        counter += 1
+                        stack.append(target)
+                        on_stack[target] = 1
+                        call_stack.append((target, offsets[target]))
+                    elif on_stack[target]:
+                        low_links[state_id] = min(low_links[state_id], indices[target])
+                    continue
+
+                call_stack.pop()
+                if len(call_stack) > 0:
+                    parent = call_stack[-1][0]
+                    low_links[parent] = min(low_links[parent], low_links[state_id])
+
+                if low_links[state_id] == indices[state_id]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        component.append(member)
+                        if member == state_id:
+                            break
+                    components.append(component)
+
+        return components
+
+    def attractors(self):
+        """
+        Return the strongly connected components that can not be left, i.e. the sets of states the system ends up in
+        eventually. Terminal states form an attractor on their own.
+        """
+        components = self.strongly_connected_components()
+        labels = [0] * self.num_states
+        for label, component in enumerate(components):
+            for state_id in component:
+                labels[state_id] = label
+
+        return [
+            component for label, component in enumerate(components)
+            if all(labels[target] == label for state_id in component for target in self.successors(state_id))
+        ]
+
+    def reachable(self, sources, reverse=False):
+        """
+        Return the ids of all states reachable from the given state ids (including themselves) in breadth-first order.
+        With reverse=True, all states the sources can be reached from are returned instead.
+        """
+        offsets, targets = self.reverse() if reverse else (self.offsets, self.targets)
+        visited = bytearray(self.num_states)
+        queue = collections.deque()
+
+        for source in sources:
+            if not visited[source]:
+                visited[source] = 1
+                queue.append(source)
+
+        order = []
+        while len(queue) > 0:
+            state_id = queue.popleft()
+            order.append(state_id)
+
+            for target in targets[offsets[state_id]:offsets[state_id + 1]]:
+                if not visited[target]:
+                    visited[target] = 1
+                    queue.append(target)
+
+        return order
+
+    def shortest_path(self, source, target):
+        """
+        Return a shortest list of state ids leading from source to target or None if there is no such path.
+        """
+        parents = array.array("i", [-1]) * self.num_states
+        parents[source] = source
+        queue = collections.deque([source])
+
+        while len(queue) > 0:
+            state_id = queue.popleft()
+
+            if state_id == target:
+                path = [target]
+                while path[-1] != source:
+                    path.append(parents[path[-1]])
+                return path[::-1]
+
+            for successor in self.successors(state_id):
+                if parents[successor] == -1:
+                    parents[successor] = state_id
+                    queue.append(successor)
+
+        return None
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining the incremental re-envisionment of a model after editing its relationships.
+"""
+
+# STD
+import bisect
+import collections
+
+# PROJECT
+from engine import PackedEnvisioner
+from program import DERIVATIVE_STEPS, INFLUENCE_ACTIVE, OP_INFLUENCE
+
+# CONST
+# Parts of a RuleProgram whose entries are tracked, in the order they are applied during an expansion
+PROGRAM_PARTS = ("consequences", "rules", "value_correspondences")
+
+# Difference between two envisionments: Packed codes of states and (start, end) pairs of transitions that were
+# added or removed, the number of states that had to be expanded and the number of reused expansions
+EnvisionmentDiff = collections.namedtuple(
+    "EnvisionmentDiff",
+    ["added_states", "removed_states", "added_transitions", "removed_transitions", "num_expanded", "num_reused"]
+)
+
+
+class IncrementalEnvisioner(PackedEnvisioner):
+    """
+    PackedEnvisioner that remembers the expansion of every state: Its successors and which entries of the program
+    (consequences, rules and value correspondences) fired, i.e. actually changed a value. Entries that did not fire
+    have no influence on the successors of a state, so after an edit of the model, only states that fired a removed
+    entry or in which an added entry might fire have to be expanded again; all other expansions are reused.
+    """
+    def __init__(self, program):
+        super().__init__(program)
+        self.expansions = {}  # Successors and indices of fired program entries of every expanded state
+        self.states, self.transitions = None, None
+        self.num_expanded = 0
+        self._fired = None
+
+    def envision(self, initial_code):
+        """
+        Perform a breadth-first search from the initial state, reusing all remembered expansions. Expansions of states
+        that are not reachable anymore are forgotten.
+        """
+        self.num_expanded = 0
+        self.states, self.transitions = super().envision(initial_code)
+        self.expansions = {code: self.expansions[code] for code in self.states}
+        return self.states, self.transitions
+
+    def successors(self, code):
+        expansion = self.expansions.get(code)
+
+        if expansion is None:
+            self._fired = {part: [] for part in PROGRAM_PARTS}
+            successors = self._successors(code)
+            expansion = self.expansions[code] = (successors, tuple(tuple(self._fired[part]) for part in PROGRAM_PARTS))
+            self.num_expanded += 1
+
+        return expansion[0]
+
+    def update(self, program, initial_code):
+        """
+        Switch to the program of an edited model and envision it again, only expanding states that are affected by
+        the edit. Changes to the quantities or quantity spaces of the model are treated conservatively: All states
+        are expanded again. Returns the EnvisionmentDiff to the previous envisionment.
+        """
+        old_states, old_transitions = self.states or [], self.transitions or {}
+
+        if same_quantities(self.encoding, program.encoding):
+            self.expansions = self._reusable_expansions(program)
+        else:
+            self.expansions = {}
+
+        self.program, self.encoding = program, program.encoding
+        self.envision(initial_code)
+
+        old_edges, new_edges = _edge_set(old_transitions), _edge_set(self.transitions)
+        return EnvisionmentDiff(
+            added_states=set(self.states) - set(old_states),
+            removed_states=set(old_states) - set(self.states),
+            added_transitions=new_edges - old_edges,
+            removed_transitions=old_edges - new_edges,
+            num_expanded=self.num_expanded,
+            num_reused=len(self.states) - self.num_expanded
+        )
+
+    def _reusable_expansions(self, program):
+        """
+        Return the remembered expansions that are still valid for the new program, with the indices of their fired
+        entries translated to the new program. Entries that changed their position relative to the others are treated
+        like removed and added ones, since e.g. a proportionality only fires if an earlier rule changed its source.
+        """
+        matches, added = [], []
+
+        for part in PROGRAM_PARTS:
+            old_entries, new_entries = getattr(self.program, part), getattr(program, part)
+            match = _keep_order(_match_entries(old_entries, new_entries))
+            matched = set(match)
+            matches.append(match)
+            added.append([new_entries[index] for index in range(len(new_entries)) if index not in matched])
+
+        expansions = {}
+        for code, (successors, fired) in self.expansions.items():
+            new_fired = tuple(tuple(match[index] for index in indices) for match, indices in zip(matches, fired))
+
+            if any(None in indices for indices in new_fired):
+                continue  # A fired entry was removed or moved
+
+            if self._might_fire(code, fired, added, program):
+                continue
+
+            expansions[code] = (successors, new_fired)
+
+        return expansions
+
+    def _might_fire(self, code, fired, added, program):
+        """
+        Check whether any of the added program entries might fire when expanding the state. Influences and
+        consequences are checked exactly, proportionalities and value correspondences whenever their source might be
+        changed by another entry.
+        """
+        added_consequences, added_rules, added_vcs = added
+        magnitudes, derivatives = self.encoding.decode(code)
+
+        for slot, trigger, steps in added_consequences:
+            if derivatives[slot] == trigger:
+                return True
+
+        for slot, trigger, steps in program.consequences:
+            if derivatives[slot] == trigger:
+                magnitudes[slot] = steps[magnitudes[slot]]
+
+        rule_targets = {self.program.rules[index][2] for index in fired[1]} | {rule[2] for rule in added_rules}
+        for opcode, source, target, direction in added_rules:
+            if opcode == OP_INFLUENCE:
+                if INFLUENCE_ACTIVE[magnitudes[source]] and \
+                        DERIVATIVE_STEPS[direction][derivatives[target]] != derivatives[target]:
+                    return True
+            elif source in rule_targets:
+                return True
+
+        vc_targets = {self.program.value_correspondences[index][1] for index in fired[2]}
+        vc_targets |= {vc[1] for vc in added_vcs}
+        for source, target, source_magnitude, target_magnitude in added_vcs:
+            if magnitudes[source] == source_magnitude or source in vc_targets:
+                return True
+
+        return False
+
+    def _on_fired(self, part, index):
+        self._fired[part].append(index)
+
+
+def same_quantities(encoding, other_encoding):
+    """
+    Check whether two encodings have the same quantities and quantity spaces, i.e. whether packed codes mean the same.
+    """
+    return (encoding.slots, encoding.models, encoding.quantity_spaces) == \
+        (other_encoding.slots, other_encoding.models, other_encoding.quantity_spaces)
+
+
+def _match_entries(old_entries, new_entries):
+    """
+    Return the index of every old program entry within the new program (None if it was removed). Equal entries are
+    matched in order of their occurrence.
+    """
+    positions = collections.defaultdict(collections.deque)
+    for index, entry in enumerate(new_entries):
+        positions[entry].append(index)
+
+    return [positions[entry].popleft() if len(positions[entry]) > 0 else None for entry in old_entries]
+
+
+def _keep_order(match):
+    """
+    Keep the largest set of matched entries whose order is the same in both programs (a longest increasing subsequence
+    of their new indices) and unmatch all others, i.e. treat them as moved.
+    """
+    tails, tail_positions = [], []  # Smallest last new index of increasing subsequences of every length
+    predecessors = [None] * len(match)
+
+    for position, index in enumerate(match):
+        if index is None:
+            continue
+
+        length = bisect.bisect_left(tails, index)
+        predecessors[position] = tail_positions[length - 1] if length > 0 else None
+
+        if length == len(tails):
+            tails.append(index)
+            tail_positions.append(position)
+        else:
+            tails[length], tail_positions[length] = index, position
+
+    kept = set()
+    position = tail_positions[-1] if len(tail_positions) > 0 else None
+    while position is not None:
+        kept.add(position)
+        position = predecessors[position]
+
+    return [index if position in kept else None for position, index in enumerate(match)]
+
+
+def _edge_set(transitions):
+    return {(start, end) for start, ends in transitions.items() for end in ends}
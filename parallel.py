@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining an envisioning engine that distributes the state expansion over several processes.
+"""
+
+# STD
+import collections
+import multiprocessing
+
+# PROJECT
+from engine import PackedEnvisioner
+
+# CONST
+MIN_STATES_PER_WORKER = 16  # Smaller frontiers are expanded in the main process to avoid communication overhead
+
+# Envisioner of the current worker process, created once by _init_worker()
+_worker_envisioner = None
+
+
+def _init_worker(program):
+    global _worker_envisioner
+    _worker_envisioner = PackedEnvisioner(program)
+
+
+def _expand_codes(codes):
+    return [_worker_envisioner.successors(code) for code in codes]
+
+
+class ParallelEnvisioner:
+    """
+    Class performing the envisionment with a pool of worker processes. The search proceeds layer by layer: every state
+    of the current frontier is owned by exactly one worker (determined by the hash of its packed code), workers only
+    receive and return packed codes, and the results are merged in frontier order. This way the discovered states and
+    transitions are identical to the ones of a serial PackedEnvisioner, including their order.
+    """
+    def __init__(self, program, workers):
+        assert workers > 0, "At least one worker is required"
+        self.program = program
+        self.encoding = program.encoding
+        self.workers = workers
+        self.local_envisioner = PackedEnvisioner(program)
+
+    def envision(self, initial_code):
+        """
+        Perform a breadth-first search from the initial state. Returns all discovered states in the order of discovery
+        and the transitions between them.
+        """
+        states = {initial_code: None}  # Use dict as insertion-ordered set
+        transitions = collections.defaultdict(list)
+        frontier = [initial_code]
+
+        with multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self.program, )) as pool:
+            while len(frontier) != 0:
+                next_frontier = []
+
+                for current_code, new_codes in zip(frontier, self._expand_frontier(pool, frontier)):
+                    for new_code in new_codes:
+                        if new_code != current_code:
+                            transitions[current_code].append(new_code)
+
+                        if new_code not in states:
+                            states[new_code] = None
+                            next_frontier.append(new_code)
+
+                frontier = next_frontier
+
+        return list(states), transitions
+
+    def _expand_frontier(self, pool, frontier):
+        """
+        Return the successors of every state in the frontier, in frontier order.
+        """
+        if len(frontier) < self.workers * MIN_STATES_PER_WORKER:
+            return [self.local_envisioner.successors(code) for code in frontier]
+
+        partitions = [[] for _ in range(self.workers)]
+        for code in frontier:
+            partitions[self.owner(code)].append(code)
+
+        successors = {}
+        for partition, partition_successors in zip(partitions, pool.map(_expand_codes, partitions)):
+            successors.update(zip(partition, partition_successors))
+
+        return [successors[code] for code in frontier]
+
+    def owner(self, code):
+        """
+        Return the index of the worker responsible for expanding a state.
+        """
+        return hash(code) % self.workers
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining a persistent cache storing envisionments on disk.
+"""
+
+# STD
+import array
+import collections
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+# PROJECT
+from graphstore import GraphStore
+
+# CONST
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "puzzled-platypus")
+FILE_MAGIC = b"PPEV"
+FORMAT_VERSION = 1
+FILE_EXTENSION = ".env"
+
+# Magic, format version, bytes per state code, number of states, number of transitions
+HEADER = struct.Struct("<4sHHQQ")
+INDEX_TYPE = "I"  # Unsigned 32 bit state indices, stored little endian
+INDEX_SIZE = array.array(INDEX_TYPE).itemsize
+
+
+def pad(size, alignment=8):
+    return size + (-size % alignment)
+
+
+def index_array(values):
+    """
+    Return an array of little endian state indices.
+    """
+    indices = array.array(INDEX_TYPE, values)
+    if sys.byteorder == "big":
+        indices.byteswap()
+    return indices
+
+
+def pack_graph(states, transitions, code_size, num_rows=None):
+    """
+    Serialize states (packed codes) and their transitions: The codes of all states (fixed width, little endian, padded
+    to 8 bytes), followed by the transitions of the first num_rows states (all by default) in compressed sparse row
+    format, i.e. for every state the offset of its first successor followed by the state indices of all successors.
+    Returns the chunks of bytes and the number of transitions.
+    """
+    num_rows = len(states) if num_rows is None else num_rows
+    indices = {code: index for index, code in enumerate(states)}
+
+    offsets, targets = [0], []
+    for code in states[:num_rows]:
+        targets.extend(indices[end] for end in transitions.get(code, ()))
+        offsets.append(len(targets))
+
+    return pack_arrays(states, offsets, targets, code_size), len(targets)
+
+
+def pack_arrays(states, offsets, targets, code_size):
+    """
+    Serialize states and transitions that are already given in compressed sparse row format, see pack_graph().
+    """
+    codes = b"".join(code.to_bytes(code_size, "little") for code in states)
+    padding = b"\0" * (pad(len(codes)) - len(codes))
+    return [codes, padding, index_array(offsets).tobytes(), index_array(targets).tobytes()]
+
+
+def unpack_arrays(buffer, position, code_size, num_states, num_rows, num_transitions):
+    """
+    Read states and transitions written by pack_graph() from a buffer, starting at the given position. Returns the
+    codes of the states and the offsets and targets of the transitions of the first num_rows states. Raises a
+    ValueError if the buffer is truncated or refers to unknown states.
+    """
+    end = position + pad(num_states * code_size) + (num_rows + 1 + num_transitions) * INDEX_SIZE
+    if len(buffer) < end:
+        raise ValueError("Truncated file")
+
+    states = [
+        int.from_bytes(buffer[start:start + code_size], "little")
+        for start in range(position, position + num_states * code_size, code_size)
+    ]
+
+    position += pad(num_states * code_size)
+    offsets = array.array(INDEX_TYPE)
+    offsets.frombytes(buffer[position:position + (num_rows + 1) * INDEX_SIZE])
+
+    position += (num_rows + 1) * INDEX_SIZE
+    targets = array.array(INDEX_TYPE)
+    targets.frombytes(buffer[position:position + num_transitions * INDEX_SIZE])
+
+    if sys.byteorder == "big":
+        offsets.byteswap()
+        targets.byteswap()
+
+    if offsets[0] != 0 or offsets[-1] != num_transitions or (num_transitions > 0 and max(targets) >= num_states):
+        raise ValueError("Corrupted file")
+
+    return states, offsets, targets
+
+
+def unpack_graph(buffer, position, code_size, num_states, num_rows, num_transitions):
+    """
+    Read states and transitions like unpack_arrays(), but return them in the format PackedEnvisioner.envision() returns
+    them.
+    """
+    states, offsets, targets = unpack_arrays(buffer, position, code_size, num_states, num_rows, num_transitions)
+
+    transitions = collections.defaultdict(list)
+    for index, code in enumerate(states[:num_rows]):
+        start, end = offsets[index], offsets[index + 1]
+        if start != end:
+            transitions[code] = [states[target] for target in targets[start:end]]
+
+    return states, transitions
+
+
+def write_atomically(path, chunks, sync=False):
+    """
+    Write chunks of bytes to a temporary file next to the path and replace the path with it, so readers either see the
+    complete file or none at all. With sync, the data is flushed to disk before, so it also survives a power loss.
+    """
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+
+            if sync:
+                file.flush()
+                os.fsync(file.fileno())
+
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+class EnvisionmentCache:
+    """
+    Class storing envisioned states and transitions in compact binary files, one file per model and initial state.
+
+    Files consist of a header followed by the states in order of discovery and their transitions, see pack_graph().
+    Files are read via memory mapping and copied into arrays in bulk, so loading an envisionment does not require any
+    parsing. The fastest warm start is load_store(), which does not build any dictionaries or State objects.
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY):
+        self.directory = directory
+
+    def key(self, program, initial_code):
+        """
+        Return the key identifying an envisionment. It covers the entities, quantity spaces and relationships of the
+        model (via the fingerprint of its program) as well as the initial state.
+        """
+        description = "{}:{}:{}".format(FORMAT_VERSION, program.fingerprint, initial_code)
+        return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+    def path(self, program, initial_code):
+        return os.path.join(self.directory, self.key(program, initial_code) + FILE_EXTENSION)
+
+    def __contains__(self, item):
+        program, initial_code = item
+        return os.path.exists(self.path(program, initial_code))
+
+    def load(self, program, initial_code):
+        """
+        Load the states and transitions of an envisionment in the same format PackedEnvisioner.envision() returns them.
+        Returns None if the envisionment has not been stored yet.
+        """
+        arrays = self._load_arrays(program, initial_code)
+        if arrays is None:
+            return None
+
+        states, offsets, targets = arrays
+        transitions = collections.defaultdict(list)
+        for index, code in enumerate(states):
+            start, end = offsets[index], offsets[index + 1]
+            if start != end:
+                transitions[code] = [states[target] for target in targets[start:end]]
+
+        return states, transitions
+
+    def load_store(self, program, initial_code):
+        """
+        Load an envisionment into a GraphStore, which uses the stored arrays as they are. Returns None if the
+        envisionment has not been stored yet.
+        """
+        arrays = self._load_arrays(program, initial_code)
+        return None if arrays is None else GraphStore(program.encoding, *arrays)
+
+    def _load_arrays(self, program, initial_code):
+        path = self.path(program, initial_code)
+
+        try:
+            with open(path, "rb") as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return self._read(mapped)
+        except (FileNotFoundError, ValueError, IndexError, struct.error):
+            return None  # Missing or corrupted / outdated file
+
+    def store(self, program, initial_code, states, transitions):
+        """
+        Store the result of an envisionment. The file is written atomically, so concurrent processes either see the
+        complete file or none at all.
+        """
+        chunks, num_transitions = pack_graph(states, transitions, program.encoding.code_size)
+        self._write(program, initial_code, len(states), num_transitions, chunks)
+
+    def store_graph(self, program, initial_code, store):
+        """
+        Store the envisionment held by a GraphStore like store().
+        """
+        chunks = pack_arrays(store.codes, store.offsets, store.targets, program.encoding.code_size)
+        self._write(program, initial_code, store.num_states, store.num_transitions, chunks)
+
+    def _write(self, program, initial_code, num_states, num_transitions, chunks):
+        os.makedirs(self.directory, exist_ok=True)
+        header = HEADER.pack(FILE_MAGIC, FORMAT_VERSION, program.encoding.code_size, num_states, num_transitions)
+        write_atomically(self.path(program, initial_code), [header] + chunks)
+
+    @staticmethod
+    def _read(mapped):
+        magic, version, code_size, num_states, num_transitions = HEADER.unpack_from(mapped, 0)
+
+        if magic != FILE_MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Unknown file format")
+
+        return unpack_arrays(mapped, HEADER.size, code_size, num_states, num_states, num_transitions)
+
+    def clear(self):
+        """
+        Remove all stored envisionments.
+        """
+        if not os.path.isdir(self.directory):
+            return
+
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(FILE_EXTENSION):
+                os.remove(os.path.join(self.directory, file_name))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining the printing of transition and state tables, without any rendering dependencies.
+"""
+
+
+class StateGraphPrintingMixin:
+    """
+    Mixin that provides functions to print the transition and state table of a state graph.
+    """
+    @property
+    def _table_layout(self):
+        """
+        Number of quantities of the container of the hand-written models, None for any other model.
+        """
+        container = getattr(self.initial_state, "container", None)
+        return len(container.quantities) if container is not None else None
+
+    def _print_table_header(self, title):
+        """
+        Print a header naming the entities above the columns of their quantities, as used in readable ids.
+        """
+        widths = [9 * len(quantity_names) - 2 for quantity_names in self.encoding.quantity_names]
+        print("\n{pad} {title} {pad}\n".format(pad="#" * 14, title=title))
+        print("| ".join("{:<{}}".format(name, width) for name, width in zip(self.encoding.entity_names, widths)))
+        print("+".join("-" * (width + (index > 0)) for index, width in enumerate(widths)))
+
+    def _print_transition_table(self, transitions):
+        # Not beautiful but still in the scope of this project
+        layout = self._table_layout
+
+        if layout not in (1, 3):
+            self._print_table_header("Transitions found")
+
+            for start in transitions:
+                for end in transitions[start]:
+                    print("{} ----> {}".format(start.readable_id, end.readable_id))
+
+        if layout == 3:
+            print("\n{pad} Transitions found {pad}\n".format(pad="#" * 39))
+            print(
+                "\n{tspace}{tap:<4} | {cspace}{container:<16} | {drain} {relationship} {tap:>5}{tspace} | "
+                "{container:>16}{cspace} | {drain}".format(
+                    tap="tap", container="container", drain="drain", relationship=" "*12,
+                    tspace=" "*2, cspace=" "*8
+                )
+            )
+            print("{}+{}+{}{}{}+{}+{}".format("-"*7, "-"*26, "-"*7, " "*14, "-"*7, "-"*26, "-"*6))
+
+            for start in transitions:
+                for end in transitions[start]:
+                    print("{start} {pad}---->{pad} {end}".format(
+                        start=start.readable_id, end=end.readable_id, pad=" "*4
+                    ))
+
+        if layout == 1:
+            print("\n{pad} Transitions found {pad}\n".format(pad="#" * 22))
+            print(
+                "\n{tspace}{tap:<4} | {cspace}{container} | {drain} {relationship} {tap:>7}{tspace} | "
+                "{container}{cspace} | {drain}".format(
+                    tap="tap", container="cont.", drain="drain", relationship=" "*12,
+                    tspace=" "*2, cspace=" "*1
+                )
+            )
+            print("{}+{}+{}{}{}+{}+{}".format("-" * 7, "-" * 8, "-" * 7, " " * 14, "-" * 9, "-" * 8, "-" * 6))
+
+            for start in transitions:
+                for end in transitions[start]:
+                    print("{start} {pad}---->{pad} {end}".format(
+                        start=start.readable_id, end=end.readable_id, pad=" "*5
+                    ))
+
+    def _print_state_table(self, states):
+        # Not beautiful but still in the scope of this project
+        layout = self._table_layout
+
+        if layout not in (1, 3):
+            self._print_table_header("States found")
+
+        if layout == 3:
+            print("\n{pad} States found {pad}\n".format(pad="#"*14))
+            print("{tspace}{tap:<4} | {cspace}{container:<16} | {drain}".format(
+                    tap="tap", container="container", drain="drain", tspace=" "*2, cspace=" "*8
+                )
+            )
+            print("{}+{}+{}".format("-"*7, "-"*26, "-"*7))
+
+        if layout == 1:
+            print("\n{pad} States found {pad}\n".format(pad="#" * 5))
+            print("{tspace}{tap:<4} | {cspace}{container} | {drain}".format(
+                tap="tap", container="cont.", drain="drain", tspace=" " * 2, cspace=" " * 1
+                )
+            )
+            print("{}+{}+{}".format("-" * 7, "-" * 8, "-" * 7))
+
+        for state in states.values():
+            print(state.readable_id)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining instrumentation to find out where time is spent during the envisionment.
+"""
+
+# STD
+import collections
+import time
+
+# PROJECT
+from engine import PackedEnvisioner
+
+# CONST
+PHASES = ("consequences", "rules", "branching", "value_correspondences")
+
+EnvisionReport = collections.namedtuple(
+    "EnvisionReport",
+    ["elapsed", "expansions", "num_states", "peak_states", "phase_times", "phase_calls", "fan_out", "rejections",
+     "frontier_sizes"]
+)
+
+
+class EnvisionMetrics:
+    """
+    Class collecting metrics about an envisionment:
+        * Wall time and number of calls of every phase of the state expansion
+        * Histogram of the number of successors per expanded state (fan-out)
+        * Number of branches rejected by every value correspondence due to discontinuities
+        * Frontier size over time, as list of (number of expansions, frontier size), sampled every frontier_interval
+          expansions
+        * Number of discovered states and its peak
+
+    Optionally, a callback is called with the current report every callback_interval seconds.
+    """
+    def __init__(self, frontier_interval=100, callback=None, callback_interval=1.0):
+        self.frontier_interval = frontier_interval
+        self.callback = callback
+        self.callback_interval = callback_interval
+        self.value_correspondence_labels = []
+        self.reset()
+
+    def reset(self):
+        self.phase_times = collections.OrderedDict((phase, 0.0) for phase in PHASES)
+        self.phase_calls = collections.OrderedDict((phase, 0) for phase in PHASES)
+        self.fan_out = collections.Counter()
+        self.rejections = collections.Counter()
+        self.frontier_sizes = []
+        self.expansions, self.num_states, self.peak_states = 0, 0, 0
+        self.start_time = self.last_callback = time.perf_counter()
+
+    def record_phase(self, phase, duration):
+        self.phase_times[phase] += duration
+        self.phase_calls[phase] += 1
+
+    def record_expansion(self, num_successors, frontier_size, num_states):
+        self.expansions += 1
+        self.fan_out[num_successors] += 1
+        self.num_states = num_states
+        self.peak_states = max(self.peak_states, num_states)
+
+        if self.expansions % self.frontier_interval == 0 or frontier_size == 0:
+            self.frontier_sizes.append((self.expansions, frontier_size))
+
+        if self.callback is not None:
+            now = time.perf_counter()
+            if now - self.last_callback >= self.callback_interval:
+                self.last_callback = now
+                self.callback(self.report())
+
+    def record_rejection(self, index, num_branches):
+        self.rejections[self.value_correspondence_labels[index]] += num_branches
+
+    def report(self):
+        """
+        Return a snapshot of all metrics collected so far.
+        """
+        return EnvisionReport(
+            elapsed=time.perf_counter() - self.start_time,
+            expansions=self.expansions,
+            num_states=self.num_states,
+            peak_states=self.peak_states,
+            phase_times=dict(self.phase_times),
+            phase_calls=dict(self.phase_calls),
+            fan_out=dict(sorted(self.fan_out.items())),
+            rejections=dict(self.rejections),
+            frontier_sizes=list(self.frontier_sizes)
+        )
+
+
+class ProfilingEnvisioner(PackedEnvisioner):
+    """
+    PackedEnvisioner that records EnvisionMetrics while envisioning. Every phase of the state expansion is timed
+    separately, which slows down the envisionment a bit.
+    """
+    def __init__(self, program, metrics=None, cache=None):
+        super().__init__(program, cache=cache)
+        self.metrics = metrics if metrics is not None else EnvisionMetrics()
+        self.metrics.value_correspondence_labels = program.value_correspondence_labels
+        self._num_successors, self._num_branches = 0, 0
+
+    def iter_envision_many(self, initial_codes):
+        self.metrics.reset()
+        return super().iter_envision_many(initial_codes)
+
+    def successors(self, code):
+        successors = super().successors(code)
+        self._num_successors = len(successors)
+        return successors
+
+    def _apply_consequences(self, magnitudes, derivatives):
+        start = time.perf_counter()
+        super()._apply_consequences(magnitudes, derivatives)
+        self.metrics.record_phase("consequences", time.perf_counter() - start)
+
+    def _apply_rules(self, magnitudes, derivatives):
+        start = time.perf_counter()
+        aggregations = super()._apply_rules(magnitudes, derivatives)
+        self.metrics.record_phase("rules", time.perf_counter() - start)
+        return aggregations
+
+    def _branch(self, derivatives, aggregations):
+        start = time.perf_counter()
+        derivative_options = super()._branch(derivatives, aggregations)
+        self.metrics.record_phase("branching", time.perf_counter() - start)
+
+        self._num_branches = 1
+        for options in derivative_options:
+            self._num_branches *= len(options)
+
+        return derivative_options
+
+    def _apply_vcs(self, magnitudes):
+        start = time.perf_counter()
+        magnitudes = super()._apply_vcs(magnitudes)
+        self.metrics.record_phase("value_correspondences", time.perf_counter() - start)
+        return magnitudes
+
+    def on_expanded(self, frontier_size, num_states):
+        self.metrics.record_expansion(self._num_successors, frontier_size, num_states)
+
+    def _on_discontinuity(self, index, magnitudes):
+        self.metrics.record_rejection(index, self._num_branches)
+
+
+def format_report(report):
+    """
+    Render an EnvisionReport as human-readable text.
+    """
+    total_phase_time = sum(report.phase_times.values()) or 1.0
+    lines = [
+        "{} state(s) found in {:.4f}s ({} expansions, peak {} states)".format(
+            report.num_states, report.elapsed, report.expansions, report.peak_states
+        ),
+        "",
+        "{:<22} | {:>10} | {:>7} | {:>9}".format("phase", "time s", "share", "calls")
+    ]
+
+    for phase in PHASES:
+        lines.append("{:<22} | {:>10.4f} | {:>6.1f}% | {:>9}".format(
+            phase, report.phase_times[phase], 100 * report.phase_times[phase] / total_phase_time,
+            report.phase_calls[phase]
+        ))
+
+    lines.append("")
+    lines.append("Fan-out: " + ", ".join(
+        "{} successor(s): {}x".format(num_successors, count) for num_successors, count in report.fan_out.items()
+    ))
+
+    if len(report.rejections) > 0:
+        lines.append("Rejected branches:")
+        lines.extend(
+            "\t{}: {}".format(label, count)
+            for label, count in sorted(report.rejections.items(), key=lambda item: -item[1])
+        )
+
+    return "\n".join(lines)
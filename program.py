@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining the compilation of relationships into a flat, index-based rule program.
+"""
+
+# STD
+import hashlib
+
+# PROJECT
+from encoding import VALUE_MASK
+from quantities import ADDITION_TABLE, GLOBAL_QUANTITY_SPACE, QUANTITY_SPACE_DERIVATIVE, get_global_quantity_index
+from relationships import Consequence, ValueCorrespondence
+
+# CONST
+TABLE_SIZE = VALUE_MASK + 1  # Lookup tables are indexed by global value indices
+AMBIGUOUS = -1  # Result of the addition table when the outcome is unknown ("?")
+DERIVATIVE_SPACE = tuple(get_global_quantity_index(value) for value in QUANTITY_SPACE_DERIVATIVE)
+DERIVATIVE_MIN, DERIVATIVE_ZERO, DERIVATIVE_MAX = DERIVATIVE_SPACE
+
+# Opcodes of inter-state rules
+OP_INFLUENCE = 0
+OP_PROPORTION = 1
+
+RULE_OPCODES = {
+    "I+": (OP_INFLUENCE, 1),
+    "I-": (OP_INFLUENCE, -1),
+    "P+": (OP_PROPORTION, 1)
+}
+
+# Consequences move the magnitude if the derivative has the triggering value
+CONSEQUENCE_TRIGGERS = {
+    "C+": (DERIVATIVE_MAX, 1),
+    "C-": (DERIVATIVE_MIN, -1)
+}
+
+# Influences are only active if the magnitude of the source is positive
+INFLUENCE_ACTIVE = tuple(
+    GLOBAL_QUANTITY_SPACE[index] in ("+", "max") if index < len(GLOBAL_QUANTITY_SPACE) else False
+    for index in range(TABLE_SIZE)
+)
+
+
+def _build_addition_table():
+    """
+    Build an integer version of quantities.ADDITION_TABLE indexed by global value indices.
+    """
+    table = [[AMBIGUOUS] * TABLE_SIZE for _ in range(TABLE_SIZE)]
+
+    for (first, second), result in ADDITION_TABLE.items():
+        if result != "?":
+            table[get_global_quantity_index(first)][get_global_quantity_index(second)] = \
+                get_global_quantity_index(result)
+
+    return tuple(tuple(row) for row in table)
+
+
+def _build_step_table(space, direction):
+    """
+    Build a table mapping a global value index to the index of the next value of a quantity space in a direction.
+    Values at the border of the space are mapped onto themselves.
+    """
+    table = list(range(TABLE_SIZE))
+
+    for position, value in enumerate(space):
+        if 0 <= position + direction < len(space):
+            table[value] = space[position + direction]
+
+    return tuple(table)
+
+
+ADDITION = _build_addition_table()
+DERIVATIVE_STEPS = {direction: _build_step_table(DERIVATIVE_SPACE, direction) for direction in (-1, 1)}
+
+
+class RuleProgram:
+    """
+    Class representing the relationships of a model as a flat program. All entity and quantity names are resolved to
+    slot indices of a StateEncoding once and all checks on values are replaced by lookup tables, so the program can be
+    executed on packed states without any attribute lookups.
+
+    The program consists of
+        * consequences: Tuples (slot, triggering derivative, magnitude step table)
+        * rules: Tuples (opcode, source slot, target slot, direction)
+        * value_correspondences: Tuples (source slot, target slot, source magnitude, target magnitude)
+    """
+    def __init__(self, encoding, inter_state, intra_state):
+        self.encoding = encoding
+        self.magnitude_spaces = [
+            tuple(get_global_quantity_index(value) for value in quantity_space)
+            for quantity_space in encoding.quantity_spaces
+        ]
+        self.consequences = []
+        self.value_correspondences = []
+        self.value_correspondence_labels = []  # Readable description of every value correspondence
+
+        for relationship in intra_state:
+            if isinstance(relationship, Consequence):
+                self.consequences.append(self._compile_consequence(relationship))
+            elif isinstance(relationship, ValueCorrespondence):
+                self.value_correspondences.append(self._compile_value_correspondence(relationship))
+                self.value_correspondence_labels.append("{}({}.{} -> {}.{})".format(
+                    relationship.name, relationship.source_entity_name, relationship.source_quantity_name,
+                    relationship.target_entity_name, relationship.target_quantity_name
+                ))
+
+        self.rules = [self._compile_rule(relationship) for relationship in inter_state]
+        self.fingerprint = self._fingerprint()
+
+    def _fingerprint(self):
+        """
+        Create a digest identifying the model: Two programs with the same fingerprint produce the same successors for
+        every state.
+        """
+        description = repr((
+            [entity_type.__name__ for entity_type in self.encoding.entity_types],
+            self.encoding.slots,
+            self.magnitude_spaces,
+            self.consequences,
+            self.rules,
+            self.value_correspondences
+        ))
+        return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+    def _resolve(self, relationship):
+        return (
+            self.encoding.slot(relationship.source_entity_name, relationship.source_quantity_name),
+            self.encoding.slot(relationship.target_entity_name, relationship.target_quantity_name)
+        )
+
+    def _compile_consequence(self, relationship):
+        slot = self.encoding.slot(relationship.entity_name, relationship.quantity_name)
+        trigger, direction = CONSEQUENCE_TRIGGERS[relationship.name]
+        return slot, trigger, _build_step_table(self.magnitude_spaces[slot], direction)
+
+    def _compile_rule(self, relationship):
+        if relationship.name not in RULE_OPCODES:
+            raise ValueError("Relationship {} can not be used between states".format(relationship.name))
+
+        opcode, direction = RULE_OPCODES[relationship.name]
+        return (opcode, *self._resolve(relationship), direction)
+
+    def _compile_value_correspondence(self, relationship):
+        source, target = self._resolve(relationship)
+        target_magnitude = get_global_quantity_index(relationship.target_magnitude)
+
+        if target_magnitude not in self.magnitude_spaces[target]:
+            raise ValueError(
+                "Value correspondence targets value outside of quantity space of {}".format(self.encoding.slots[target])
+            )
+
+        return source, target, get_global_quantity_index(relationship.source_magnitude), target_magnitude
+
+
+def compile_rules(encoding, inter_state, intra_state):
+    """
+    Compile the relationships of a model into a RuleProgram for the given encoding.
+    """
+    return RuleProgram(encoding, inter_state, intra_state)
@@ -4,7 +4,9 @@ Module defining quantities.
 """
 
 # STD
+import collections
 import itertools
+import weakref
 
 # CONST
 GLOBAL_QUANTITY_SPACE = ("min", "-", "0", "+", "max")
@@ -12,6 +14,8 @@ QUANTITY_SPACE_INFLOW = ("0", "+")
 QUANTITY_SPACE_OUTFLOW = QUANTITY_SPACE_VOLUME =\
     QUANTITY_SPACE_PRESSURE = QUANTITY_SPACE_HEIGHT = ("0", "+", "max")
 QUANTITY_SPACE_DERIVATIVE = ("-", "0", "+")
+GLOBAL_INDICES = {value: index for index, value in enumerate(GLOBAL_QUANTITY_SPACE)}
+AMBIGUOUS_VALUE = "?"  # Result of the derivative calculus if influences / proportionalities cancel each other out
 
 QUANTITY_SPACES = {
     "inflow": QUANTITY_SPACE_INFLOW,
@@ -39,34 +43,132 @@ def get_global_quantity_index(quantity):
     return GLOBAL_QUANTITY_SPACE.index(quantity)
 
 
+QuantitySpace = collections.namedtuple("QuantitySpace", ["values", "global_indices", "local_indices"])
+_QUANTITY_SPACE_DESCRIPTORS = {}
+
+
+def describe_quantity_space(quantity_space):
+    """
+    Return the immutable descriptor of a quantity space (its values, their global indices and the reverse mapping),
+    which is shared by all quantifiables using this quantity space.
+    """
+    descriptor = _QUANTITY_SPACE_DESCRIPTORS.get(quantity_space)
+
+    if descriptor is None:
+        global_indices = tuple(GLOBAL_INDICES[value] for value in quantity_space)
+        descriptor = QuantitySpace(
+            values=tuple(quantity_space), global_indices=global_indices,
+            local_indices={global_index: index for index, global_index in enumerate(global_indices)}
+        )
+        _QUANTITY_SPACE_DESCRIPTORS[quantity_space] = descriptor
+
+    return descriptor
+
+
+def _to_global_index(value):
+    return None if value == AMBIGUOUS_VALUE else GLOBAL_INDICES[value]
+
+
 class Quantifiable:
     """
-    Class to model a magnitude or a derivative.
+    Class to model a magnitude or a derivative. The value is only stored as its index in the global quantity space
+    (None for "?"), everything else about the quantity space is shared between all instances.
     """
+    __slots__ = ("space", "global_index", "type", "strict", "delta", "aggregations", "watchers")
+
     def __init__(self, value, quantity_space, quant_type, strict=True):
         assert quant_type in ("magnitude", "derivative"), "Invalid type for quantifiable"
-        self.init_stage = True  # Otherwise the assert-statement in __setattr__ will be triggered
-        self.value = value
-        self.init_stage = False
+        self.space = describe_quantity_space(quantity_space)
+        assert value in self.space.values, "Invalid value for quantifiable: {}".format(value)
+
+        self.global_index = GLOBAL_INDICES[value]
         self.type = quant_type
+        self.strict = strict
         self.delta = 0  # Rate of change since last update
+        self.aggregations = ()  # Pairs of (effect, value) collected from influences and proportionalities
+        self.watchers = ()  # Get notified about changes of the value, see watch()
 
-        self.strict = strict
-        self.quantity_space = quantity_space
-        self.space_ceil = len(quantity_space) - 1
-        self.value_index = quantity_space.index(value)
-        self.aggregations = []
+    @property
+    def value(self):
+        return AMBIGUOUS_VALUE if self.global_index is None else GLOBAL_QUANTITY_SPACE[self.global_index]
+
+    @value.setter
+    def value(self, new_value):
+        new_index = _to_global_index(new_value)
+
+        if self.strict:
+            assert new_index is None or self.global_index is None or abs(self.global_index - new_index) < 2, \
+                "Value assignment to Quantifiable would create a discontinuity"
+
+        self._set_global_index(new_index)
+
+    @property
+    def quantity_space(self):
+        return self.space.values
+
+    @property
+    def space_ceil(self):
+        return len(self.space.values) - 1
+
+    @property
+    def value_index(self):
+        return self.space.local_indices.get(self.global_index)
+
+    @property
+    def global_value_index(self):
+        return self.global_index
 
     def is_max(self):
-        return self.value_index == self.space_ceil
+        return self.global_index == self.space.global_indices[-1]
 
     def is_min(self):
-        return self.value_index == 0
+        return self.global_index == self.space.global_indices[0]
+
+    def watch(self, watcher, shift):
+        """
+        Register a method that is called with (shift, old global index, new global index) whenever the value of this
+        quantifiable changes. Global indices are None for values outside the global quantity space like "?". Several
+        watchers can be registered, e.g. by States sharing the same entities. Their objects are only referenced weakly,
+        so watching does not keep them alive, and watchers are dropped once their objects are gone.
+        """
+        self.watchers += ((weakref.ref(watcher.__self__), watcher.__func__, shift), )
+
+    def live_watchers(self):
+        """
+        Return the (watcher, shift) pairs of all watchers whose objects still exist and drop the others.
+        """
+        live_watchers = []
+
+        for reference, function, shift in self.watchers:
+            owner = reference()
+            if owner is not None:
+                live_watchers.append((function.__get__(owner), shift))
+
+        if len(live_watchers) != len(self.watchers):
+            self.watchers = tuple(entry for entry in self.watchers if entry[0]() is not None)
+
+        return live_watchers
 
     def replace(self, new_value):
-        self.init_stage = True
-        self.value = new_value
-        self.init_stage = False
+        self._set_global_index(_to_global_index(new_value))
+
+    def _set_global_index(self, new_index):
+        old_index = self.global_index
+        self.global_index = new_index
+
+        # Let the watchers (usually States) update their uids
+        if old_index != new_index:
+            for reference, function, shift in self.watchers:
+                owner = reference()
+
+                if owner is None:
+                    self.live_watchers()  # Drop watchers whose objects are gone
+                else:
+                    function(owner, shift, old_index, new_index)
+
+    def _neighbour(self, step):
+        # Global index of the next value up / down the own quantity space
+        return self.space.global_indices[self.space.local_indices[self.global_index] + step]
 
     def update(self):
         """
@@ -83,7 +185,7 @@ class Quantifiable:
                 for effect, value in self.aggregations[1:]:
                     new_value = ADDITION_TABLE[(current_value, value)]  # Look up result
 
-                    if new_value == "?":
+                    if new_value == AMBIGUOUS_VALUE:
                         branches.add(self.value)
                         branches.add(current_value)
                         branches.add(value)
@@ -94,22 +196,17 @@ class Quantifiable:
 
             self.value = current_value
 
-        self.aggregations = []  # Reset aggregations
+        self.aggregations = ()  # Reset aggregations
         self.delta = 0  # Reset change since last update
         return branches
 
-    @property
-    def global_value_index(self):
-        return GLOBAL_QUANTITY_SPACE.index(self.value)
-
     def __add__(self, other):
         # Just add a number
         if type(other) == int:
             assert other == 1, "You can only add one to a quantifiable."
 
-            if self.value_index != self.space_ceil:
-                self.value_index += 1
-                self.value = self.quantity_space[self.value_index]
+            if not self.is_max():
+                self._set_global_index(self._neighbour(1))
                 self.delta += 1
 
         # Add a number and origin of effect (influence, proportionality)
@@ -117,9 +214,9 @@ class Quantifiable:
             effect, value = other
             assert value == 1, "You can only add one to a quantifiable."
 
-            if self.value_index != self.space_ceil:
+            if not self.is_max():
                 self.delta += 1
-                self.aggregations.append((effect, self.quantity_space[self.value_index + 1]))
+                self.aggregations += ((effect, GLOBAL_QUANTITY_SPACE[self._neighbour(1)]), )
 
         return self
 
@@ -130,9 +227,9 @@ class Quantifiable:
         # Just subtract a number
         if type(other) == int:
             assert other == 1, "You can only subtract one to a quantifiable."
-            if self.value_index != 0:
-                self.value_index -= 1
-                self.value = self.quantity_space[self.value_index]
+
+            if not self.is_min():
+                self._set_global_index(self._neighbour(-1))
                 self.delta -= 1
 
         # Subtract a number and origin of effect (influence, proportionality)
@@ -140,48 +237,56 @@ class Quantifiable:
             effect, value = other
             assert value == 1, "You can only subtract one to a quantifiable."
 
-            if self.value_index != 0:
+            if not self.is_min():
                 self.delta -= 1
-                self.aggregations.append((effect, self.quantity_space[self.value_index - 1]))
+                self.aggregations += ((effect, GLOBAL_QUANTITY_SPACE[self._neighbour(-1)]), )
 
         return self
 
     def __isub__(self, other):
         return self.__sub__(other)
 
+    def __copy__(self):
+        # Only copy the value, pending aggregations and the watchers belong to the original
+        quantifiable = Quantifiable.__new__(Quantifiable)
+        quantifiable.space, quantifiable.global_index = self.space, self.global_index
+        quantifiable.type, quantifiable.strict = self.type, self.strict
+        quantifiable.delta, quantifiable.aggregations = 0, ()
+        quantifiable.watchers = ()
+        return quantifiable
+
+    def __getstate__(self):
+        # Watchers are bound to the States owning this quantifiable and are not pickled
+        return self.space, self.global_index, self.type, self.strict, self.delta, self.aggregations
+
+    def __setstate__(self, state):
+        self.space, self.global_index, self.type, self.strict, self.delta, self.aggregations = state
+        self.watchers = ()
+
     def __str__(self):
         return self.value
 
     def __eq__(self, other):
         if type(other) == str:
-            return str(self) == other
-        return self == other
-
-    def __setattr__(self, key, value):
-        if key == "value" and not self.init_stage and self.strict:
-            assert value == "?" or abs(self.global_value_index - GLOBAL_QUANTITY_SPACE.index(value)) < 2, \
-                "Value assignment to Quantifiable would create a discontinuity"
+            return self.value == other
+        if type(other) == Quantifiable:
+            return self.global_index == other.global_index
+        return NotImplemented
 
-            if type(value) == tuple:
-                value_, effect = value
-                self.aggregations.append((effect, value_))
-                return
-            elif type(value) == int:
-                self.delta += GLOBAL_QUANTITY_SPACE.index(value) - self.global_value_index
-
-        super().__setattr__(key, value)
+    __hash__ = None
 
 
 class Quantity:
     """
     Class modeling a quantity of a inflow, outflow or volume.
     """
+    __slots__ = ("model", "_magnitude", "_derivative")
+
     def __init__(self, model, magnitude="0", derivative="0"):
         assert model in QUANTITY_SPACES.keys(), "Unknown model"
 
-        self.init_phase = True
         self.model = model
-        self.quantity_space = QUANTITY_SPACES[model]
+        self._magnitude, self._derivative = None, None
 
         assert magnitude in self.quantity_space, "Invalid value for magnitude: {}".format(magnitude)
         assert derivative in QUANTITY_SPACE_DERIVATIVE, "Invalid value for derivative: {}".format(derivative)
@@ -196,7 +301,28 @@ class Quantity:
         self.derivative = Quantifiable(
             value=derivative, quantity_space=QUANTITY_SPACE_DERIVATIVE, quant_type="derivative"
         )
-        self.init_phase = False
+
+    @property
+    def quantity_space(self):
+        return QUANTITY_SPACES[self.model]
+
+    # Assigning a string to magnitude or derivative changes the value of the Quantifiable, assigning a Quantifiable
+    # replaces it
+    @property
+    def magnitude(self):
+        return self._magnitude
+
+    @magnitude.setter
+    def magnitude(self, value):
+        self._magnitude = self._assign(self._magnitude, value)
+
+    @property
+    def derivative(self):
+        return self._derivative
+
+    @derivative.setter
+    def derivative(self, value):
+        self._derivative = self._assign(self._derivative, value)
 
     def update(self):
         branches = set()
@@ -211,27 +337,29 @@ class Quantity:
         return branches
 
     def __copy__(self):
-        return Quantity(self.model, str(self.magnitude), str(self.derivative))
+        quantity = Quantity.__new__(Quantity)
+        quantity.model = self.model
+        quantity._magnitude, quantity._derivative = self._magnitude.__copy__(), self._derivative.__copy__()
+        return quantity
+
+    @classmethod
+    def _assign(cls, quantifiable, value):
+        if type(value) != Quantifiable:
+            quantifiable.value = value
+            return quantifiable
+
+        if quantifiable is not None and quantifiable is not value:
+            cls._transfer_watchers(quantifiable, value)
+
+        return value
+
+    @staticmethod
+    def _transfer_watchers(old_quantifiable, new_quantifiable):
+        for watcher, shift in old_quantifiable.live_watchers():
+            new_quantifiable.watch(watcher, shift)
+
+            if old_quantifiable.global_index != new_quantifiable.global_index:
+                watcher(shift, old_quantifiable.global_index, new_quantifiable.global_index)
 
     def __str__(self):
         return "{}, {}".format(self.magnitude, self.derivative)
-
-    def __setattr__(self, key, value):
-        # Sorry, pretty hacky
-        if key == "magnitude" and not self.init_phase:
-            self.init_phase = True
-            if type(value) == Quantifiable:
-                self.magnitude = value
-            else:
-                self.magnitude.value = value
-        elif key == "derivative" and not self.init_phase:
-            self.init_phase = True
-            if type(value) == Quantifiable:
-                self.derivative = value
-            else:
-                self.derivative.value = value
-        elif key != "init_phase":
-            super().__setattr__(key, value)
-            self.init_phase = False
-        else:
-            super().__setattr__(key, value)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining queries on the state graph which only expand the states they actually need.
+"""
+
+# STD
+import heapq
+import itertools
+
+# CONST
+MAX_STEPS_PER_TRANSITION = 2  # Consequences and value correspondences can move a magnitude by two values at most
+
+
+def distance_bound(encoding, code, target_code):
+    """
+    Return a lower bound of the number of transitions needed to get from one state to another. In one transition,
+    every magnitude and derivative moves by at most two values (e.g. a consequence followed by a value correspondence
+    or an ambiguous derivative jumping from "-" to "+"), so the largest difference of any quantity bounds the number
+    of transitions.
+    """
+    magnitudes, derivatives = encoding.decode(code)
+    target_magnitudes, target_derivatives = encoding.decode(target_code)
+    difference = max(
+        max(abs(value - target_value) for value, target_value in zip(magnitudes, target_magnitudes)),
+        max(abs(value - target_value) for value, target_value in zip(derivatives, target_derivatives))
+    )
+    return -(-difference // MAX_STEPS_PER_TRANSITION)
+
+
+def next_states(envisioner, code):
+    """
+    Return the successors of a state without the state itself.
+    """
+    return [new_code for new_code in envisioner.successors(code) if new_code != code]
+
+
+def find_path(envisioner, start_code, target_code, max_depth=None):
+    """
+    Find a shortest path between two states using A* search with distance_bound() as heuristic, so states leading away
+    from the target are expanded last or not at all. Returns the list of codes on the path (including start and target)
+    or None if the target can not be reached (within max_depth transitions).
+    """
+    encoding = envisioner.encoding
+    tie_breaker = itertools.count()  # Avoid comparing codes for equal priorities, keep insertion order
+    parents = {start_code: None}
+    depths = {start_code: 0}
+    queue = [(distance_bound(encoding, start_code, target_code), next(tie_breaker), start_code)]
+
+    while len(queue) != 0:
+        _, _, code = heapq.heappop(queue)
+
+        if code == target_code:
+            path = []
+            while code is not None:
+                path.append(code)
+                code = parents[code]
+            return path[::-1]
+
+        depth = depths[code] + 1
+        for new_code in next_states(envisioner, code):
+            if new_code in depths and depths[new_code] <= depth:
+                continue
+
+            estimate = depth + distance_bound(encoding, new_code, target_code)
+            if max_depth is not None and estimate > max_depth:
+                continue
+
+            parents[new_code], depths[new_code] = code, depth
+            heapq.heappush(queue, (estimate, next(tie_breaker), new_code))
+
+    return None
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining the envisionment of many scenarios, i.e. initial states of the same model, in a single pass.
+"""
+
+# STD
+import array
+import collections
+
+# PROJECT
+from behaviors import iter_behaviors
+from graphstore import GraphStore, INDEX_TYPE
+
+
+class ScenarioSet:
+    """
+    Class holding the envisionment of several scenarios of the same model. All scenarios are envisioned by a single
+    breadth-first search with a shared set of visited states, so states reachable from many scenarios are only
+    expanded once and stored once in a shared GraphStore. The state graph of every single scenario is available as a
+    ScenarioView on this store.
+    """
+    def __init__(self, store, sources, names=None):
+        self.store = store
+        self.sources = sources  # State id of the initial state of every scenario
+        self.names = list(names) if names is not None else list(range(len(sources)))
+        self._name_indices = {name: index for index, name in enumerate(self.names)}
+        self._views = {}
+
+    @classmethod
+    def envision(cls, envisioner, initial_codes, names=None):
+        """
+        Envision all states reachable from any of the initial states (packed codes) with an envisioner supporting
+        iter_envision_many().
+        """
+        initial_codes = list(initial_codes)
+        store = GraphStore.from_envisioner_many(envisioner, initial_codes)
+
+        if hasattr(envisioner, "canonicalize"):  # Scenarios start at their representatives under symmetry reduction
+            initial_codes = [envisioner.canonicalize(code)[0] for code in initial_codes]
+
+        return cls(store, [store.id_of(code) for code in initial_codes], names=names)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+    def __getitem__(self, key):
+        """
+        Return the view of a scenario, given by its index or name.
+        """
+        index = self._name_indices[key] if key in self._name_indices else key
+
+        if index not in self._views:
+            self._views[index] = ScenarioView(self.store, self.sources[index], name=self.names[index])
+
+        return self._views[index]
+
+    def coverage(self):
+        """
+        Return the number of scenarios every state can be reached from, e.g. to find states common to all scenarios.
+        """
+        counts = array.array(INDEX_TYPE, bytes(self.store.num_states * array.array(INDEX_TYPE).itemsize))
+
+        for view in self:
+            for state_id in view.state_ids:
+                counts[state_id] += 1
+
+        return counts
+
+
+class ScenarioView:
+    """
+    Class presenting the part of a shared GraphStore that is reachable from the initial state of one scenario. Since
+    this part is closed under transitions, successors are taken from the store directly; only the ids of the member
+    states are computed (on first use).
+    """
+    def __init__(self, store, source, name=None):
+        self.store = store
+        self.source = source
+        self.name = name
+        self._state_ids = None
+        self._members = None
+
+    @property
+    def state_ids(self):
+        """
+        Ids of all states of the scenario in breadth-first order, starting with its initial state.
+        """
+        if self._state_ids is None:
+            self._state_ids = array.array(INDEX_TYPE, self.store.reachable([self.source]))
+        return self._state_ids
+
+    @property
+    def num_states(self):
+        return len(self.state_ids)
+
+    @property
+    def num_transitions(self):
+        return sum(len(self.store.successors(state_id)) for state_id in self.state_ids)
+
+    def __len__(self):
+        return self.num_states
+
+    def __contains__(self, state_id):
+        if self._members is None:
+            self._members = bytearray(self.store.num_states)
+            for member in self.state_ids:
+                self._members[member] = 1
+        return bool(self._members[state_id])
+
+    def successors(self, state_id):
+        return self.store.successors(state_id)
+
+    def edges(self):
+        """
+        Iterate over all transitions of the scenario as pairs of state ids.
+        """
+        for state_id in self.state_ids:
+            for target in self.store.successors(state_id):
+                yield state_id, target
+
+    def result(self):
+        """
+        Return the states and transitions of the scenario as packed codes, in the format of
+        PackedEnvisioner.envision(). Use StateGraph.materialize() to turn them into State objects.
+        """
+        codes = self.store.codes
+        transitions = collections.defaultdict(list)
+
+        for start, end in self.edges():
+            transitions[codes[start]].append(codes[end])
+
+        return [codes[state_id] for state_id in self.state_ids], transitions
+
+    def iter_behaviors(self, **kwargs):
+        """
+        Enumerate the behaviors of the scenario, see behaviors.iter_behaviors().
+        """
+        return iter_behaviors(self.store, source=self.source, **kwargs)
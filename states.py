@@ -5,82 +5,499 @@ Module defining the state graph.
 
 # STD
 import copy
+import functools
 import itertools
 import collections
 
 # PROJECT
-from quantities import get_global_quantity_index
+from encoding import SLOT_BITS, VALUE_BITS, StateEncoding, uid_from_code
+from engine import PackedEnvisioner, STATE_EVENT, TRANSITION_EVENT
+from graphstore import GraphStore
+from incremental import IncrementalEnvisioner, same_quantities
+from behaviors import iter_behaviors
+from budget import BudgetedEnvisioner
+from cache import SuccessorCache
+from checkpoint import ResumableEnvisioner
+from composition import ComposedEnvisioner
+from profiling import ProfilingEnvisioner
+from program import compile_rules
+from quantities import GLOBAL_INDICES, GLOBAL_QUANTITY_SPACE
+from queries import find_path, next_states
 from relationships import Consequence, ValueCorrespondence
-from visualization import StateGraphPrintingMixin
+from scenarios import ScenarioSet
+from symmetry import SymmetryReducedEnvisioner
+from tracing import PrintingSink, Tracer, TracingEnvisioner
+from printing import StateGraphPrintingMixin
 
 
 class StateGraph(StateGraphPrintingMixin):
     """
     Class to model a state graph, i.e. a graph with states as nodes and transitions between those same nodes as edges.
     """
-    def __init__(self, initial_state, inter_state, intra_state, verbosity=0):
+    def __init__(self, initial_state, inter_state, intra_state, verbosity=0, engine="object", cache=None,
+                 persistent_cache=None, metrics=None, tracer=None, symmetry=False,
+                 compose=False, incremental=False, checkpoint=None, budget=None, order="bfs", priority=None):
+        assert engine in ("object", "packed", "vectorized"), "Unknown engine"
+        assert not (incremental and (symmetry or compose)), "Incremental envisioning only works on the full model"
+        assert not (incremental and checkpoint), "Incremental envisionments can not be checkpointed"
+        assert not (metrics is not None and (symmetry or compose or incremental or engine == "vectorized")), \
+            "Metrics are only collected by the serial packed engine"
+        assert not (tracer is not None and (symmetry or compose or incremental or metrics is not None)), \
+            "Tracers only observe the serial packed engine"
+        assert not ((budget is not None or order != "bfs") and (incremental or checkpoint)), \
+            "Budgets and exploration orders can not be combined with incremental or checkpointed envisionments"
         self.initial_state = initial_state
         self.entities = initial_state.entities
         self.inter_state = inter_state  # Inter-state relationships
         self.intra_state = intra_state  # Intra-state relationships
+        self._consequences = [relationship for relationship in intra_state if isinstance(relationship, Consequence)]
+        self._value_correspondences = [
+            relationship for relationship in intra_state if isinstance(relationship, ValueCorrespondence)
+        ]
         self.states, self.transitions = None, None
         self.verbosity = verbosity
+        self.engine = engine
+        self.cache = cache  # Optional SuccessorCache used by the packed engine
+        self.persistent_cache = persistent_cache  # Optional EnvisionmentCache storing results on disk
+        self.metrics = metrics  # Optional EnvisionMetrics collected by the packed engine
+        self.tracer = tracer  # Optional Tracer recording events of the envisionment, replaces verbosity > 1 prints
+        self.symmetry = symmetry  # Only envision one representative of states differing by interchangeable entities
+        self._symmetry_envisioner = None
+        self._graph_store = None
+        self.compose = compose  # Expand independent subsystems of the model separately
+        self.incremental = incremental  # Remember expansions so update() only expands states affected by an edit
+        self._incremental_envisioner = None
+        self.checkpoint = checkpoint  # Optional Checkpointer periodically writing the progress of the envisionment
+        self.budget = budget  # Optional Budget limiting the states, depth, time and memory of the envisionment
+        self.order = order  # Exploration order of the envisionment, see budget.ORDERS
+        self.priority = priority  # Priority of states on packed codes for the best-first order
+        self.frontier, self.exhausted = set(), None  # Uids of unexpanded states and exceeded limit of the budget
+        self._encoding, self._program = None, None
+        self._lazy_envisioner = None
+
+    @property
+    def program(self):
+        """
+        RuleProgram (and StateEncoding) of this model used by the packed engines, compiled on first use.
+        """
+        if self._program is None:
+            self._program = compile_rules(self.encoding, self.inter_state, self.intra_state)
+        return self._program
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            self._encoding = StateEncoding(self.initial_state)
+        return self._encoding
+
+    @property
+    def initial_code(self):
+        return self.encoding.encode(self.initial_state)
+
+    def envision(self, workers=None, resume_from=None):
+        """
+        Envision all states reachable from the initial state. If a number of workers is given, the state expansion is
+        distributed over as many processes using the packed engine. If resume_from is the path of a checkpoint (see
+        checkpoint.Checkpointer), the envisionment continues where the checkpoint left off.
+
+        With a budget (see budget.Budget), the envisionment stops once a limit is exceeded and returns the partial state
+        graph. The uids of discovered states that were not expanded are kept in frontier, the exceeded limit in
+        exhausted.
+        """
+        assert resume_from is None or not self._budgeted, "Budgeted envisionments can not be resumed"
 
-    def envision(self):
         if not (self.states or self.transitions):  # Do some caching of results
-            self.states, self.transitions = self._envision(verbosity=self.verbosity)
+            if self.engine == "object" and workers is None and resume_from is None and not self._requires_packed_engine:
+                self.states, self.transitions = self._envision(verbosity=self.verbosity)
+            else:
+                self.states, self.transitions = self._envision_packed(
+                    verbosity=self.verbosity, workers=workers, resume_from=resume_from
+                )
         return self.states, self.transitions
 
+    @property
+    def _requires_packed_engine(self):
+        return self.symmetry or self.compose or self.incremental or self._budgeted or any(
+            option is not None for option in (self.cache, self.persistent_cache, self.metrics, self.checkpoint)
+        )
+
+    @property
+    def _budgeted(self):
+        return self.budget is not None or self.order != "bfs"
+
+    def _envision_packed(self, verbosity=0, workers=None, resume_from=None):
+        """
+        Perform the envisionment on packed integer states (one by one or a whole frontier at once) and only create
+        State objects for the final result.
+        """
+        program = self.program
+        envisioner = self.create_envisioner(workers=workers)
+        initial_code = self.initial_code
+        # Only full graphs are stored, incremental envisionments need all expansions
+        persistent_cache = self.persistent_cache if not (self.symmetry or self.incremental) else None
+        result = None
+
+        if self.symmetry:
+            self._symmetry_envisioner = envisioner
+
+        if persistent_cache is not None and not self._budgeted:  # A stored graph would ignore the budget
+            result = persistent_cache.load(program, initial_code)
+
+        frontier = ()
+        if result is None:
+            if self._budgeted:
+                result = BudgetedEnvisioner(
+                    self._serial_envisioner(envisioner), budget=self.budget, order=self.order, priority=self.priority
+                ).envision(initial_code)
+                frontier, self.exhausted = result.frontier, result.exhausted
+                result = result[:2]
+            elif self.checkpoint is not None or resume_from is not None:
+                resumable_envisioner = ResumableEnvisioner(
+                    self._serial_envisioner(envisioner), checkpointer=self.checkpoint
+                )
+                result = resumable_envisioner.envision(initial_code, resume_from=resume_from)
+            else:
+                result = envisioner.envision(initial_code)
+
+            if persistent_cache is not None and len(frontier) == 0:  # Partial state graphs are not stored
+                persistent_cache.store(program, initial_code, *result)
+
+        states, transitions = self.materialize(*result)
+        self.frontier = {self.encoding.uid(code) for code in frontier}
+
+        if verbosity > 0:
+            self._print_transition_table(transitions)
+            self._print_state_table(states)
+            print("\n{} state(s) and {} transitions detected.".format(len(states), len(transitions)))
+
+            if len(frontier) > 0:
+                print("{} state(s) left unexpanded ({} exceeded).".format(len(frontier), self.exhausted))
+
+        return states, transitions
+
+    def _serial_envisioner(self, envisioner):
+        """
+        Return an envisioner expanding single states for searches driven by their successors().
+        """
+        if not hasattr(envisioner, "successors") or isinstance(envisioner, TracingEnvisioner):
+            # Batch engines expand whole frontiers and tracing relies on iter_envision(), use the serial engine instead
+            envisioner = PackedEnvisioner(self.program, cache=self.cache)
+
+        return envisioner
+
+    def graph_store(self, workers=None):
+        """
+        Envision the state graph into a compact GraphStore without creating any State objects. If the state graph was
+        already envisioned, its states and transitions are reused. With a persistent cache, this is the fast way to
+        start warm: The stored arrays are used as they are, while envision() has to create a State for every state.
+        """
+        if self._graph_store is None:
+            result = None
+
+            if self.states is None and self._budgeted:
+                self.envision()  # Stay within the budget
+
+            if self.states is not None:
+                result = (
+                    [state.code for state in self.states.values()],
+                    {start.code: [end.code for end in ends] for start, ends in self.transitions.items()}
+                )
+            elif self.persistent_cache is not None and not self.symmetry:
+                self._graph_store = self.persistent_cache.load_store(self.program, self.initial_code)
+
+            if result is not None:
+                self._graph_store = GraphStore.from_result(self.encoding, *result)
+            elif self._graph_store is None:
+                self._graph_store = GraphStore.from_envisioner(self.create_envisioner(workers), self.initial_code)
+
+                if self.persistent_cache is not None and not (self.symmetry or self.incremental):
+                    self.persistent_cache.store_graph(self.program, self.initial_code, self._graph_store)
+
+        return self._graph_store
+
+    def iter_behaviors(self, targets=None, materialize=False, **kwargs):
+        """
+        Enumerate the behaviors of the model, i.e. paths from the initial state to the given target states (State
+        objects or uids) or, without targets, to terminal states and back into themselves. Targets that are not
+        reachable from the initial state are skipped. See behaviors.iter_behaviors() for the remaining options. States
+        along the paths are given as ids of the graph_store() unless materialize is True.
+        """
+        store = self.graph_store()
+
+        if targets is not None:
+            target_ids = []
+            for target in targets:
+                try:
+                    target_ids.append(store.id_of(self._to_code(target)))
+                except KeyError:
+                    continue  # Not reachable, so no behavior ends in this target
+
+            if len(target_ids) == 0:
+                return
+
+            targets = target_ids
+
+        for behavior in iter_behaviors(store, source=0, targets=targets, **kwargs):
+            if materialize:
+                behavior = behavior._replace(states=[store.materialize(state_id) for state_id in behavior.states])
+            yield behavior
+
+    def envision_scenarios(self, initial_states):
+        """
+        Envision several scenarios of this model, given as a list of initial states (State objects or uids) or a dict
+        mapping scenario names to initial states, in a single pass. Returns a ScenarioSet with a view on the state graph
+        of every scenario; all of them share one GraphStore, so common states are only expanded and stored once.
+        """
+        names = list(initial_states.keys()) if isinstance(initial_states, dict) else None
+        initial_states = list(initial_states.values()) if names is not None else list(initial_states)
+
+        for state in initial_states:
+            assert isinstance(state, str) or list(state.entity_names) == self.encoding.entity_names, \
+                "Scenarios have to consist of the same entities as the initial state"
+
+        envisioner = self.create_envisioner()
+        if not hasattr(envisioner, "iter_envision_many"):
+            envisioner = PackedEnvisioner(self.program, cache=self.cache)  # Batch engines only start from one state
+
+        return ScenarioSet.envision(envisioner, [self._to_code(state) for state in initial_states], names=names)
+
+    def export(self, file, format=None, workers=None):
+        """
+        Stream the state graph into a file (path or file object) in one of the formats of export.FORMATS, determined by
+        the file extension unless given. A graph_store() that was already built is exported as is, otherwise the
+        envisionment is streamed into the file directly. Returns the numbers of states and transitions.
+        """
+        # Import here so exporters are only loaded when actually exporting
+        from export import export_envisionment, export_store
+
+        if self._graph_store is not None:
+            return export_store(self._graph_store, file, format=format)
+
+        return export_envisionment(self.create_envisioner(workers), self.initial_code, file, format=format)
+
+    def update(self, inter_state=None, intra_state=None, initial_state=None):
+        """
+        Edit the model by replacing its relationships and / or its initial state and envision it again, only expanding
+        states affected by the edit (requires incremental=True). Changes to quantities or quantity spaces lead to a full
+        envisionment. Returns an EnvisionmentDiff with the packed codes of added and removed states and transitions.
+        """
+        assert self.incremental, "State graph was not created with incremental=True"
+        self.envision()  # Previous envisionment to start from
+        old_encoding, old_states = self.encoding, {state.code: state for state in self.states.values()}
+
+        if initial_state is not None:
+            self.initial_state, self.entities = initial_state, initial_state.entities
+        if inter_state is not None:
+            self.inter_state = inter_state
+        if intra_state is not None:
+            self.intra_state = intra_state
+            self._consequences = [relationship for relationship in intra_state if isinstance(relationship, Consequence)]
+            self._value_correspondences = [
+                relationship for relationship in intra_state if isinstance(relationship, ValueCorrespondence)
+            ]
+
+        self._encoding, self._program = None, None
+        self._graph_store, self._lazy_envisioner = None, None
+        envisioner = self._incremental_envisioner
+        diff = envisioner.update(self.program, self.initial_code)
+        known = old_states if same_quantities(old_encoding, self.encoding) else None
+        self.states, self.transitions = self.materialize(envisioner.states, envisioner.transitions, known=known)
+
+        return diff
+
+    def create_envisioner(self, workers=None):
+        """
+        Create the packed envisioner matching the settings of this state graph. Incremental, symmetry reduced and
+        compositional envisioning take precedence over all other settings. Tracing replaces the parallel and vectorized
+        engines by the serial one, since events are recorded state by state. Verbose event printing (verbosity > 1) is
+        skipped for engines that can not be traced, which only print the tables of states and transitions then.
+        """
+        reduced = self.symmetry or self.compose or self.incremental
+        tracer = self.tracer
+        if tracer is None and not reduced and self.metrics is None:
+            tracer = self.create_tracer(self.verbosity)
+
+        if self.metrics is not None:
+            assert not (reduced or self.engine == "vectorized") and workers is None, \
+                "Metrics are only collected by the serial packed engine"
+
+        if tracer is not None:
+            assert not reduced, "Tracers only observe the serial packed engine"
+            return TracingEnvisioner(self.program, tracer, cache=self.cache)
+
+        if self.incremental:
+            if self._incremental_envisioner is None:
+                self._incremental_envisioner = IncrementalEnvisioner(self.program)
+            return self._incremental_envisioner
+
+        if self.symmetry:
+            return SymmetryReducedEnvisioner(self.program, cache=self.cache)
+
+        if self.compose:
+            return ComposedEnvisioner(self.program, self.inter_state, self.intra_state, cache=self.cache)
+
+        if workers is not None:
+            # Import here so multiprocessing is only loaded when distributing the envisionment
+            from parallel import ParallelEnvisioner
+            return ParallelEnvisioner(self.program, workers)
+
+        if self.engine == "vectorized":
+            # Import here so numpy is only required when actually using the vectorized engine
+            from vectorized import BatchEnvisioner
+            return BatchEnvisioner(self.program)
+
+        if self.metrics is not None:
+            return ProfilingEnvisioner(self.program, metrics=self.metrics, cache=self.cache)
+
+        return PackedEnvisioner(self.program, cache=self.cache)
+
+    def create_tracer(self, verbosity=0):
+        """
+        Return the tracer of this state graph or, if there is none, a tracer printing events for a verbosity greater
+        than 1.
+        """
+        if self.tracer is not None:
+            return self.tracer
+
+        if verbosity > 1:
+            return Tracer(PrintingSink(self.encoding, self.program.value_correspondence_labels, verbosity))
+
+        return None
+
+    def materialize(self, codes, code_transitions, known=None):
+        """
+        Turn the packed states and transitions produced by an envisioner into the format returned by envision(). State
+        objects can be reused from a dict of known states by their codes.
+        """
+        encoding = self.encoding
+        known = known if known is not None else {}
+        materialized = {code: known[code] if code in known else encoding.materialize(code) for code in codes}
+        if self.initial_code in materialized:
+            materialized[self.initial_code] = self.initial_state
+        states = {state.uid: state for state in materialized.values()}
+
+        transitions = collections.defaultdict(list)
+        for start, ends in code_transitions.items():
+            transitions[materialized[start]] = [materialized[end] for end in ends]
+
+        return states, transitions
+
+    def expand_symmetries(self):
+        """
+        Return the full state graph of a model envisioned with symmetry reduction. envision() only returns one
+        representative of every group of states that differ by a permutation of interchangeable entities, which is
+        expanded here without applying any relationships again.
+        """
+        assert self.symmetry, "State graph was not envisioned with symmetry reduction"
+        self.envision()
+
+        return self.materialize(*self._symmetry_envisioner.expand(self.initial_code))
+
+    def iter_envision(self, materialize=True):
+        """
+        Envision the state graph step by step, yielding ("state", state) for every newly discovered state and
+        ("transition", start, end) for every transition as soon as they are found. Only the packed codes of visited
+        states are kept in memory, so the consumer decides what to retain and can stop at any point.
+
+        If materialize is False, uids are yielded instead of State objects.
+        """
+        encoding = self.encoding
+        envisioner = self.lazy_envisioner if self.compose else PackedEnvisioner(self.program, cache=self.cache)
+        convert = encoding.materialize if materialize else encoding.uid
+        last_code, last_start = None, None  # Transitions from the same state are found one after another
+
+        for event in envisioner.iter_envision(self.initial_code):
+            if event[0] == STATE_EVENT:
+                yield STATE_EVENT, convert(event[1])
+            else:
+                _, start_code, end_code = event
+
+                if start_code != last_code:
+                    last_code, last_start = start_code, convert(start_code)
+
+                yield TRANSITION_EVENT, last_start, convert(end_code)
+
+    @property
+    def lazy_envisioner(self):
+        """
+        Envisioner used to answer queries without a full envisionment. All queries share its cache of successors.
+        """
+        if self._lazy_envisioner is None:
+            cache = self.cache if self.cache is not None else SuccessorCache()
+
+            if self.compose:
+                self._lazy_envisioner = ComposedEnvisioner(
+                    self.program, self.inter_state, self.intra_state, cache=cache
+                )
+            else:
+                self._lazy_envisioner = PackedEnvisioner(self.program, cache=cache)
+        return self._lazy_envisioner
+
+    def successors(self, state):
+        """
+        Return the successors of a state (given as State or uid) by only expanding this state.
+        """
+        return [
+            self.encoding.materialize(code) for code in next_states(self.lazy_envisioner, self._to_code(state))
+        ]
+
+    def is_reachable(self, target, max_depth=None):
+        """
+        Check whether a state (given as State or uid) can be reached from the initial state, optionally within
+        max_depth transitions.
+        """
+        return self.find_path(target, max_depth=max_depth) is not None
+
+    def find_path(self, target, max_depth=None):
+        """
+        Return a shortest list of states leading from the initial state to the target (given as State or uid) or None
+        if it can not be reached. Only expands states that are promising to lead to the target.
+        """
+        path = find_path(self.lazy_envisioner, self.initial_code, self._to_code(target), max_depth=max_depth)
+        return None if path is None else [self.encoding.materialize(code) for code in path]
+
+    def _to_code(self, state):
+        if isinstance(state, str):
+            return self.encoding.from_uid(state)
+        return self.encoding.encode(state)
+
     def _envision(self, verbosity=0):
         states = {self.initial_state.uid: self.initial_state}
         transitions = collections.defaultdict(list)
         state_stack = [self.initial_state]
+        tracer = self.create_tracer(verbosity)
+        vc_schedule = self._schedule_value_correspondences()
 
         while len(state_stack) != 0:
             current_state = state_stack.pop(0)
-
-            if verbosity > 2:
-                print(
-                    "Current state: [ {} ] | Stack size: {} | States so far: {} | Transitions so far: {}".format(
-                        current_state.readable_id, len(state_stack), len(states), len(transitions)
-                    )
-                )
+            traced = tracer is not None and tracer.begin_expansion(
+                current_state.code, len(state_stack), len(states), len(transitions)
+            )
 
             # Step 1: Apply consequences
             implied_state = self._apply_consequences(current_state)
-            if verbosity > 2: print("After consequences: [ {} ]".format(implied_state.readable_id))
+            if traced: tracer.consequences(implied_state.code)
+            on_discontinuity = functools.partial(
+                self._trace_rejected, tracer, current_state.code, implied_state.code
+            ) if traced else None
 
             # Step 2: Aggregate incoming influences and proportionalities for every entity
             implied_state.apply_rules(self.inter_state)
 
             # Step 3: Perform derivative calculus and update quantities, branch if necessary
-            raw_branches = implied_state.update()
-            branches = [self.construct_state_from_raw_quantities(current_state, branch) for branch in raw_branches]
-            if verbosity > 2: print("Possible branches:\n\t{}".format(
-                "\n\t".join(["[ {} ]".format(branch.readable_id) for branch in branches]))
-            )
+            branch_options = implied_state.branch_options()
 
-            for new_state in branches:
-                # Step 4: Apply value correspondences again if possible
-                try:
-                    new_state = self._apply_vcs(new_state)
-                except AssertionError:
-                    if verbosity > 2:
-                        print("State {} discarded due to discontinues by value correspondences.".format(
-                            new_state.readable_id)
-                        )
-                    continue  # Discontinuity
+            # Step 4: Apply value correspondences while enumerating branches, prune discontinuous ones early
+            for magnitudes, derivatives in self._iter_branches(branch_options, vc_schedule, on_discontinuity):
+                new_state = self._construct_state(current_state, magnitudes, derivatives)
+                if traced: tracer.branch(current_state.code, new_state.code)
 
                 if current_state.uid != new_state.uid:
-                    if verbosity > 1:
-                        print("New transition: [ {} ] ----> [ {} ]".format(
-                            current_state.readable_id, new_state.readable_id)
-                        )
+                    if traced: tracer.transition(current_state.code, new_state.code)
                     transitions[current_state].append(new_state)
 
                 if new_state.uid not in states:
-                    if verbosity > 1:
-                        print("New state: [ {} ]".format(new_state.readable_id))
+                    if traced: tracer.new_state(new_state.code)
                     states[new_state.uid] = new_state
                     state_stack.append(new_state)
 
@@ -99,21 +516,83 @@ class StateGraph(StateGraphPrintingMixin):
 
         return state
 
-    def _apply_vcs(self, state):
-        state = copy.copy(state)
+    def _schedule_value_correspondences(self):
+        """
+        Assign every compiled value correspondence to the slot after which it can be applied to a partial branch: All
+        quantities it refers to and all quantities referred to by the value correspondences before it (which might
+        change their magnitudes) have to be fixed.
+        """
+        schedule = [[] for _ in range(self.encoding.size)]
+        last_slot = -1
+
+        for index, value_correspondence in enumerate(self.program.value_correspondences):
+            source, target, _, _ = value_correspondence
+            last_slot = max(last_slot, source, target)
+            schedule[last_slot].append((index, ) + value_correspondence)
+
+        return schedule
+
+    @staticmethod
+    def _iter_branches(branch_options, vc_schedule, on_discontinuity=None):
+        """
+        Lazily enumerate the combinations of possible magnitudes and derivatives of all quantities in the same order as
+        State.update() and yield them as lists of global indices after applying value correspondences. Partial
+        combinations are discarded as soon as a value correspondence would create a discontinuity, which is reported to
+        on_discontinuity with the index of the value correspondence and the magnitudes and derivatives of the partial
+        combination.
+        """
+        size = len(branch_options)
+
+        def extend(slot, magnitudes, derivatives):
+            if slot == size:
+                yield magnitudes, derivatives
+                return
+
+            for magnitude, derivative in branch_options[slot]:
+                new_magnitudes = magnitudes + [magnitude]
+
+                for index, source, target, source_magnitude, target_magnitude in vc_schedule[slot]:
+                    if new_magnitudes[source] == source_magnitude and new_magnitudes[target] != target_magnitude:
+                        if abs(new_magnitudes[target] - target_magnitude) > 1:
+                            if on_discontinuity is not None:
+                                on_discontinuity(index, new_magnitudes, derivatives + [derivative])
+                            break  # Discontinuity
+
+                        new_magnitudes[target] = target_magnitude
+                else:
+                    yield from extend(slot + 1, new_magnitudes, derivatives + [derivative])
+
+        return extend(0, [], [])
+
+    def _trace_rejected(self, tracer, parent, implied_code, index, magnitudes, derivatives):
+        """
+        Trace a partial branch rejected by the value correspondence with the given index. Slots the branch did not
+        reach yet keep the values of the implied state.
+        """
+        implied_magnitudes, implied_derivatives = self.encoding.decode(implied_code)
+        num_slots = len(magnitudes)
+        rejected_code = self.encoding.encode_values(
+            magnitudes + implied_magnitudes[num_slots:], derivatives + implied_derivatives[num_slots:]
+        )
+        tracer.rejected(parent, rejected_code, index)
 
-        for value_correspondence in self.value_correspondences:
-            state = value_correspondence.apply(state)
+    @staticmethod
+    def _construct_state(state, magnitudes, derivatives):
+        new_state = copy.copy(state)
 
-        return state
+        for quantity, magnitude, derivative in zip(new_state._quantities, magnitudes, derivatives):
+            quantity.magnitude.replace(GLOBAL_QUANTITY_SPACE[magnitude])
+            quantity.derivative.replace(GLOBAL_QUANTITY_SPACE[derivative])
+
+        return new_state
 
     @property
     def consequences(self):
-        return [relationship for relationship in self.intra_state if isinstance(relationship, Consequence)]
+        return self._consequences
 
     @property
     def value_correspondences(self):
-        return [relationship for relationship in self.intra_state if isinstance(relationship, ValueCorrespondence)]
+        return self._value_correspondences
 
     @property
     def nodes(self):
@@ -122,7 +601,6 @@ class StateGraph(StateGraphPrintingMixin):
 
     @property
     def edges(self):
-        self.envision()
         _, transitions = self.envision()
 
         for start in transitions:
@@ -130,67 +608,81 @@ class StateGraph(StateGraphPrintingMixin):
             for end in ends:
                 yield (start, end)
 
-    def construct_state_from_raw_quantities(self, state, raw_quantities):
-        new_state = copy.copy(state)
-        raw_quantities = list(raw_quantities)
-
-        flattened_quantities = self.flatten_quantity_list(raw_quantities)
-
-        for entity in new_state.entities:
-            for quantity in entity.quantities:
-                raw_quantity = flattened_quantities.pop(0)
-                quantity.magnitude.replace(raw_quantity[0])
-                quantity.derivative.replace(raw_quantity[1])
-
-        return new_state
-
-    def flatten_quantity_list(self, quantity_list):
-        el = quantity_list[0]
-        if type(el) == tuple and type(el[0]) == str:
-            return quantity_list
-
-        flatter_list = []
-        for element in quantity_list:
-            for ele in element:
-                flatter_list.append(ele)
-
-        return self.flatten_quantity_list(flatter_list)
-
 
 class State:
     """
-    Class to model a state in the state graph.
+    Class to model a state in the state graph. States are hashed by their packed code, which follows changes of their
+    quantities, so a State must not be mutated after it was hashed, e.g. after it was added to a dict or set.
     """
     def __init__(self, **entities):
         self.entity_names = entities.keys()
         self.entities = list(entities.values())
         vars(self).update(entities)
+        self._quantities = [quantity for entity in self.entities for quantity in entity.quantities]
+        self._layout = tuple(self.entity_names)
+        self._code, self._uid = None, None
+        self._watch_quantities()
 
     def update(self):
         entity_branches = [entity.update() for entity in self.entities]
 
         return list(itertools.product(*entity_branches))
 
+    def branch_options(self):
+        """
+        Perform the derivative calculus like update(), but return the possible global indices of (magnitude,
+        derivative) for every quantity instead of all their combinations.
+        """
+        return [
+            [(GLOBAL_INDICES[magnitude], GLOBAL_INDICES[derivative]) for magnitude, derivative in quantity.update()]
+            for quantity in self._quantities
+        ]
+
     def apply_rules(self, rules):
         return [rule.apply(self) for rule in rules]
 
     def __repr__(self):
         return "<State: {}>".format(self.readable_id)
 
+    @property
+    def code(self):
+        """
+        Packed integer identifying the state, see StateEncoding. It is cached and updated whenever the magnitude or
+        derivative of one of the state's quantities changes.
+        """
+        if self._code is None:
+            self._code = StateEncoding.encode_values(
+                [quantity.magnitude.global_value_index for quantity in self._quantities],
+                [quantity.derivative.global_value_index for quantity in self._quantities]
+            )
+        return self._code
+
     @property
     def uid(self):
-        return "".join(
-            [
-                "".join([
-                    "{}{}".format(
-                        get_global_quantity_index(quantity.magnitude),
-                        get_global_quantity_index(quantity.derivative)
-                    )
-                    for quantity in entity.quantities
-                ])
-                for entity in self.entities
-            ]
-        )
+        if self._uid is None:
+            self._uid = uid_from_code(self.code, len(self._quantities))
+        return self._uid
+
+    def _watch_quantities(self):
+        for slot, quantity in enumerate(self._quantities):
+            quantity.magnitude.watch(self._on_change, slot * SLOT_BITS)
+            quantity.derivative.watch(self._on_change, slot * SLOT_BITS + VALUE_BITS)
+
+    def _on_change(self, shift, old_index, new_index):
+        self._uid = None
+
+        if self._code is not None:
+            if old_index is None or new_index is None:
+                self._code = None  # Value outside of global quantity space, e.g. "?" during derivative calculus
+            else:
+                self._code ^= (old_index ^ new_index) << shift
+
+    def __eq__(self, other):
+        return isinstance(other, State) and self.code == other.code and self._layout == other._layout
+
+    def __hash__(self):
+        # Follows the values of the quantities, so mutating a hashed state corrupts the dicts and sets containing it
+        return hash(self.code)
 
     @property
     def readable_id(self):
@@ -215,6 +707,8 @@ class State:
         )
 
     def __copy__(self):
-        return State(**dict(zip(self.entity_names, [copy.copy(entity) for entity in self.entities])))
+        state = State(**dict(zip(self.entity_names, [entity.__copy__() for entity in self.entities])))
+        state._code, state._uid = self._code, self._uid  # Same values, same identity
+        return state
 
 
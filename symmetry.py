@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining symmetry reduction for models with interchangeable entities.
+"""
+
+# STD
+import collections
+
+# PROJECT
+from encoding import SLOT_BITS, SLOT_MASK
+from engine import PackedEnvisioner, STATE_EVENT, TRANSITION_EVENT
+from program import OP_INFLUENCE, OP_PROPORTION
+
+# CONST
+MAX_AUTOMORPHISMS = 5040  # Stop searching for more symmetries after finding as many (7!)
+
+
+def find_automorphisms(program, max_automorphisms=MAX_AUTOMORPHISMS):
+    """
+    Find all permutations of entities that leave the model unchanged, i.e. map entities onto entities of the same type
+    with the same quantities and every relationship onto a relationship of the same kind. Relationships depending on
+    each other are applied one after another, so their relative order has to be preserved as well.
+
+    Returns the permutations as tuples mapping every slot of a StateEncoding onto its image, starting with the
+    identity. If there are more than max_automorphisms, only the first ones found are returned, which still yields a
+    correct (but less reduced) state graph.
+    """
+    encoding = program.encoding
+    entity_slots, slot_entities = [], []
+    for entity, quantity_names in enumerate(encoding.quantity_names):
+        entity_slots.append(list(range(len(slot_entities), len(slot_entities) + len(quantity_names))))
+        slot_entities.extend([entity] * len(quantity_names))
+
+    program_parts = _program_parts(program)
+    signatures = [_signature(program, program_parts, entity, slots) for entity, slots in enumerate(entity_slots)]
+
+    # Relationships are checked as soon as all entities they connect are mapped
+    part_sets = [set(part) for part in program_parts]
+    checks = collections.defaultdict(list)
+    for part_index, part in enumerate(program_parts):
+        for item in part:
+            last_entity = max(slot_entities[slot] for slot in _item_slots(part_index, item))
+            checks[last_entity].append((part_index, item))
+
+    automorphisms = []
+    slot_images = [None] * encoding.size
+    used = [False] * len(entity_slots)
+
+    def extend(entity):
+        if len(automorphisms) >= max_automorphisms:
+            return
+
+        if entity == len(entity_slots):
+            if all(_preserves_order(part_index, part, slot_images) for part_index, part in enumerate(program_parts)):
+                automorphisms.append(tuple(slot_images))
+            return
+
+        for image in range(len(entity_slots)):
+            if used[image] or signatures[image] != signatures[entity]:
+                continue
+
+            used[image] = True
+            for slot, slot_image in zip(entity_slots[entity], entity_slots[image]):
+                slot_images[slot] = slot_image
+
+            if all(
+                _map_item(part_index, item, slot_images) in part_sets[part_index]
+                for part_index, item in checks[entity]
+            ):
+                extend(entity + 1)
+
+            used[image] = False
+
+    extend(0)
+    return automorphisms
+
+
+def _program_parts(program):
+    # Consequences are compared without their step tables, which are determined by the quantity space of the slot
+    return [
+        [(slot, trigger) for slot, trigger, _ in program.consequences],
+        list(program.rules),
+        list(program.value_correspondences)
+    ]
+
+
+def _item_slots(part_index, item):
+    if part_index == 0:
+        return item[0],  # Consequence: (slot, trigger)
+    elif part_index == 1:
+        return item[1], item[2]  # Rule: (opcode, source, target, direction)
+    return item[0], item[1]  # Value correspondence: (source, target, source magnitude, target magnitude)
+
+
+def _map_item(part_index, item, slot_images):
+    if part_index == 0:
+        return slot_images[item[0]], item[1]
+    elif part_index == 1:
+        return item[0], slot_images[item[1]], slot_images[item[2]], item[3]
+    return (slot_images[item[0]], slot_images[item[1]]) + tuple(item[2:])
+
+
+def _signature(program, program_parts, entity, slots):
+    """
+    Describe an entity by everything an automorphism has to preserve, so only promising candidates are tried.
+    """
+    encoding = program.encoding
+    local_slots = {slot: position for position, slot in enumerate(slots)}
+    anonymous_slots = [0] * encoding.size  # Only keep the kind of relationship, not the slots it connects
+    roles = []
+
+    for part_index, part in enumerate(program_parts):
+        for item in part:
+            item_slots = _item_slots(part_index, item)
+            for role, slot in enumerate(item_slots):
+                if slot in local_slots:
+                    roles.append((part_index, _map_item(part_index, item, anonymous_slots), role, local_slots[slot]))
+
+    return (
+        encoding.entity_types[entity], tuple(encoding.quantity_names[entity]),
+        tuple(encoding.models[slot] for slot in slots), tuple(sorted(roles))
+    )
+
+
+def _preserves_order(part_index, part, slot_images):
+    """
+    Check that a permutation maps a list of relationships onto itself such that relationships sharing a slot are still
+    applied in the same order.
+    """
+    positions = collections.defaultdict(collections.deque)
+    for position, item in enumerate(part):
+        positions[item].append(position)
+
+    image_positions = []
+    for item in part:
+        candidates = positions.get(_map_item(part_index, item, slot_images))
+        if not candidates:
+            return False
+        image_positions.append(candidates.popleft())
+
+    for first in range(len(part)):
+        for second in range(first + 1, len(part)):
+            if image_positions[first] > image_positions[second] and _conflict(part_index, part[first], part[second]):
+                return False
+
+    return True
+
+
+def _conflict(part_index, first, second):
+    """
+    Check whether the result of applying two relationships depends on their order, i.e. one of them changes a value the
+    other one reads or changes as well.
+    """
+    if part_index == 0:
+        return first[0] == second[0]  # Consequences only touch their own slot
+
+    elif part_index == 1:
+        # Rules change the derivative (and its delta) of their target, proportionalities read the delta of their source.
+        # Influences in the same direction on the same target commute: Both add the same value to the aggregation.
+        first_opcode, first_source, first_target, first_direction = first
+        second_opcode, second_source, second_target, second_direction = second
+        commuting = first_opcode == second_opcode == OP_INFLUENCE and first_direction == second_direction
+        return (first_target == second_target and not commuting) or \
+            (first_opcode == OP_PROPORTION and first_source == second_target) or \
+            (second_opcode == OP_PROPORTION and second_source == first_target)
+
+    # Value correspondences change the magnitude of their target
+    return first[1] in second[:2] or second[1] in first[:2]
+
+
+def permute_code(code, moved_slots, fixed_mask):
+    """
+    Apply a slot permutation, given as the (slot, image) pairs of all slots that are moved and a mask of the bits of
+    all other slots, to a packed state.
+    """
+    permuted = code & fixed_mask
+
+    for slot, image in moved_slots:
+        permuted |= ((code >> (slot * SLOT_BITS)) & SLOT_MASK) << (image * SLOT_BITS)
+
+    return permuted
+
+
+class SymmetryReducedEnvisioner(PackedEnvisioner):
+    """
+    PackedEnvisioner exploring only one canonical representative (the smallest code) of every set of states that only
+    differ by a permutation of interchangeable entities. envision() thus returns the quotient graph, in which
+    transitions between symmetric states show up as self-loops and are therefore omitted. The actual successors of
+    every representative are kept, so expand() can restore the full state graph without applying any rules.
+    """
+    def __init__(self, program, automorphisms=None, cache=None):
+        super().__init__(program, cache=cache)
+        self.automorphisms = automorphisms if automorphisms is not None else find_automorphisms(program)
+        self._permutations = [self._compile_permutation(automorphism) for automorphism in self.automorphisms]
+        self._inverse_permutations = [
+            self._compile_permutation(self._invert(automorphism)) for automorphism in self.automorphisms
+        ]
+        self._representative_successors = {}
+
+    @staticmethod
+    def _compile_permutation(automorphism):
+        moved_slots = [(slot, image) for slot, image in enumerate(automorphism) if slot != image]
+        fixed_mask = 0
+        for slot, image in enumerate(automorphism):
+            if slot == image:
+                fixed_mask |= SLOT_MASK << (slot * SLOT_BITS)
+
+        return moved_slots, fixed_mask
+
+    @staticmethod
+    def _invert(automorphism):
+        inverse = [0] * len(automorphism)
+        for slot, image in enumerate(automorphism):
+            inverse[image] = slot
+
+        return tuple(inverse)
+
+    def canonicalize(self, code):
+        """
+        Return the canonical representative of a state and the index of the automorphism mapping the state onto it.
+        """
+        best_code, best_index = code, 0
+
+        for index in range(1, len(self._permutations)):
+            permuted = permute_code(code, *self._permutations[index])
+            if permuted < best_code:
+                best_code, best_index = permuted, index
+
+        return best_code, best_index
+
+    def iter_envision_many(self, initial_codes):
+        """
+        Perform a breadth-first search on the quotient graph, starting from the representatives of the initial states.
+        """
+        return super().iter_envision_many([self.canonicalize(initial_code)[0] for initial_code in initial_codes])
+
+    def successors(self, code):
+        """
+        Return the distinct representatives of all successors of a state.
+        """
+        successors = self.actual_successors(code)
+        representatives = []
+
+        for successor in successors:
+            representative, _ = self.canonicalize(successor)
+            if representative not in representatives:
+                representatives.append(representative)
+
+        return representatives
+
+    def actual_successors(self, code):
+        """
+        Return the successors of a state without canonicalizing them. Results for representatives are kept for
+        expand().
+        """
+        successors = self._representative_successors.get(code)
+
+        if successors is None:
+            successors = super().successors(code)
+            self._representative_successors[code] = successors
+
+        return successors
+
+    def expand(self, initial_code):
+        """
+        Restore the full state graph reachable from the initial state. Returns all states in the order of discovery
+        and the transitions between them like PackedEnvisioner.envision().
+        """
+        states = []
+        transitions = collections.defaultdict(list)
+
+        for event in self.iter_expand(initial_code):
+            if event[0] == STATE_EVENT:
+                states.append(event[1])
+            else:
+                transitions[event[1]].append(event[2])
+
+        return states, transitions
+
+    def iter_expand(self, initial_code):
+        """
+        Perform a breadth-first search on the full state graph, yielding the same events as iter_envision(). The
+        successors of a state are obtained by mapping it onto its representative, looking up the successors of the
+        representative and mapping them back.
+        """
+        visited = {initial_code}
+        state_stack = collections.deque([initial_code])
+        yield STATE_EVENT, initial_code
+
+        while len(state_stack) != 0:
+            current_code = state_stack.popleft()
+            representative, index = self.canonicalize(current_code)
+            inverse_permutation = self._inverse_permutations[index]
+
+            for new_code in self.actual_successors(representative):
+                if index != 0:
+                    new_code = permute_code(new_code, *inverse_permutation)
+
+                if new_code != current_code:
+                    yield TRANSITION_EVENT, current_code, new_code
+
+                if new_code not in visited:
+                    visited.add(new_code)
+                    state_stack.append(new_code)
+                    yield STATE_EVENT, new_code
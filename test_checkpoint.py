@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining round-trip tests for checkpoints and resumed envisionments.
+"""
+
+# STD
+import os
+import tempfile
+import unittest
+
+# PROJECT
+from checkpoint import Checkpointer, ResumableEnvisioner, read_checkpoint, write_checkpoint
+from engine import PackedEnvisioner
+from generator import build_state_graph
+
+
+class Interruption(Exception):
+    pass
+
+
+class InterruptedEnvisioner(PackedEnvisioner):
+    """
+    Class simulating a crash after a given number of expanded states.
+    """
+    def __init__(self, program, num_expansions):
+        super().__init__(program)
+        self.num_expansions = num_expansions
+
+    def successors(self, code):
+        if self.num_expansions == 0:
+            raise Interruption()
+
+        self.num_expansions -= 1
+        return super().successors(code)
+
+
+class CheckpointTest(unittest.TestCase):
+    """
+    Class testing that checkpoints are read as they were written and that resumed envisionments match uninterrupted
+    ones.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "envisionment.ckpt")
+        self.state_graph = build_state_graph(1, 2)
+        self.program, self.initial_code = self.state_graph.program, self.state_graph.initial_code
+        self.states, self.transitions = PackedEnvisioner(self.program).envision(self.initial_code)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        num_expanded = 10
+        transitions = {code: self.transitions[code] for code in self.states[:num_expanded] if code in self.transitions}
+        write_checkpoint(self.path, self.program, self.states, num_expanded, transitions)
+        checkpoint = read_checkpoint(self.path)
+
+        self.assertEqual(checkpoint.fingerprint, self.program.fingerprint)
+        self.assertEqual(checkpoint.states, list(self.states))
+        self.assertEqual(checkpoint.num_expanded, num_expanded)
+        self.assertEqual(dict(checkpoint.transitions), transitions)
+
+    def test_resume(self):
+        for num_expansions in (15, 20, 45, 82):
+            with self.subTest(num_expansions=num_expansions):
+                checkpointer = Checkpointer(self.path, every=10, seconds=None)
+                interrupted = ResumableEnvisioner(
+                    InterruptedEnvisioner(self.program, num_expansions), checkpointer=checkpointer
+                )
+                with self.assertRaises(Interruption):
+                    interrupted.envision(self.initial_code)
+
+                self.assertEqual(read_checkpoint(self.path).num_expanded, num_expansions // 10 * 10)
+
+                resumed = ResumableEnvisioner(PackedEnvisioner(self.program), checkpointer=checkpointer)
+                states, transitions = resumed.envision(self.initial_code, resume_from=self.path)
+                self.assertEqual(list(states), list(self.states))
+                self.assertEqual(dict(transitions), dict(self.transitions))
+                self.assertFalse(os.path.exists(self.path))  # Removed once the envisionment is complete
+
+    def test_resume_state_graph(self):
+        checkpointer = Checkpointer(self.path, every=10, seconds=None, keep=True)
+        state_graph = build_state_graph(1, 2, checkpoint=checkpointer)
+        states, _ = state_graph.envision()
+
+        self.assertGreater(checkpointer.num_written, 0)
+        resumed_states, _ = build_state_graph(1, 2).envision(resume_from=self.path)
+        self.assertEqual(list(resumed_states), list(states))
+
+    def test_mismatch(self):
+        write_checkpoint(self.path, self.program, [self.initial_code], 0, {})
+
+        with self.assertRaises(ValueError):
+            build_state_graph(1, 3).envision(resume_from=self.path)
+
+    def test_corrupted(self):
+        write_checkpoint(self.path, self.program, self.states, len(self.states), self.transitions)
+
+        with open(self.path, "rb") as file:
+            data = file.read()
+
+        for corrupted in (data[:5], data[:len(data) // 2], b"\0" * len(data)):
+            with open(self.path, "wb") as file:
+                file.write(corrupted)
+
+            with self.subTest(size=len(corrupted)), self.assertRaises(ValueError):
+                read_checkpoint(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining tests checking that all envisionment engines find the same state graph as the object engine.
+"""
+
+# STD
+import importlib.util
+import unittest
+
+# PROJECT
+from budget import Budget
+from engine import PackedEnvisioner
+from generator import build_model
+from graph import init_extra_points_state_graph, init_minimum_viable_state_graph
+from states import StateGraph
+
+
+# CONST
+MODELS = {
+    "minimal": lambda: _relationships_of(init_minimum_viable_state_graph()),
+    "extra": lambda: _relationships_of(init_extra_points_state_graph()),
+    "chain": lambda: build_model(1, 2, "chain"),
+    "parallel": lambda: build_model(2, 2, "parallel"),
+}
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+def _relationships_of(state_graph):
+    return state_graph.initial_state, state_graph.inter_state, state_graph.intra_state
+
+
+def graph_signature(states, transitions):
+    """
+    Return the uids of all states and all transitions between them, independent of the order in which they were found.
+    """
+    return set(states), {(start.uid, end.uid) for start, ends in transitions.items() for end in ends}
+
+
+def envision_model(model_name, workers=None, **kwargs):
+    state_graph = StateGraph(*MODELS[model_name](), **kwargs)
+    return graph_signature(*state_graph.envision(workers=workers))
+
+
+class EngineEquivalenceTest(unittest.TestCase):
+    """
+    Class testing every engine against the state graphs of the object engine.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.baselines = {model_name: envision_model(model_name) for model_name in MODELS}
+
+    def assert_equivalent(self, workers=None, **kwargs):
+        for model_name, baseline in self.baselines.items():
+            with self.subTest(model=model_name):
+                self.assertEqual(envision_model(model_name, workers=workers, **kwargs), baseline)
+
+    def test_baselines(self):
+        self.assertEqual([len(self.baselines[name][0]) for name in ("minimal", "extra", "chain")], [10, 10, 83])
+        self.assertEqual([len(self.baselines[name][1]) for name in ("minimal", "extra")], [13, 13])
+
+    def test_packed(self):
+        self.assert_equivalent(engine="packed")
+
+    @unittest.skipUnless(HAS_NUMPY, "The vectorized engine requires numpy")
+    def test_vectorized(self):
+        self.assert_equivalent(engine="vectorized")
+
+    def test_parallel(self):
+        self.assert_equivalent(workers=2)
+
+    def test_compose(self):
+        self.assert_equivalent(compose=True)
+
+    def test_symmetry(self):
+        for model_name, baseline in self.baselines.items():
+            with self.subTest(model=model_name):
+                state_graph = StateGraph(*MODELS[model_name](), symmetry=True)
+                quotient_states, _ = state_graph.envision()
+                self.assertLessEqual(set(quotient_states), baseline[0])
+                self.assertEqual(graph_signature(*state_graph.expand_symmetries()), baseline)
+
+    def test_unbounded_budget(self):
+        for order in ("bfs", "dfs", "best"):
+            with self.subTest(order=order):
+                self.assert_equivalent(budget=Budget(), order=order, priority=lambda code: code & 0xFF)
+
+    def test_exhausted_budget(self):
+        state_graph = StateGraph(*MODELS["chain"](), budget=Budget(max_states=20))
+        states, transitions = state_graph.envision()
+        baseline_states, baseline_transitions = self.baselines["chain"]
+
+        self.assertEqual(state_graph.exhausted, "max_states")
+        self.assertTrue(0 < len(state_graph.frontier) < len(states) < len(baseline_states))
+        self.assertLessEqual(set(states), baseline_states)
+        self.assertLessEqual(graph_signature(states, transitions)[1], baseline_transitions)
+        self.assertFalse(state_graph.frontier & {start.uid for start in transitions})
+
+    def test_incremental(self):
+        self.assert_equivalent(incremental=True)
+
+    def test_incremental_update(self):
+        initial_state, inter_state, intra_state = MODELS["chain"]()
+        state_graph = StateGraph(initial_state, inter_state, intra_state, incremental=True)
+        state_graph.envision()
+
+        edits = [
+            (inter_state[1:], intra_state),  # Remove a relationship
+            (inter_state[::-1], intra_state[::-1]),  # Reorder all relationships
+            (inter_state, intra_state),  # Restore the original model
+        ]
+        for edited_inter_state, edited_intra_state in edits:
+            state_graph.update(inter_state=list(edited_inter_state), intra_state=list(edited_intra_state))
+            baseline = StateGraph(initial_state, list(edited_inter_state), list(edited_intra_state)).envision()
+            self.assertEqual(graph_signature(state_graph.states, state_graph.transitions), graph_signature(*baseline))
+
+    def test_graph_store(self):
+        for engine in ("packed", "vectorized") if HAS_NUMPY else ("packed", ):
+            state_graph = StateGraph(*MODELS["chain"](), engine=engine)
+            store = state_graph.graph_store()
+            baseline_states, baseline_transitions = self.baselines["chain"]
+
+            with self.subTest(engine=engine):
+                self.assertEqual({store.uid(state_id) for state_id in range(store.num_states)}, baseline_states)
+                self.assertEqual(
+                    {
+                        (store.uid(state_id), store.uid(target))
+                        for state_id in range(store.num_states) for target in store.successors(state_id)
+                        if target != state_id
+                    },
+                    baseline_transitions
+                )
+
+    def test_successors(self):
+        state_graph = StateGraph(*MODELS["extra"]())
+        states, transitions = state_graph.envision()
+        envisioner = PackedEnvisioner(state_graph.program)
+
+        for uid, state in states.items():
+            successors = {state_graph.encoding.uid(code) for code in envisioner.successors(state.code)} - {uid}
+            self.assertEqual(successors, {end.uid for end in transitions.get(state, ())})
+
+
+if __name__ == "__main__":
+    unittest.main()
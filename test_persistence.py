@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining round-trip tests for the on-disk envisionment cache.
+"""
+
+# STD
+import os
+import tempfile
+import unittest
+
+# PROJECT
+from budget import Budget
+from engine import PackedEnvisioner
+from generator import build_state_graph
+from graphstore import GraphStore
+from persistence import EnvisionmentCache, pack_graph, unpack_arrays, unpack_graph
+
+
+class PackingTest(unittest.TestCase):
+    """
+    Class testing the serialization of states and transitions shared by the cache and checkpoints.
+    """
+    def setUp(self):
+        state_graph = build_state_graph(1, 2)
+        self.code_size = state_graph.encoding.code_size
+        self.states, self.transitions = PackedEnvisioner(state_graph.program).envision(state_graph.initial_code)
+
+    def test_round_trip(self):
+        chunks, num_transitions = pack_graph(self.states, self.transitions, self.code_size)
+        states, transitions = unpack_graph(
+            b"".join(chunks), 0, self.code_size, len(self.states), len(self.states), num_transitions
+        )
+
+        self.assertEqual(states, list(self.states))
+        self.assertEqual(dict(transitions), dict(self.transitions))
+
+    def test_round_trip_rows(self):
+        num_rows = len(self.states) // 2
+        chunks, num_transitions = pack_graph(self.states, self.transitions, self.code_size, num_rows=num_rows)
+        states, transitions = unpack_graph(
+            b"".join(chunks), 0, self.code_size, len(self.states), num_rows, num_transitions
+        )
+
+        self.assertEqual(states, list(self.states))
+        self.assertEqual(
+            dict(transitions),
+            {code: self.transitions[code] for code in self.states[:num_rows] if code in self.transitions}
+        )
+
+    def test_truncated(self):
+        chunks, num_transitions = pack_graph(self.states, self.transitions, self.code_size)
+        buffer = b"".join(chunks)
+
+        with self.assertRaises(ValueError):
+            unpack_arrays(buffer[:-1], 0, self.code_size, len(self.states), len(self.states), num_transitions)
+
+    def test_corrupted(self):
+        chunks, num_transitions = pack_graph(self.states, self.transitions, self.code_size)
+
+        with self.assertRaises(ValueError):
+            # Claim fewer states than transitions refer to
+            unpack_arrays(b"".join(chunks), 0, self.code_size, 1, len(self.states), num_transitions)
+
+
+class EnvisionmentCacheTest(unittest.TestCase):
+    """
+    Class testing that envisionments come out of the EnvisionmentCache just like they went in.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = EnvisionmentCache(self.directory.name)
+        self.state_graph = build_state_graph(1, 2)
+        self.program, self.initial_code = self.state_graph.program, self.state_graph.initial_code
+        self.states, self.transitions = PackedEnvisioner(self.program).envision(self.initial_code)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_store_load(self):
+        self.assertIsNone(self.cache.load(self.program, self.initial_code))
+        self.cache.store(self.program, self.initial_code, self.states, self.transitions)
+
+        self.assertIn((self.program, self.initial_code), self.cache)
+        states, transitions = self.cache.load(self.program, self.initial_code)
+        self.assertEqual(states, list(self.states))
+        self.assertEqual(dict(transitions), dict(self.transitions))
+
+    def test_store_load_store(self):
+        self.cache.store(self.program, self.initial_code, self.states, self.transitions)
+        store = self.cache.load_store(self.program, self.initial_code)
+        expected = GraphStore.from_result(self.state_graph.encoding, self.states, self.transitions)
+
+        self.assertEqual(store.codes, expected.codes)
+        self.assertEqual(list(store.offsets), list(expected.offsets))
+        self.assertEqual(list(store.targets), list(expected.targets))
+
+    def test_store_graph(self):
+        expected = GraphStore.from_result(self.state_graph.encoding, self.states, self.transitions)
+        self.cache.store_graph(self.program, self.initial_code, expected)
+        states, transitions = self.cache.load(self.program, self.initial_code)
+
+        self.assertEqual(states, list(self.states))
+        self.assertEqual(dict(transitions), dict(self.transitions))
+
+    def test_keys(self):
+        self.cache.store(self.program, self.initial_code, self.states, self.transitions)
+        other_program = build_state_graph(1, 3).program
+
+        self.assertIsNone(self.cache.load(self.program, self.states[1]))
+        self.assertIsNone(self.cache.load(other_program, self.initial_code))
+
+    def test_corrupted_files_are_misses(self):
+        self.cache.store(self.program, self.initial_code, self.states, self.transitions)
+        path = self.cache.path(self.program, self.initial_code)
+
+        with open(path, "rb") as file:
+            data = file.read()
+
+        for corrupted in (data[:len(data) // 2], b"\0" * len(data), data[:4]):
+            with open(path, "wb") as file:
+                file.write(corrupted)
+
+            with self.subTest(size=len(corrupted)):
+                self.assertIsNone(self.cache.load(self.program, self.initial_code))
+                self.assertIsNone(self.cache.load_store(self.program, self.initial_code))
+
+    def test_clear(self):
+        self.cache.store(self.program, self.initial_code, self.states, self.transitions)
+        self.cache.clear()
+
+        self.assertNotIn((self.program, self.initial_code), self.cache)
+
+    def test_warm_start(self):
+        def state_graph(**kwargs):
+            return build_state_graph(1, 2, persistent_cache=self.cache, **kwargs)
+
+        cold_states, cold_transitions = state_graph().envision()
+        self.assertTrue(os.path.exists(self.cache.path(self.program, self.initial_code)))
+
+        warm_states, warm_transitions = state_graph().envision()
+        self.assertEqual(list(warm_states), list(cold_states))
+        self.assertEqual(
+            {start.uid: [end.uid for end in ends] for start, ends in warm_transitions.items()},
+            {start.uid: [end.uid for end in ends] for start, ends in cold_transitions.items()}
+        )
+
+        warm_store = state_graph().graph_store()
+        self.assertEqual([warm_store.uid(state_id) for state_id in range(warm_store.num_states)], list(cold_states))
+
+        budgeted = state_graph(budget=Budget(max_states=20))
+        budgeted.envision()
+        self.assertEqual(budgeted.exhausted, "max_states")
+
+    def test_model_edits_are_misses(self):
+        self.cache.store(self.program, self.initial_code, self.states, self.transitions)
+        edited = build_state_graph(1, 2, value_correspondences=False, persistent_cache=self.cache)
+
+        self.assertNotEqual(edited.program.fingerprint, self.program.fingerprint)
+        self.assertIsNone(self.cache.load(edited.program, edited.initial_code))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining a structured, low-overhead trace of the envisionment and tools to replay it.
+"""
+
+# STD
+import argparse
+import collections
+import struct
+
+# PROJECT
+from engine import PackedEnvisioner, STATE_EVENT
+
+# CONST
+EXPANDED = 0  # State is expanded; values: stack size, number of states, number of transitions
+CONSEQUENCES = 1  # State after applying consequences
+BRANCH = 2  # Branch produced by the derivative calculus
+REJECTED = 3  # Branch rejected by a value correspondence; values: -, -, index of value correspondence (-1 if unknown)
+TRANSITION = 4  # New transition from code to other
+NEW_STATE = 5  # New state was discovered
+
+TraceEvent = collections.namedtuple("TraceEvent", ["kind", "expansion", "code", "other", "values"])
+
+FILE_MAGIC = b"PPTR"
+FORMAT_VERSION = 1
+FILE_HEADER = struct.Struct("<4sHH40s")  # Magic, format version, bytes per state code, model fingerprint
+RECORD_HEADER = struct.Struct("<BIIIi")  # Kind, expansion, three values
+
+
+class Tracer:
+    """
+    Class recording events of the envisionment into a sink. Events only contain packed codes and integers, rendering
+    them as text is deferred to PrintingSink or the replay() function.
+
+    With sample_every=n, only every n-th expansion of a state is traced (including all its branches, transitions and
+    new states), which keeps the overhead negligible even for large models.
+    """
+    def __init__(self, sink, sample_every=1):
+        assert sample_every > 0, "Sampling interval has to be positive"
+        self.sink = sink
+        self.sample_every = sample_every
+        self.expansion = -1
+        self.sampled = False
+
+    def begin_expansion(self, code, stack_size, num_states, num_transitions):
+        """
+        Start tracing the expansion of a new state. Returns whether the events of this expansion are recorded, so
+        callers can skip collecting data for the other events.
+        """
+        self.expansion += 1
+        self.sampled = self.expansion % self.sample_every == 0
+
+        if self.sampled:
+            self.sink.write(TraceEvent(EXPANDED, self.expansion, code, 0, (stack_size, num_states, num_transitions)))
+
+        return self.sampled
+
+    def record(self, kind, code, other=0, values=(0, 0, 0)):
+        if self.sampled:
+            self.sink.write(TraceEvent(kind, self.expansion, code, other, values))
+
+    def consequences(self, code):
+        self.record(CONSEQUENCES, code)
+
+    def branch(self, parent, code):
+        self.record(BRANCH, parent, code)
+
+    def rejected(self, parent, code, value_correspondence=-1):
+        self.record(REJECTED, parent, code, (0, 0, value_correspondence))
+
+    def transition(self, start, end):
+        self.record(TRANSITION, start, end)
+
+    def new_state(self, code):
+        self.record(NEW_STATE, code)
+
+    def close(self):
+        self.sink.close()
+
+
+class RingBufferSink:
+    """
+    Sink keeping the most recent events in memory.
+    """
+    def __init__(self, capacity=100000):
+        self.events = collections.deque(maxlen=capacity)
+
+    def write(self, event):
+        self.events.append(event)
+
+    def close(self):
+        pass
+
+    def __iter__(self):
+        return iter(self.events)
+
+
+class BinaryLogSink:
+    """
+    Sink writing events as fixed-size binary records to a file. The file starts with the fingerprint of the model, so
+    it can only be replayed with the same model.
+    """
+    def __init__(self, path, program):
+        self.code_size = program.encoding.code_size
+        self.file = open(path, "wb")
+        self.file.write(FILE_HEADER.pack(
+            FILE_MAGIC, FORMAT_VERSION, self.code_size, program.fingerprint.encode("ascii")
+        ))
+
+    def write(self, event):
+        self.file.write(RECORD_HEADER.pack(event.kind, event.expansion, *event.values))
+        self.file.write(event.code.to_bytes(self.code_size, "little"))
+        self.file.write(event.other.to_bytes(self.code_size, "little"))
+
+    def close(self):
+        self.file.close()
+
+
+class PrintingSink:
+    """
+    Sink immediately printing events in the format of the verbosity settings of StateGraph: Transitions and new states
+    are printed for a verbosity greater than 1, everything else for a verbosity greater than 2.
+    """
+    def __init__(self, encoding, value_correspondence_labels=(), verbosity=3):
+        self.encoding = encoding
+        self.value_correspondence_labels = value_correspondence_labels
+        self.verbosity = verbosity
+        self.branched_expansion = None  # Last expansion that produced a branch
+
+    def write(self, event):
+        line = self.render(event)
+
+        if line is not None:
+            print(line)
+
+        if event.kind == BRANCH:
+            self.branched_expansion = event.expansion
+
+    def render(self, event):
+        readable_id = self.encoding.readable_id
+
+        if event.kind in (TRANSITION, NEW_STATE) and self.verbosity <= 1:
+            return None
+        if event.kind not in (TRANSITION, NEW_STATE) and self.verbosity <= 2:
+            return None
+
+        if event.kind == EXPANDED:
+            return "Current state: [ {} ] | Stack size: {} | States so far: {} | Transitions so far: {}".format(
+                readable_id(event.code), *event.values
+            )
+        elif event.kind == CONSEQUENCES:
+            return "After consequences: [ {} ]".format(readable_id(event.code))
+        elif event.kind == BRANCH:
+            line = "\t[ {} ]".format(readable_id(event.other))
+            return line if self.branched_expansion == event.expansion else "Possible branches:\n" + line
+        elif event.kind == REJECTED:
+            value_correspondence = event.values[2]
+            line = "State {} discarded due to discontinues by value correspondences.".format(readable_id(event.other))
+            if 0 <= value_correspondence < len(self.value_correspondence_labels):
+                line += " ({})".format(self.value_correspondence_labels[value_correspondence])
+            return line
+        elif event.kind == TRANSITION:
+            return "New transition: [ {} ] ----> [ {} ]".format(readable_id(event.code), readable_id(event.other))
+        elif event.kind == NEW_STATE:
+            return "New state: [ {} ]".format(readable_id(event.code))
+
+    def close(self):
+        pass
+
+
+class TracingEnvisioner(PackedEnvisioner):
+    """
+    PackedEnvisioner that reports its progress to a Tracer. Like in the object engine, branches are traced after the
+    value correspondences were applied. Because the packed engine applies them to all branches of a state at once, a
+    discontinuity is traced as a single REJECTED event for the rejected state, which has the magnitudes at the
+    discontinuity and the derivatives before the derivative calculus.
+    """
+    def __init__(self, program, tracer, cache=None):
+        super().__init__(program, cache=cache)
+        self.tracer = tracer
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self._current_code, self._last_start, self._implied_derivatives = None, None, None
+        self._num_states, self._num_expanded, self._num_transitions = 0, 0, 0
+
+    def iter_envision_many(self, initial_codes):
+        tracer = self.tracer
+        self._reset_counters()
+
+        for event in super().iter_envision_many(initial_codes):
+            if event[0] == STATE_EVENT:
+                self._num_states += 1
+                if self._num_expanded > 0:  # Initial states are not discovered by an expansion
+                    tracer.new_state(event[1])
+            else:
+                _, start, end = event
+                if start != self._last_start:
+                    self._num_transitions, self._last_start = self._num_transitions + 1, start
+                tracer.transition(start, end)
+
+            yield event
+
+    def successors(self, code):
+        # All events of earlier expansions have been consumed by iter_envision_many() at this point
+        self._num_expanded += 1
+        self._current_code = code
+        sampled = self.tracer.begin_expansion(
+            code, self._num_states - self._num_expanded, self._num_states, self._num_transitions
+        )
+        successors = super().successors(code)
+
+        if sampled:
+            for new_code in successors:
+                self.tracer.branch(code, new_code)
+
+        return successors
+
+    def _apply_consequences(self, magnitudes, derivatives):
+        super()._apply_consequences(magnitudes, derivatives)
+        self._implied_derivatives = derivatives
+
+        if self.tracer.sampled:
+            self.tracer.consequences(self.encoding.encode_values(magnitudes, derivatives))
+
+    def _on_discontinuity(self, index, magnitudes):
+        if self.tracer.sampled:
+            rejected_code = self.encoding.encode_values(magnitudes, self._implied_derivatives)
+            self.tracer.rejected(self._current_code, rejected_code, index)
+
+
+def read_log(path, program):
+    """
+    Read the events of a binary trace log written for the given program.
+    """
+    code_size = program.encoding.code_size
+    record_size = RECORD_HEADER.size + 2 * code_size
+
+    with open(path, "rb") as file:
+        magic, version, file_code_size, fingerprint = FILE_HEADER.unpack(file.read(FILE_HEADER.size))
+
+        if magic != FILE_MAGIC or version != FORMAT_VERSION:
+            raise ValueError("{} is not a trace log".format(path))
+        if fingerprint.decode("ascii") != program.fingerprint or file_code_size != code_size:
+            raise ValueError("Trace log was written for a different model")
+
+        while True:
+            record = file.read(record_size)
+            if len(record) < record_size:
+                break
+
+            kind, expansion, *values = RECORD_HEADER.unpack_from(record)
+            code = int.from_bytes(record[RECORD_HEADER.size:RECORD_HEADER.size + code_size], "little")
+            other = int.from_bytes(record[RECORD_HEADER.size + code_size:], "little")
+            yield TraceEvent(kind, expansion, code, other, tuple(values))
+
+
+def replay(events, state_graph, verbosity=3):
+    """
+    Render traced events (from a RingBufferSink or read_log()) as human-readable text like an envisionment with the
+    given verbosity would have printed it, followed by the transition and state tables of all traced states.
+    """
+    encoding = state_graph.encoding
+    sink = PrintingSink(encoding, state_graph.program.value_correspondence_labels, verbosity)
+    states = {state_graph.initial_code: state_graph.initial_state}
+    transitions = collections.defaultdict(list)
+
+    for event in events:
+        sink.write(event)
+
+        if event.kind == NEW_STATE:
+            states[event.code] = encoding.materialize(event.code)
+        elif event.kind == TRANSITION:
+            for code in (event.code, event.other):
+                if code not in states:
+                    states[code] = encoding.materialize(code)
+            transitions[states[event.code]].append(states[event.other])
+
+    if verbosity > 0:
+        state_graph._print_transition_table(transitions)
+        state_graph._print_state_table({state.uid: state for state in states.values()})
+
+
+def _init_argparser():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("log", help="Path of the binary trace log.")
+    argparser.add_argument(
+        '--graph', "-g", choices=["minimal", "extra"], default="minimal",
+        help="Type of state graph the log was recorded for."
+    )
+    argparser.add_argument(
+        "--verbosity", "-v", type=int, choices=range(4), default=3,
+        help="Verbosity of the replayed output"
+    )
+    return argparser
+
+
+if __name__ == "__main__":
+    from graph import init_extra_points_state_graph, init_minimum_viable_state_graph
+    argparser = _init_argparser()
+    args = argparser.parse_args()
+
+    state_graph = init_minimum_viable_state_graph() if args.graph == "minimal" else init_extra_points_state_graph()
+    replay(read_log(args.log, state_graph.program), state_graph, verbosity=args.verbosity)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Module defining a vectorized envisioning engine that expands a whole breadth-first search frontier at once.
+"""
+
+# STD
+import collections
+
+# EXT
+import numpy as np
+
+# PROJECT
+from encoding import SLOT_BITS, VALUE_BITS
+from program import ADDITION, AMBIGUOUS, DERIVATIVE_STEPS, INFLUENCE_ACTIVE, OP_INFLUENCE
+
+# CONST
+SLOTS_PER_WORD = 63 // SLOT_BITS  # Number of slots that fit into a signed 64 bit integer
+MAX_OPTIONS = 3  # A derivative can branch into at most three values
+
+
+class BatchEnvisioner:
+    """
+    Class performing the envisionment layer by layer. The frontier is stored as two arrays of shape
+    (states x quantities) containing the global indices of magnitudes and derivatives, and all four steps of the
+    state expansion are performed as array operations on the whole frontier. The results are identical to the ones of
+    a PackedEnvisioner, including the order in which states and transitions are discovered.
+    """
+    def __init__(self, program):
+        self.program = program
+        self.encoding = program.encoding
+        self.addition = np.array(ADDITION, dtype=np.int8)
+        self.derivative_steps = {
+            direction: np.array(steps, dtype=np.int8) for direction, steps in DERIVATIVE_STEPS.items()
+        }
+        self.influence_active = np.array(INFLUENCE_ACTIVE, dtype=bool)
+        self.consequences = [
+            (slot, trigger, np.array(steps, dtype=np.int8)) for slot, trigger, steps in program.consequences
+        ]
+
+    def envision(self, initial_code):
+        """
+        Perform a breadth-first search from the initial state. Returns all discovered states in the order of discovery
+        and the transitions between them.
+        """
+        codes, offsets, targets = self.envision_arrays(initial_code)
+        target_codes = [codes[target] for target in targets.tolist()]
+        offsets = offsets.tolist()
+        transitions = collections.defaultdict(list)
+
+        for state_id in np.flatnonzero(np.diff(offsets)).tolist():
+            transitions[codes[state_id]] = target_codes[offsets[state_id]:offsets[state_id + 1]]
+
+        return codes, transitions
+
+    def envision_arrays(self, initial_code):
+        """
+        Perform a breadth-first search from the initial state. Returns the packed codes of all states in the order of
+        discovery and their transitions in compressed sparse row format: The successors of state i are the state ids
+        targets[offsets[i]:offsets[i + 1]] (both numpy arrays). Only children that differ from their parent and were
+        not visited before are converted into packed codes.
+        """
+        magnitudes, derivatives = self.encoding.decode(initial_code)
+        frontier = np.array([magnitudes + derivatives], dtype=np.int8)
+        visited_keys, visited_ids = self._keys(frontier).copy(), np.zeros(1, dtype=np.int64)  # Sorted by key
+        codes = [initial_code]
+        counts, targets = [], []  # Number of transitions of every state and their targets, layer by layer
+
+        while len(frontier) != 0:
+            parents, children = self.expand(frontier)
+
+            # Self-loops are not recorded and never lead to new states
+            changed = np.any(children != frontier[parents], axis=1)
+            parents, children = parents[changed], children[changed]
+
+            # Look up the ids of distinct children, new ones receive ids in order of discovery
+            keys = self._keys(children)
+            unique_keys, first_indices, inverse = np.unique(keys, return_index=True, return_inverse=True)
+            positions = np.searchsorted(visited_keys, unique_keys)
+            known = positions < len(visited_keys)
+            known[known] = visited_keys[positions[known]] == unique_keys[known]
+
+            unique_ids = np.empty(len(unique_keys), dtype=np.int64)
+            unique_ids[known] = visited_ids[positions[known]]
+            new = np.flatnonzero(~known)
+            new = new[np.argsort(first_indices[new], kind="stable")]
+            unique_ids[new] = np.arange(len(codes), len(codes) + len(new))
+
+            counts.append(np.bincount(parents, minlength=len(frontier)))
+            targets.append(unique_ids[inverse.ravel()])
+
+            frontier = children[first_indices[new]]
+            codes.extend(self.to_codes(frontier))
+
+            new.sort()  # Insert new keys in sorted order
+            visited_keys = np.insert(visited_keys, positions[new], unique_keys[new])
+            visited_ids = np.insert(visited_ids, positions[new], unique_ids[new])
+
+        offsets = np.concatenate([[0], np.cumsum(np.concatenate(counts))]).astype(np.int64)
+        return codes, offsets, np.concatenate(targets).astype(np.int64)
+
+    def expand(self, frontier):
+        """
+        Expand all states of the frontier. Returns the index of the parent state for every valid branch and the branches
+        themselves in the same layout as the frontier.
+        """
+        size = self.encoding.size
+        magnitudes = frontier[:, :size].copy()
+        derivatives = frontier[:, size:]
+
+        # Step 1: Apply consequences
+        for slot, trigger, steps in self.consequences:
+            triggered = derivatives[:, slot] == trigger
+            magnitudes[triggered, slot] = steps[magnitudes[triggered, slot]]
+
+        # Step 2 & 3: Aggregate influences and proportionalities and perform derivative calculus
+        options, option_counts = self._derivative_calculus(magnitudes, derivatives)
+
+        # Step 4: Apply value correspondences, discard discontinuous states
+        valid = self._apply_vcs(magnitudes)
+        option_counts[~valid] = 0
+
+        # Create branches in the same order as itertools.product would
+        branch_counts = np.prod(option_counts, axis=1)
+        parents = np.repeat(np.arange(len(frontier)), branch_counts)
+        offsets = np.cumsum(branch_counts) - branch_counts
+        local_indices = np.arange(len(parents)) - offsets[parents]
+
+        branch_derivatives = np.empty((len(parents), size), dtype=np.int8)
+        for slot in range(size - 1, -1, -1):
+            counts = option_counts[parents, slot]
+            branch_derivatives[:, slot] = options[parents, slot, local_indices % counts]
+            local_indices //= counts
+
+        return parents, np.concatenate([magnitudes[parents], branch_derivatives], axis=1)
+
+    def _derivative_calculus(self, magnitudes, derivatives):
+        num_states, size = derivatives.shape
+        deltas = np.zeros((num_states, size), dtype=np.int64)
+        aggregation_counts = np.zeros((num_states, size), dtype=np.int64)
+        current_values = derivatives.copy()
+        ambiguous = np.zeros((num_states, size), dtype=bool)
+        ambiguous_values = np.zeros((num_states, size), dtype=np.int8)
+
+        for opcode, source, target, direction in self.program.rules:
+            if opcode == OP_INFLUENCE:
+                active = self.influence_active[magnitudes[:, source]]
+                directions = np.full(num_states, direction)
+            else:
+                active = deltas[:, source] != 0
+                directions = np.where(deltas[:, source] > 0, direction, -direction)
+
+            new_values = np.where(
+                directions > 0,
+                self.derivative_steps[1][derivatives[:, target]],
+                self.derivative_steps[-1][derivatives[:, target]]
+            )
+            changed = active & (new_values != derivatives[:, target])
+            deltas[changed, target] += directions[changed]
+
+            # Fold aggregations with the addition table, stop at the first ambiguity like Quantifiable.update
+            first = changed & (aggregation_counts[:, target] == 0)
+            current_values[first, target] = new_values[first]
+
+            folding = changed & (aggregation_counts[:, target] > 0) & ~ambiguous[:, target]
+            results = self.addition[current_values[folding, target], new_values[folding]]
+            newly_ambiguous = np.zeros(num_states, dtype=bool)
+            newly_ambiguous[folding] = results == AMBIGUOUS
+            ambiguous_values[newly_ambiguous, target] = new_values[newly_ambiguous]
+            ambiguous[newly_ambiguous, target] = True
+            resolved = folding & ~newly_ambiguous
+            current_values[resolved, target] = results[results != AMBIGUOUS]
+
+            aggregation_counts[changed, target] += 1
+
+        # Ambiguous derivatives branch into the sorted set of the old value and the two conflicting ones
+        options = np.repeat(current_values[:, :, np.newaxis], MAX_OPTIONS, axis=2)
+        candidates = np.sort(np.stack([derivatives, current_values, ambiguous_values], axis=2), axis=2)
+        is_new = np.concatenate(
+            [np.ones((num_states, size, 1), dtype=bool), candidates[:, :, 1:] != candidates[:, :, :-1]], axis=2
+        )
+        option_counts = np.where(ambiguous, is_new.sum(axis=2), 1)
+
+        # Move the unique candidates to the front
+        order = np.argsort(~is_new, axis=2, kind="stable")
+        unique_candidates = np.take_along_axis(candidates, order, axis=2)
+        options[ambiguous] = unique_candidates[ambiguous]
+
+        return options, option_counts
+
+    def _apply_vcs(self, magnitudes):
+        valid = np.ones(len(magnitudes), dtype=bool)
+
+        for source, target, source_magnitude, target_magnitude in self.program.value_correspondences:
+            applies = (magnitudes[:, source] == source_magnitude) & (magnitudes[:, target] != target_magnitude)
+            valid &= ~(applies & (np.abs(magnitudes[:, target] - target_magnitude) > 1))
+            magnitudes[applies, target] = target_magnitude
+
+        return valid
+
+    def to_codes(self, rows):
+        """
+        Convert rows of global value indices into the packed codes of a StateEncoding.
+        """
+        size = self.encoding.size
+        slots = rows[:, :size] | (rows[:, size:] << VALUE_BITS)
+
+        if size <= SLOTS_PER_WORD:  # Codes fit into 64 bit integers
+            shifts = SLOT_BITS * np.arange(size, dtype=np.int64)
+            return np.bitwise_or.reduce(slots.astype(np.int64) << shifts, axis=1).tolist()
+
+        # Pack the bits of all slots into little endian bytes and convert every row with a single call
+        bits = (slots[:, :, np.newaxis] >> np.arange(SLOT_BITS, dtype=np.int8)) & 1
+        packed = np.packbits(bits.reshape(len(rows), size * SLOT_BITS).astype(np.uint8), axis=1, bitorder="little")
+        data, code_size = packed.tobytes(), packed.shape[1]
+
+        return [int.from_bytes(data[start:start + code_size], "little") for start in range(0, len(data), code_size)]
+
+    @staticmethod
+    def _keys(rows):
+        """
+        View every row as a single opaque value so rows can be deduplicated and looked up as a whole.
+        """
+        rows = np.ascontiguousarray(rows)
+        return rows.view(np.dtype((np.void, rows.shape[1]))).ravel()
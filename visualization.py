@@ -5,9 +5,15 @@ Module defining ways to visalize the state graph and the causal model.
 
 # STD
 import argparse
+import collections
+import concurrent.futures
 
-# EXT
-from graphviz import Digraph
+# PROJECT
+from printing import StateGraphPrintingMixin  # Formerly defined here
+
+# CONST
+# Cluster of every state (None if it is not part of one) and a description of every cluster
+Clustering = collections.namedtuple("Clustering", ["labels", "descriptions"])
 
 
 def _init_argparser():
@@ -20,43 +26,230 @@ def _init_argparser():
         "--verbosity", "-v", type=int, choices=range(4), default=1,
         help="Verbosity of state graph algorithm"
     )
+    argparser.add_argument(
+        "--cluster", "-c", nargs="+",
+        help="Collapse strongly connected components (scc) or states with the same values of the given quantities."
+    )
+    argparser.add_argument(
+        "--chunk-size", type=int,
+        help="Render the state graph in chunks of this many states in the background."
+    )
     return argparser
 
 
-def visualize_state_graph(state_graph, graph_type):
-    dot = Digraph(comment='State graph', format="png")
-    dot.attr(label="State Graph", fontsize="20")
+def _digraph(*args, **kwargs):
+    # Import here so graphviz is only required when actually rendering
+    from graphviz import Digraph
+    return Digraph(*args, **kwargs)
+
+
+def quantity_abbreviations(encoding):
+    """
+    Return a short name for every quantity of a model to use in labels: The initial of the quantity (like "V" for
+    volume) if it is unique within the model, otherwise prefixed with the name of its entity (like "container0.V").
+    """
+    initials = [slot.split(".")[1][0].upper() for slot in encoding.slots]
+
+    if len(set(initials)) == len(initials):
+        return initials
+
+    return ["{}.{}".format(slot.split(".")[0], initial) for slot, initial in zip(encoding.slots, initials)]
+
+
+def state_label(encoding, code, abbreviations=None):
+    """
+    Return the label of a state with the magnitude and derivative of every quantity, one per line.
+    """
+    abbreviations = abbreviations if abbreviations is not None else quantity_abbreviations(encoding)
+
+    return "".join(
+        "{}(M:{}, D:{})\n".format(abbreviation, magnitude, derivative)
+        for abbreviation, (magnitude, derivative) in zip(abbreviations, encoding.values(code))
+    )
+
+
+def neighborhood(store, center, radius=1, direction="both"):
+    """
+    Return the ids of all states of a GraphStore within radius transitions of the center state, following transitions
+    "forward", "backward" or in "both" directions. The center comes first, followed by the others in breadth-first
+    order.
+    """
+    assert direction in ("forward", "backward", "both"), "Unknown direction"
+    distances = {center: 0}
+    queue = collections.deque([center])
 
-    for node_uid, node in state_graph.nodes:
-        entries = node.readable_id.split("|")
-        values = entries[0].split()
-        node_data = "I(M:" + values[0] + ", D:" + values[1] + ")\n"
-        entry = entries[1].split(";")
-        if graph_type == "minimal":
-            values = entry[0].split()
-            node_data += "V(M:" + values[0] + ", D:" + values[1] + ")\n"
-            values = entries[2].split()
-            node_data += "O(M:" + values[0] + ", D:" + values[1] + ")\n"
-        else:
-            values = entry[0].split()
-            node_data += "V(M:" + values[0] + ", D:" + values[1] + ")\n"
-            values = entry[1].split()
-            node_data += "H(M:" + values[0] + ", D:" + values[1] + ")\n"
-            values = entry[2].split()
-            node_data += "P(M:" + values[0] + ", D:" + values[1] + ")\n"
-            values = entries[2].split()
-            node_data += "O(M:" + values[0] + ", D:" + values[1] + ")\n"
+    while len(queue) > 0:
+        state_id = queue.popleft()
+        if distances[state_id] == radius:
+            continue
 
-        dot.node(node_uid, node_data, shape="box", fontsize="10", style="filled", fillcolor="#DDDDDD")
+        neighbours = []
+        if direction in ("forward", "both"):
+            neighbours.extend(store.successors(state_id))
+        if direction in ("backward", "both"):
+            neighbours.extend(store.predecessors(state_id))
 
-    for start, target in state_graph.edges:
-        dot.edge(start.uid, target.uid)
+        for neighbour in neighbours:
+            if neighbour not in distances:
+                distances[neighbour] = distances[state_id] + 1
+                queue.append(neighbour)
+
+    return list(distances)
+
+
+def path_subgraph(store, path, radius=0):
+    """
+    Return the ids of the states along a path (e.g. from GraphStore.shortest_path() or a behavior), optionally
+    together with all states within radius transitions of it.
+    """
+    state_ids = dict.fromkeys(path)  # Use dict as insertion-ordered set
+
+    if radius > 0:
+        for state_id in path:
+            state_ids.update(dict.fromkeys(neighborhood(store, state_id, radius)))
+
+    return list(state_ids)
+
+
+def scc_clustering(store, min_size=2):
+    """
+    Collapse every strongly connected component with at least min_size states into a cluster.
+    """
+    labels, descriptions = [None] * store.num_states, []
+
+    for component in store.strongly_connected_components():
+        if len(component) >= min_size:
+            for state_id in component:
+                labels[state_id] = len(descriptions)
+            descriptions.append("SCC of {} states".format(len(component)))
+
+    return Clustering(labels=labels, descriptions=descriptions)
+
+
+def value_clustering(store, quantities, derivatives=False):
+    """
+    Collapse all states with the same magnitudes (and derivatives, if desired) of the given quantities (like
+    "container.volume") into a cluster.
+    """
+    encoding = store.encoding
+    slots = [encoding.slot_indices[quantity] for quantity in quantities]
+    abbreviations = quantity_abbreviations(encoding)
+    labels, clusters = [], {}
+
+    for code in store.codes:
+        values = encoding.values(code)
+        key = tuple(values[slot] if derivatives else values[slot][0] for slot in slots)
+        labels.append(clusters.setdefault(key, len(clusters)))
+
+    descriptions = [None] * len(clusters)
+    for key, cluster in clusters.items():
+        descriptions[cluster] = "\n".join(
+            "{}({})".format(abbreviations[slot], "M:{}, D:{}".format(*value) if derivatives else "M:{}".format(value))
+            for slot, value in zip(slots, key)
+        )
 
-    dot.render('img/{}_states'.format(graph_type), view=True)
+    return Clustering(labels=labels, descriptions=descriptions)
+
+
+def build_digraph(store, state_ids=None, clustering=None, highlight=(), title="State Graph"):
+    """
+    Build a graphviz Digraph of (a subgraph of) a GraphStore. Only the given state ids and the transitions between them
+    are included. States belonging to a cluster of the clustering are drawn as a single node, transitions between
+    clusters are merged and labeled with their number. Highlighted states are filled in a different color, just like
+    clusters containing any highlighted state.
+    """
+    encoding = store.encoding
+    abbreviations = quantity_abbreviations(encoding)
+    state_ids = range(store.num_states) if state_ids is None else state_ids
+    included = set(state_ids)
+    highlight = set(highlight)
+    labels = clustering.labels if clustering is not None else [None] * store.num_states
+
+    dot = _digraph(comment="State graph", format="png")
+    dot.attr(label=title, fontsize="20")
+
+    cluster_sizes = collections.Counter(labels[state_id] for state_id in state_ids if labels[state_id] is not None)
+    highlighted_clusters = {labels[state_id] for state_id in state_ids if state_id in highlight}
+    for state_id in state_ids:
+        if labels[state_id] is None:
+            dot.node(
+                _node_name(state_id, clustering), state_label(encoding, store.codes[state_id], abbreviations),
+                shape="box", fontsize="10", style="filled", fillcolor="#F2C57C" if state_id in highlight else "#DDDDDD"
+            )
+
+    for cluster, size in cluster_sizes.items():
+        dot.node(
+            "c{}".format(cluster), "{}\n({} states)".format(clustering.descriptions[cluster], size),
+            shape="box3d", fontsize="10", style="filled",
+            fillcolor="#F2C57C" if cluster in highlighted_clusters else "#B3CAEF"
+        )
+
+    edges = collections.Counter()
+    for state_id in state_ids:
+        for target in store.successors(state_id):
+            if target in included:
+                start, end = _node_name(state_id, clustering), _node_name(target, clustering)
+                if start != end:
+                    edges[start, end] += 1
+
+    for (start, end), count in edges.items():
+        dot.edge(start, end, label=str(count) if count > 1 else None)
+
+    return dot
+
+
+def _node_name(state_id, clustering):
+    if clustering is None or clustering.labels[state_id] is None:
+        return "s{}".format(state_id)
+    return "c{}".format(clustering.labels[state_id])
+
+
+def render_chunks(store, filename, chunk_size=250, workers=2, clustering=None, format="png"):
+    """
+    Render a large GraphStore as several images of at most chunk_size consecutive states each, in the background. Since
+    states are numbered in breadth-first order, chunks are neighbourhoods of the initial state in growing distance.
+    Transitions into other chunks point to a placeholder node per chunk. Returns a list of futures resolving to the
+    paths of the rendered files, in chunk order.
+    """
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)  # Layouts are computed by dot processes
+    futures = []
+
+    for chunk, start in enumerate(range(0, store.num_states, chunk_size)):
+        state_ids = range(start, min(start + chunk_size, store.num_states))
+        dot = build_digraph(store, state_ids, clustering=clustering, title="States {} - {}".format(
+            state_ids[0], state_ids[-1]
+        ))
+        dot.format = format
+
+        outgoing = {}  # Use dict as insertion-ordered set
+        for state_id in state_ids:
+            for target in store.successors(state_id):
+                if not start <= target < start + chunk_size:
+                    outgoing[_node_name(state_id, clustering), target // chunk_size] = None
+
+        for other_chunk in sorted({other_chunk for _, other_chunk in outgoing}):
+            dot.node("chunk{}".format(other_chunk), "Chunk {}".format(other_chunk), shape="plaintext")
+        for node, other_chunk in outgoing:
+            dot.edge(node, "chunk{}".format(other_chunk), style="dashed")
+
+        futures.append(executor.submit(dot.render, "{}_{:03d}".format(filename, chunk), cleanup=True))
+
+    executor.shutdown(wait=False)
+    return futures
+
+
+def visualize_state_graph(state_graph, graph_type, state_ids=None, clustering=None, view=True):
+    """
+    Render the state graph of a model, optionally only a subgraph of it (see neighborhood() and path_subgraph()) and
+    with clusters of states collapsed (see scc_clustering() and value_clustering()). State ids refer to the
+    graph_store() of the state graph.
+    """
+    dot = build_digraph(state_graph.graph_store(), state_ids=state_ids, clustering=clustering)
+    dot.render('img/{}_states'.format(graph_type), view=view)
 
 
 def visualize_causal_model(state_graph, graph_type, super_entity="Super"):
-    dot = Digraph(
+    dot = _digraph(
         comment='Causal model', format="png", graph_attr={"layout": "neato", "nodesep": "0.5", "ranksep": "0.5"}
     )
     entities = state_graph.entities
@@ -97,67 +290,6 @@ def visualize_causal_model(state_graph, graph_type, super_entity="Super"):
     dot.render('img/{}_causal'.format(graph_type), view=True)
 
 
-class StateGraphPrintingMixin:
-    """
-    Mixin that provides functions to print the transition and state table of a state graph.
-    """
-    def _print_transition_table(self, transitions):
-        # Not beautiful but still in the scope of this project
-        if len(self.initial_state.container.quantities) == 3:
-            print("\n{pad} Transitions found {pad}\n".format(pad="#" * 39))
-            print(
-                "\n{tspace}{tap:<4} | {cspace}{container:<16} | {drain} {relationship} {tap:>5}{tspace} | "
-                "{container:>16}{cspace} | {drain}".format(
-                    tap="tap", container="container", drain="drain", relationship=" "*12,
-                    tspace=" "*2, cspace=" "*8
-                )
-            )
-            print("{}+{}+{}{}{}+{}+{}".format("-"*7, "-"*26, "-"*7, " "*14, "-"*7, "-"*26, "-"*6))
-
-            for start in transitions:
-                for end in transitions[start]:
-                    print("{start} {pad}---->{pad} {end}".format(
-                        start=start.readable_id, end=end.readable_id, pad=" "*4
-                    ))
-
-        if len(self.initial_state.container.quantities) == 1:
-            print("\n{pad} Transitions found {pad}\n".format(pad="#" * 22))
-            print(
-                "\n{tspace}{tap:<4} | {cspace}{container} | {drain} {relationship} {tap:>7}{tspace} | "
-                "{container}{cspace} | {drain}".format(
-                    tap="tap", container="cont.", drain="drain", relationship=" "*12,
-                    tspace=" "*2, cspace=" "*1
-                )
-            )
-            print("{}+{}+{}{}{}+{}+{}".format("-" * 7, "-" * 8, "-" * 7, " " * 14, "-" * 9, "-" * 8, "-" * 6))
-
-            for start in transitions:
-                for end in transitions[start]:
-                    print("{start} {pad}---->{pad} {end}".format(
-                        start=start.readable_id, end=end.readable_id, pad=" "*5
-                    ))
-
-    def _print_state_table(self, states):
-        # Not beautiful but still in the scope of this project
-        if len(self.initial_state.container.quantities) == 3:
-            print("\n{pad} States found {pad}\n".format(pad="#"*14))
-            print("{tspace}{tap:<4} | {cspace}{container:<16} | {drain}".format(
-                    tap="tap", container="container", drain="drain", tspace=" "*2, cspace=" "*8
-                )
-            )
-            print("{}+{}+{}".format("-"*7, "-"*26, "-"*7))
-
-        if len(self.initial_state.container.quantities) == 1:
-            print("\n{pad} States found {pad}\n".format(pad="#" * 5))
-            print("{tspace}{tap:<4} | {cspace}{container} | {drain}".format(
-                tap="tap", container="cont.", drain="drain", tspace=" " * 2, cspace=" " * 1
-                )
-            )
-            print("{}+{}+{}".format("-" * 7, "-" * 8, "-" * 7))
-
-        for state in states.values():
-            print(state.readable_id)
-
 if __name__ == "__main__":
     from graph import init_extra_points_state_graph, init_minimum_viable_state_graph
     argparser = _init_argparser()
@@ -172,5 +304,18 @@ if __name__ == "__main__":
     elif args.graph == "extra":
         state_graph = init_extra_points_state_graph(args.verbosity)
 
-    visualize_state_graph(state_graph, graph_type=args.graph)
+    state_graph.envision()  # Print the envisionment according to the verbosity
+
+    clustering = None
+    if args.cluster == ["scc"]:
+        clustering = scc_clustering(state_graph.graph_store())
+    elif args.cluster is not None:
+        clustering = value_clustering(state_graph.graph_store(), args.cluster)
+
+    if args.chunk_size is not None:
+        for future in render_chunks(
+                state_graph.graph_store(), "img/{}_states".format(args.graph), args.chunk_size, clustering=clustering):
+            print("Rendered {}".format(future.result()))
+    else:
+        visualize_state_graph(state_graph, graph_type=args.graph, clustering=clustering)
 